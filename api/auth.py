@@ -5,45 +5,35 @@ import logging
 
 # Third-party imports
 from jose import JWTError, jwt  # For JWT token handling
-from passlib.context import CryptContext  # For password hashing
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer  # FastAPI's OAuth2 with Bearer token
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 # Local imports
-from .database import SessionLocal
+from .database import get_db, get_async_db  # get_db is re-exported for routers that import it from here
 from .models import User
+from .services.password_hashing import pwd_context, hashing_pool  # bcrypt context and its worker pool
+from .services.principal_cache import principal_cache
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key-keep-it-secret"  # In production, move this to environment variables
 ALGORITHM = "HS256"  # HMAC with SHA-256 hash algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = 3000  # Token expiration time in minutes
 
-# Password hashing configuration using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 configuration with Bearer token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 # Set up logging for authentication operations
 logger = logging.getLogger(__name__)
 
-def get_db():
-    """Database dependency injection.
-    
-    Creates a new database session for each request and ensures it's closed after use.
-    Yields:
-        Session: SQLAlchemy database session
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password.
     
+    This blocks for the whole bcrypt computation; request handlers use
+    hashing_pool instead.
+    
     Args:
         plain_password (str): The password in plain text
         hashed_password (str): The hashed password to compare against
@@ -56,6 +46,9 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     """Generate a password hash using bcrypt.
     
+    This blocks for the whole bcrypt computation; request handlers use
+    hashing_pool instead.
+    
     Args:
         password (str): Plain text password to hash
     
@@ -64,40 +57,90 @@ def get_password_hash(password: str) -> str:
     """
     return pwd_context.hash(password)
 
-def get_user(db: Session, username: str) -> Optional[User]:
+async def get_user(db: AsyncSession, username: str) -> Optional[User]:
     """Retrieve a user from the database by username.
     
+    The real card and card memberships are loaded eagerly, since handlers
+    read them and async sessions cannot load them lazily.
+    
     Args:
-        db (Session): Database session
+        db (AsyncSession): Database session
         username (str): Username to look up
     
     Returns:
         Optional[User]: User object if found, None otherwise
     """
     logger.debug(f"Fetching user {username} from database")
-    return db.query(User).filter(User.username == username).first()
+    result = await db.execute(
+        select(User)
+        .options(selectinload(User.real_card), selectinload(User.card_memberships))
+        .filter(User.username == username)
+    )
+    return result.scalars().first()
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Retrieve a user from the database by ID, loading the same relationships as get_user.
+    
+    Args:
+        db (AsyncSession): Database session
+        user_id (int): ID to look up
+    
+    Returns:
+        Optional[User]: User object if found, None otherwise
+    """
+    result = await db.execute(
+        select(User)
+        .options(selectinload(User.real_card), selectinload(User.card_memberships))
+        .filter(User.id == user_id)
+    )
+    return result.scalars().first()
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """Authenticate a user by username and password.
     
+    The password is checked in the hashing pool. A hash made with an outdated
+    bcrypt cost is replaced with one at the current cost.
+    
     Args:
-        db (Session): Database session
+        db (AsyncSession): Database session
         username (str): Username to authenticate
         password (str): Password to verify
     
     Returns:
         Optional[User]: Authenticated user object if successful, None otherwise
+    
+    Raises:
+        HashingPoolBusy: If the hashing pool is saturated
     """
     logger.debug(f"Authenticating user {username}")
-    user = get_user(db, username)
+    user = await get_user(db, username)
     if not user:
         logger.warning(f"User {username} not found")
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await hashing_pool.verify_and_update(password, user.hashed_password)
+    if not verified:
         logger.warning(f"Password verification failed for user {username}")
         return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        logger.info(f"Rehashed password for user {username} at the current bcrypt cost")
     return user
 
+def token_claims(user: User) -> dict:
+    """Claims identifying `user` in an access token.
+    
+    `uid` and `ver` let get_current_user serve the request from the principal
+    cache; bumping the user's token_version revokes every token issued before.
+    
+    Args:
+        user (User): User the token is issued to
+    
+    Returns:
+        dict: Payload data for create_access_token
+    """
+    return {"sub": user.username, "uid": user.id, "ver": user.token_version}
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a new JWT access token.
     
@@ -118,12 +161,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     logger.debug(f"Access token created for {data.get('sub')}")
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> User:
     """FastAPI dependency that validates JWT token and returns current user.
     
+    Tokens carrying `uid` and `ver` claims are resolved from the principal
+    cache when possible, and otherwise loaded by ID and rejected if the
+    user's token version has moved on. Older tokens are looked up by username
+    and, lacking `ver`, are only accepted while the token version is still 0.
+    
     Args:
         token (str): JWT token from request (injected by FastAPI)
-        db (Session): Database session (injected by FastAPI)
+        db (AsyncSession): Database session (injected by FastAPI)
     
     Returns:
         User: Current authenticated user
@@ -146,10 +194,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         logger.error("JWT decoding failed")
         raise credentials_exception
     
-    user = get_user(db, username)
-    if user is None:
-        logger.error(f"User {username} not found after token decoding")
+    # Tokens issued before token versions existed count as version 0
+    user_id, token_version = payload.get("uid"), payload.get("ver", 0)
+    if user_id is None:
+        user = await get_user(db, username)
+        if user is None or user.token_version != token_version:
+            logger.error(f"User {username} not found or token revoked after token decoding")
+            raise credentials_exception
+        return user
+    
+    user = principal_cache.get(user_id, token_version)
+    if user is not None:
+        return user
+    user = await get_user_by_id(db, user_id)
+    if user is None or user.token_version != token_version:
+        logger.error(f"User {user_id} not found or token revoked after token decoding")
         raise credentials_exception
+    principal_cache.put(user)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -13,10 +13,56 @@ class Settings(BaseSettings):
     TESTING: bool = ENV == "testing"
     
     # Database Configuration
-    DATABASE_URL: str = "sqlite:///./sql_app.db"
+    DATABASE_URL: str = "sqlite:///./sql_app.db"  # postgresql:// URLs are served by psycopg 3
+    DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.environ.get("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+    SQLITE_JOURNAL_MODE: str = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    PG_PREPARE_THRESHOLD: int = int(os.environ.get("PG_PREPARE_THRESHOLD", "5"))  # Executions before psycopg prepares server-side
+    PG_STATEMENT_CACHE_SIZE: int = int(os.environ.get("PG_STATEMENT_CACHE_SIZE", "100"))  # asyncpg prepared statements per connection
     
+    # Statement parse cache
+    PARSE_CACHE_MAX_ENTRIES: int = int(os.environ.get("PARSE_CACHE_MAX_ENTRIES", "128"))
+    PARSE_CACHE_DIR: str = os.environ.get("PARSE_CACHE_DIR", "")  # Empty disables the on-disk tier
+    STREAMING_PARSE_THRESHOLD_BYTES: int = int(os.environ.get("STREAMING_PARSE_THRESHOLD_BYTES", str(20 * 1024 * 1024)))
+    MERCHANT_CACHE_MAX_DESCRIPTIONS: int = int(os.environ.get("MERCHANT_CACHE_MAX_DESCRIPTIONS", "100000"))  # Normalized descriptions remembered
+    UPLOAD_CHUNK_SIZE: int = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    BLOB_STORE_DIR: str = os.environ.get("BLOB_STORE_DIR", "")  # Empty keeps statement blobs under api/uploads/blobs
+    STATEMENT_INGEST_BATCH_ROWS: int = int(os.environ.get("STATEMENT_INGEST_BATCH_ROWS", "5000"))  # Transactions per INSERT
+    STATEMENT_COLUMN_CACHE_DIR: str = os.environ.get("STATEMENT_COLUMN_CACHE_DIR", "")  # Empty keeps parsed columns under api/uploads/columns
+    STATEMENT_COLUMN_CACHE_MAX_BYTES: int = int(os.environ.get("STATEMENT_COLUMN_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    STATEMENT_PARSE_WORKERS: int = int(os.environ.get("STATEMENT_PARSE_WORKERS", str(os.cpu_count() or 1)))  # Processes for batch uploads; 0 parses in the job's thread
+    BATCH_UPLOAD_MAX_FILES: int = int(os.environ.get("BATCH_UPLOAD_MAX_FILES", "48"))  # Statements per batch upload, zip members included
+    BATCH_UPLOAD_MAX_MEMBER_BYTES: int = int(os.environ.get("BATCH_UPLOAD_MAX_MEMBER_BYTES", str(100 * 1024 * 1024)))  # Uncompressed size of one zip member
+    BATCH_UPLOAD_MAX_ARCHIVE_BYTES: int = int(os.environ.get("BATCH_UPLOAD_MAX_ARCHIVE_BYTES", str(512 * 1024 * 1024)))  # Uncompressed size of a zip's statements
+    
+    # Background jobs
+    JOB_WORKERS: int = int(os.environ.get("JOB_WORKERS", "2"))
+    JOB_QUEUE_MAX_PENDING: int = int(os.environ.get("JOB_QUEUE_MAX_PENDING", "32"))
+    JOB_MAX_ATTEMPTS: int = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))  # Runs, restarts included, before a job is marked failed
+    
+    # Split payments for group card authorizations
+    SPLIT_PAYMENT_WORKERS: int = int(os.environ.get("SPLIT_PAYMENT_WORKERS", "8"))  # Concurrent Stripe charges
+    SPLIT_PAYMENT_MAX_ATTEMPTS: int = int(os.environ.get("SPLIT_PAYMENT_MAX_ATTEMPTS", "5"))
+    SPLIT_PAYMENT_RETRY_SECONDS: float = float(os.environ.get("SPLIT_PAYMENT_RETRY_SECONDS", "2"))  # Doubles after each failed attempt
+    
+    # Webhook inbox
+    WEBHOOK_WORKERS: int = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+    WEBHOOK_RETRY_SECONDS: float = float(os.environ.get("WEBHOOK_RETRY_SECONDS", "1"))  # Doubles after each failed attempt
+
     # Security
     SECRET_KEY: str = os.environ.get("SECRET_KEY", "dev-key-please-change")
+    BCRYPT_ROUNDS: int = int(os.environ.get("BCRYPT_ROUNDS", "12"))  # Hashes with other costs are rehashed on login
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))  # Processes; 0 hashes on the event loop
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))  # Calls waiting or running before rejecting
+    PRINCIPAL_CACHE_TTL_SECONDS: int = int(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "60"))  # 0 disables the cache
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = int(os.environ.get("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
     
     # Logging Configuration
     LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
@@ -27,6 +73,21 @@ class Settings(BaseSettings):
     STRIPE_SECRET_KEY: str = os.environ.get("STRIPE_SECRET_KEY", "")
     STRIPE_WEBHOOK_SECRET: str = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
     STRIPE_API_KEY: str = os.getenv("STRIPE_API_KEY")
+    STRIPE_WEBHOOK_TOLERANCE_SECONDS: int = int(os.environ.get("STRIPE_WEBHOOK_TOLERANCE_SECONDS", "300"))
+    STRIPE_TIMEOUT_SECONDS: float = float(os.environ.get("STRIPE_TIMEOUT_SECONDS", "10"))  # Endpoints without their own timeout
+    STRIPE_MAX_RETRIES: int = int(os.environ.get("STRIPE_MAX_RETRIES", "2"))
+    STRIPE_RETRY_BASE_SECONDS: float = float(os.environ.get("STRIPE_RETRY_BASE_SECONDS", "0.5"))  # Doubles after each retry, jittered
+    STRIPE_MAX_CONNECTIONS: int = int(os.environ.get("STRIPE_MAX_CONNECTIONS", "20"))  # Pooled keep-alive connections
+    STRIPE_BREAKER_THRESHOLD: int = int(os.environ.get("STRIPE_BREAKER_THRESHOLD", "5"))  # Consecutive failures before failing fast
+    STRIPE_BREAKER_RESET_SECONDS: float = float(os.environ.get("STRIPE_BREAKER_RESET_SECONDS", "30"))
+    
+    # Issuing authorization decisions
+    AUTHORIZATION_APPROVAL_LIMIT: int = int(os.environ.get("AUTHORIZATION_APPROVAL_LIMIT", "10000000000000"))  # Smallest currency unit
+    AUTHORIZATION_POLICY_TTL_SECONDS: int = int(os.environ.get("AUTHORIZATION_POLICY_TTL_SECONDS", "300"))
+    
+    # Virtual card numbers and CVCs, cached encrypted in memory
+    CARD_DETAILS_CACHE_TTL_SECONDS: int = int(os.environ.get("CARD_DETAILS_CACHE_TTL_SECONDS", "120"))  # 0 disables the cache
+    CARD_DETAILS_CACHE_MAX_ENTRIES: int = int(os.environ.get("CARD_DETAILS_CACHE_MAX_ENTRIES", "10000"))
     
     # Test Cardholder Configuration
     TEST_CARDHOLDER_ID: str = os.environ.get("TEST_CARDHOLDER_ID", "")
@@ -39,6 +100,57 @@ class Settings(BaseSettings):
     TEST_CARDHOLDER_POSTAL: str = os.environ.get("TEST_CARDHOLDER_POSTAL", "A86D586")
     TEST_CARDHOLDER_COUNTRY: str = os.environ.get("TEST_CARDHOLDER_COUNTRY", "IE")
     
+    @property
+    def is_sqlite(self) -> bool:
+        return self.DATABASE_URL.startswith("sqlite")
+
+    def database_url(self) -> str:
+        """DATABASE_URL with bare postgres schemes pointed at the psycopg 3 driver."""
+        for prefix in ("postgresql://", "postgres://"):
+            if self.DATABASE_URL.startswith(prefix):
+                return "postgresql+psycopg://" + self.DATABASE_URL[len(prefix):]
+        return self.DATABASE_URL
+
+    def async_database_url(self) -> str:
+        """DATABASE_URL for the async engine: aiosqlite for SQLite, asyncpg for Postgres."""
+        url = self.database_url()
+        if url.startswith("sqlite://"):
+            return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+        if url.startswith("postgresql+psycopg://"):
+            return "postgresql+asyncpg://" + url[len("postgresql+psycopg://"):]
+        return url
+
+    def engine_options(self, use_async: bool = False) -> dict:
+        """Keyword arguments for `create_engine` (or `create_async_engine`) for the configured database."""
+        url = self.async_database_url() if use_async else self.database_url()
+        if self.is_sqlite:
+            options = {"connect_args": {"check_same_thread": False}}
+            if ":memory:" in url or url.endswith(":///") or url.endswith("://"):
+                return options  # In-memory databases live in a single connection
+        elif url.startswith("postgresql+psycopg"):
+            options = {"connect_args": {"prepare_threshold": self.PG_PREPARE_THRESHOLD}}
+        elif url.startswith("postgresql+asyncpg"):
+            options = {"connect_args": {"prepared_statement_cache_size": self.PG_STATEMENT_CACHE_SIZE}}
+        else:
+            options = {}
+        options.update(
+            pool_size=self.DB_POOL_SIZE,
+            max_overflow=self.DB_MAX_OVERFLOW,
+            pool_timeout=self.DB_POOL_TIMEOUT,
+            pool_recycle=self.DB_POOL_RECYCLE,
+            pool_pre_ping=self.DB_POOL_PRE_PING,
+        )
+        return options
+
+    def sqlite_pragmas(self) -> dict:
+        """PRAGMAs applied to every new SQLite connection."""
+        return {
+            "journal_mode": self.SQLITE_JOURNAL_MODE,
+            "synchronous": self.SQLITE_SYNCHRONOUS,
+            "mmap_size": self.SQLITE_MMAP_SIZE,
+            "busy_timeout": self.SQLITE_BUSY_TIMEOUT_MS,
+        }
+
     class Config:
         env_file = "/home/surtr/Team-3/api/.env"
         env_file_encoding = "utf-8"
@@ -3,24 +3,75 @@ import logging
 # Set up logging
 logger = logging.getLogger(__name__)
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from api.config import get_settings
+from api.config import get_settings, Settings
 # Import models to ensure they are registered with SQLAlchemy
 from api.models import user, group, virtual_card, card_member, uploaded_file
 
 settings = get_settings()
 
-engine = create_engine(
-    settings.DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _apply_sqlite_pragmas(engine, settings: Settings):
+    pragmas = settings.sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def create_database_engine(settings: Settings):
+    """Create the engine described by the database profile in Settings.
+
+    Pool sizing, recycling and pre-ping apply to every backend. SQLite
+    connections get the configured PRAGMAs (WAL, synchronous, mmap and busy
+    timeout) so concurrent writers wait instead of failing with "database is
+    locked"; Postgres goes through psycopg 3 with server-side prepared
+    statements.
+    """
+    engine = create_engine(settings.database_url(), **settings.engine_options())
+    if settings.is_sqlite:
+        _apply_sqlite_pragmas(engine, settings)
+    return engine
+
+def create_async_database_engine(settings: Settings):
+    """Async counterpart of create_database_engine, using aiosqlite or asyncpg."""
+    engine = create_async_engine(settings.async_database_url(), **settings.engine_options(use_async=True))
+    if settings.is_sqlite:
+        _apply_sqlite_pragmas(engine.sync_engine, settings)
+    return engine
+
+engine = create_database_engine(settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_database_engine(settings)
+# Objects stay usable after commit, since async sessions cannot lazily reload them
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 logger.info("Database engine created")
 
 # Dependency to get a database session
 def get_db():
+    """Database dependency injection.
+    
+    Creates a new database session for each request and ensures it's closed after use.
+    Yields:
+        Session: SQLAlchemy database session
+    """
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Async database dependency injection.
+
+    Yields an AsyncSession for the request and closes it afterwards. Routes
+    using it must load relationships explicitly (e.g. with selectinload),
+    because lazy loading is not available on async sessions.
+    Yields:
+        AsyncSession: SQLAlchemy async database session
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -2,8 +2,16 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import api.database as database 
 from .models.base import Base
+from .migrations import run_migrations
 from .config import get_settings, setup_logging
-from .routes import file_router, card_router, subscription_router, auth_router, webhook_routes, group_routes, real_card_routes, user_router
+from .routes import file_router, card_router, subscription_router, auth_router, webhook_routes, group_routes, real_card_routes, user_router, job_router, metrics_router
+from .services.job_queue import job_queue
+from .services.authorization import authorization_policies
+from .services.split_payments import split_payments
+from .services.password_hashing import hashing_pool
+from .services.statement_pool import statement_parse_pool
+from .services.stripe_gateway import stripe_gateway
+from .services.webhook_handlers import webhook_inbox
 from .routes.group_ratio_routes import router as group_ratio_router  # Import the group ratio router
 from .routes.ai_routes import router as ai_router  # Import the ai_router
 import logging
@@ -12,8 +20,9 @@ import logging
 settings = get_settings()
 setup_logging()  # This sets up logging as per the configuration in logging_config.py
 
-# Create database tables
+# Create database tables, then bring existing databases up to the current schema
 Base.metadata.create_all(bind=database.engine)
+run_migrations(database.engine)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -49,6 +58,56 @@ app.include_router(real_card_routes.router)
 app.include_router(user_router)
 app.include_router(ai_router)  # Include the ai_router
 app.include_router(group_ratio_router)  # Include the group ratio router
+app.include_router(job_router)
+app.include_router(metrics_router)
+
+@app.on_event("startup")
+def start_job_queue():
+    # Resumes jobs left queued or running by a previous process
+    job_queue.start()
+
+@app.on_event("startup")
+def warm_authorization_policies():
+    # Authorization requests are decided from memory, so load every card up front
+    db = database.SessionLocal()
+    try:
+        authorization_policies.warm(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def resume_split_payments():
+    # Charges left pending by a previous process are retried with the same idempotency keys
+    split_payments.start()
+
+@app.on_event("startup")
+def resume_webhook_events():
+    # Events stored but not handled before a restart are handled in their original order
+    webhook_inbox.start()
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    job_queue.shutdown()
+
+@app.on_event("shutdown")
+def stop_webhook_inbox():
+    webhook_inbox.shutdown()
+
+@app.on_event("shutdown")
+def stop_split_payments():
+    split_payments.shutdown()
+
+@app.on_event("shutdown")
+def stop_hashing_pool():
+    hashing_pool.shutdown()
+
+@app.on_event("shutdown")
+def stop_statement_parse_pool():
+    statement_parse_pool.shutdown()
+
+@app.on_event("shutdown")
+async def close_stripe_gateway():
+    await stripe_gateway.close()
 
 # Example of logging usage in main.py
 logger = logging.getLogger(__name__)
@@ -0,0 +1,4 @@
+from .runner import run_migrations, current_version
+from .versions import MIGRATIONS
+
+__all__ = ['run_migrations', 'current_version', 'MIGRATIONS']
@@ -0,0 +1,66 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping table recording which migration versions have been applied
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+def create_index_if_missing(connection, index):
+    """Create a model-declared Index unless the table already has it.
+
+    Indexes over columns the table does not have yet are skipped; the
+    migration adding those columns creates them.
+    """
+    inspector = inspect(connection)
+    existing = {ix['name'] for ix in inspector.get_indexes(index.table.name)}
+    columns = {column['name'] for column in inspector.get_columns(index.table.name)}
+    if index.name not in existing and all(column.name in columns for column in index.columns):
+        logger.info(f"Creating index {index.name}")
+        index.create(bind=connection)
+
+def add_column_if_missing(connection, table_name, column_name, ddl):
+    """Add a column with `ALTER TABLE ... ADD COLUMN <ddl>` unless it already exists."""
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    if column_name not in existing:
+        logger.info(f"Adding column {table_name}.{column_name}")
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+
+def current_version(connection) -> int:
+    _metadata.create_all(bind=connection)
+    return connection.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+def run_migrations(engine, migrations=None):
+    """Apply every migration newer than the database's recorded version.
+
+    Runs after `Base.metadata.create_all`, so a fresh database already has the
+    current schema and each migration only has to bring older databases up to
+    date. Migrations must therefore be no-ops when their change is present.
+    Each one runs in its own transaction together with its version record.
+    """
+    if migrations is None:
+        from .versions import MIGRATIONS as migrations
+
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+    for migration_version, description, upgrade in migrations:
+        if migration_version <= version:
+            continue
+        with engine.begin() as connection:
+            logger.info(f"Applying migration {migration_version}: {description}")
+            upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=migration_version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+    logger.info(f"Database schema at version {max([version] + [m[0] for m in migrations])}")
@@ -0,0 +1,115 @@
+"""Ordered schema migrations as (version, description, upgrade) tuples.
+
+Append new migrations with the next version number; never edit or reorder
+ones that have shipped.
+"""
+from collections import defaultdict
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from api.models import CardMember, GroupInvitation, StatementTransaction, Subscription, UploadedFile
+from api.services.blob_store import blob_store
+from api.services.money import TOTAL_BASIS_POINTS, allocate, percent_to_bps, to_minor
+from .runner import add_column_if_missing, create_index_if_missing
+
+def _add_hot_path_indexes(connection):
+    for model in (Subscription, GroupInvitation, CardMember, UploadedFile):
+        for index in model.__table__.indexes:
+            create_index_if_missing(connection, index)
+
+def _add_user_token_version(connection):
+    add_column_if_missing(connection, "users", "token_version", "token_version INTEGER NOT NULL DEFAULT 0")
+
+def _add_group_virtual_card_status(connection):
+    add_column_if_missing(connection, "groups", "virtual_card_status", "virtual_card_status VARCHAR(20)")
+
+def _add_group_provisioning(connection):
+    # Groups created before provisioning moved to a background job already have their card
+    add_column_if_missing(connection, "groups", "provisioning_status",
+                          "provisioning_status VARCHAR(20) NOT NULL DEFAULT 'active'")
+    add_column_if_missing(connection, "groups", "provisioning_error", "provisioning_error TEXT")
+
+def _add_integer_money(connection):
+    add_column_if_missing(connection, "subscriptions", "amount_minor", "amount_minor INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(connection, "group_member_ratios", "ratio_bps", "ratio_bps INTEGER NOT NULL DEFAULT 0")
+
+    # Converted in Python with decimal rounding; SQL ROUND on the floats turns 0.285 into 28 cents
+    subscriptions = [
+        {"id": id, "amount_minor": to_minor(amount)}
+        for id, amount in connection.execute(text("SELECT id, amount FROM subscriptions"))
+    ]
+    if subscriptions:
+        connection.execute(text("UPDATE subscriptions SET amount_minor = :amount_minor WHERE id = :id"), subscriptions)
+
+    # Each group's percentages become basis points summing to exactly 10000
+    groups = defaultdict(list)
+    for id, group_id, percentage in connection.execute(
+        text("SELECT id, group_id, ratio_percentage FROM group_member_ratios ORDER BY group_id, id")
+    ):
+        groups[group_id].append((id, max(percent_to_bps(percentage), 0)))
+    ratios = []
+    for rows in groups.values():
+        weights = [weight for _, weight in rows]
+        shares = allocate(TOTAL_BASIS_POINTS, weights) if sum(weights) else [0] * len(rows)
+        ratios.extend({"id": id, "ratio_bps": bps} for (id, _), bps in zip(rows, shares))
+    if ratios:
+        connection.execute(text("UPDATE group_member_ratios SET ratio_bps = :ratio_bps WHERE id = :id"), ratios)
+
+    # Lookups moved from the float amount to amount_minor
+    connection.execute(text("DROP INDEX IF EXISTS ix_subscriptions_user_description_amount"))
+    for index in Subscription.__table__.indexes:
+        create_index_if_missing(connection, index)
+
+def _move_uploads_to_blob_store(connection):
+    add_column_if_missing(connection, "uploaded_files", "content_sha256", "content_sha256 VARCHAR(64)")
+
+    # One file at a time, so only a single statement is held in memory
+    ids = connection.execute(text(
+        "SELECT id FROM uploaded_files WHERE content_sha256 IS NULL AND length(file_content) > 0"
+    )).scalars().all()
+    for id in ids:
+        content = connection.execute(text("SELECT file_content FROM uploaded_files WHERE id = :id"), {"id": id}).scalar()
+        connection.execute(
+            text("UPDATE uploaded_files SET content_sha256 = :digest, file_content = :empty WHERE id = :id"),
+            {"id": id, "digest": blob_store.put_bytes(content), "empty": b""}
+        )
+
+def _add_transaction_merchants(connection):
+    # Filled in per user by the first detection run, which finds no recurrence state for them
+    add_column_if_missing(connection, "statement_transactions", "merchant", "merchant VARCHAR")
+    for index in StatementTransaction.__table__.indexes:
+        create_index_if_missing(connection, index)
+
+def _add_transaction_detected(connection):
+    # Rows stored before are all unseen, so each user's merchants are re-detected once
+    add_column_if_missing(connection, "statement_transactions", "detected", "detected BOOLEAN NOT NULL DEFAULT FALSE")
+    connection.execute(text("DROP INDEX IF EXISTS ix_statement_transactions_user_id_id"))
+    for index in StatementTransaction.__table__.indexes:
+        create_index_if_missing(connection, index)
+
+def _add_transaction_file_index(connection):
+    for index in StatementTransaction.__table__.indexes:
+        create_index_if_missing(connection, index)
+
+def _add_group_provisioning_ids(connection):
+    add_column_if_missing(connection, "groups", "provisioning_id", "provisioning_id VARCHAR(36)")
+    ids = connection.execute(text("SELECT id FROM groups WHERE provisioning_id IS NULL")).scalars().all()
+    if ids:
+        connection.execute(
+            text("UPDATE groups SET provisioning_id = :provisioning_id WHERE id = :id"),
+            [{"id": id, "provisioning_id": str(uuid4())} for id in ids]
+        )
+
+MIGRATIONS = [
+    (1, "Composite indexes for hot query predicates", _add_hot_path_indexes),
+    (2, "Token version on users for revoking access tokens", _add_user_token_version),
+    (3, "Virtual card status on groups", _add_group_virtual_card_status),
+    (4, "Provisioning state on groups", _add_group_provisioning),
+    (5, "Integer minor units and basis points for money", _add_integer_money),
+    (6, "Uploaded statement contents moved to the blob store", _move_uploads_to_blob_store),
+    (7, "Merchant names on statement rows for incremental detection", _add_transaction_merchants),
+    (8, "Detected flag on statement rows replacing the detection watermark", _add_transaction_detected),
+    (9, "Index on the statement each row was stored from", _add_transaction_file_index),
+    (10, "Provisioning IDs on groups for Stripe idempotency keys", _add_group_provisioning_ids),
+]
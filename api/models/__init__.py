@@ -7,3 +7,10 @@ from .real_card import RealCard
 from .group_invitation import GroupInvitation
 from .subscription import Subscription
 from .group_member_ratio import GroupMemberRatio
+from .job import Job
+from .payment import Payment
+from .webhook_event import WebhookEvent
+from .subscription_charge import SubscriptionCharge
+from .monthly_spend import MonthlySpend
+from .statement_transaction import StatementTransaction
+from .merchant_recurrence import MerchantRecurrence
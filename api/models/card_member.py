@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -10,4 +10,10 @@ class CardMember(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
 
     virtual_card = relationship("VirtualCard", back_populates="card_members")
-    user = relationship("User", back_populates="card_memberships") 
\ No newline at end of file
+    user = relationship("User", back_populates="card_memberships")
+
+    __table_args__ = (
+        Index('ix_card_members_card_user', 'card_id', 'user_id'),
+        # "My groups" joins from the member side
+        Index('ix_card_members_user_id', 'user_id'),
+    )
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from uuid import uuid4
+
+from sqlalchemy import Column, Integer, String, Text, ForeignKey
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -14,6 +16,12 @@ class Group(Base):
     virtual_card_last4 = Column(String(4))
     virtual_card_exp_month = Column(Integer)
     virtual_card_exp_year = Column(Integer)
+    virtual_card_status = Column(String(20))
+    # pending -> cardholder_ready -> active, or failed; set by the provision_group job
+    provisioning_status = Column(String(20), nullable=False, default='active', server_default='active')
+    provisioning_error = Column(Text)
+    # Scopes the Stripe idempotency keys of this group's provisioning
+    provisioning_id = Column(String(36), default=lambda: str(uuid4()))
 
     admin = relationship("User", back_populates="groups")
     virtual_card = relationship("VirtualCard", uselist=False, back_populates="group")
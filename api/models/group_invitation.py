@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -16,3 +16,8 @@ class GroupInvitation(Base):
     group = relationship("Group", backref="invitations")
     inviter = relationship("User", foreign_keys=[inviter_id], backref="sent_invitations")
     invitee = relationship("User", foreign_keys=[invitee_id], backref="received_invitations")
+
+    __table_args__ = (
+        # Pending-invitation and membership checks filter on all three
+        Index('ix_group_invitations_group_invitee_accepted', 'group_id', 'invitee_id', 'accepted'),
+    )
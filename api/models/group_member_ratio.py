@@ -8,13 +8,15 @@ class GroupMemberRatio(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     group_id = Column(Integer, ForeignKey('groups.id'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    ratio_percentage = Column(Float, nullable=False)  # Stored as decimal (e.g., 25.5 for 25.5%)
+    ratio_bps = Column(Integer, nullable=False)  # Basis points, 10000 for the whole (e.g., 2550 for 25.5%)
+    ratio_percentage = Column(Float, nullable=False)  # Mirrored from ratio_bps for older readers
 
     # Relationships
     group = relationship("Group", backref="member_ratios")
     user = relationship("User", backref="group_ratios")
 
-    # Ensure a user can only have one ratio entry per group
+    # Ensure a user can only have one ratio entry per group. Its index also
+    # serves lookups by group_id alone, so no separate index is declared.
     __table_args__ = (
         UniqueConstraint('group_id', 'user_id', name='unique_group_member_ratio'),
     )
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+from .base import Base
+from datetime import datetime
+
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id = Column(String(36), primary_key=True)  # UUID handed back to the client
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='queued')  # queued, running, succeeded or failed
+    progress = Column(Integer, nullable=False, default=0)  # Percent complete
+    attempts = Column(Integer, nullable=False, default=0)
+    payload = Column(Text, nullable=True)  # JSON arguments for the job handler
+    result = Column(Text, nullable=True)  # JSON result once succeeded
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Foreign key to the user who submitted this job
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Relationship to the user
+    user = relationship("User")
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, UniqueConstraint
+from .base import Base
+
+# Subscriptions detected in one merchant's stored charges, kept so a new statement re-detects only the merchants it touches
+class MerchantRecurrence(Base):
+    __tablename__ = 'merchant_recurrences'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'merchant', name='uq_merchant_recurrence_user_merchant'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    merchant = Column(String, nullable=False)  # Canonical merchant name, as on statement_transactions
+    subscriptions = Column(Text, nullable=False)  # JSON list in the parser's result shape; empty when nothing recurs
+    last_transaction_id = Column(Integer, nullable=False)  # Newest statement row the detection run had seen
+    detector_version = Column(Integer, nullable=False)
+
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, UniqueConstraint
+from .base import Base
+
+# Subscription spend per user, merchant and month, rolled up from subscription_charges
+class MonthlySpend(Base):
+    __tablename__ = 'monthly_spend'
+    __table_args__ = (
+        # Month before merchant so ranges of months are read from the index for any merchant
+        UniqueConstraint('user_id', 'month', 'merchant', name='uq_monthly_spend_user_month_merchant'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(Date, nullable=False)  # First day of the month
+    merchant = Column(String, nullable=False)
+    description = Column(String, nullable=False)  # A statement description of the merchant, for display
+    total_minor = Column(Integer, nullable=False)  # Smallest currency unit (e.g. cents)
+    charges = Column(Integer, nullable=False)
+
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
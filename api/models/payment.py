@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy.orm import relationship
+from .base import Base
+from datetime import datetime
+
+class Payment(Base):
+    __tablename__ = 'payments'
+    __table_args__ = (
+        # One leg per member per authorization, however often the webhook is delivered
+        UniqueConstraint('authorization_id', 'user_id', name='uq_payment_authorization_user'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    authorization_id = Column(String, nullable=False, index=True)  # Stripe issuing authorization being split
+    amount = Column(Integer, nullable=False)  # Smallest currency unit (e.g. cents)
+    currency = Column(String(3), nullable=False)
+    idempotency_key = Column(String, nullable=False, unique=True)  # Sent to Stripe with every attempt
+    status = Column(String, nullable=False, default='pending')  # pending, succeeded or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    payment_intent_id = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Foreign keys to the member charged and the group whose card was used
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    group_id = Column(Integer, ForeignKey('groups.id'), nullable=True)
+    # Relationship to the member charged
+    user = relationship("User")
@@ -0,0 +1,30 @@
+from sqlalchemy import Boolean, Column, Integer, String, Date, ForeignKey, Index, UniqueConstraint, false
+from .base import Base
+
+class StatementTransaction(Base):
+    __tablename__ = 'statement_transactions'
+    __table_args__ = (
+        # A row seen again in an overlapping or re-uploaded statement is stored once
+        UniqueConstraint('user_id', 'fingerprint', name='uq_statement_transaction_fingerprint'),
+        # A user's ledger in date order
+        Index('ix_statement_transactions_user_posted_on', 'user_id', 'posted_on'),
+        # One merchant's charges in date order
+        Index('ix_statement_transactions_user_merchant_posted_on', 'user_id', 'merchant', 'posted_on'),
+        # Rows no detection run has seen yet
+        Index('ix_statement_transactions_user_detected', 'user_id', 'detected'),
+        # The rows stored from one statement
+        Index('ix_statement_transactions_file_id', 'file_id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the raw row and its occurrence that day
+    posted_on = Column(Date, nullable=False)
+    description = Column(String, nullable=False)  # Card-terminal suffix stripped, as the parser groups by
+    merchant = Column(String, nullable=True)  # Canonical merchant name of the description; detection state is kept per merchant
+    amount_minor = Column(Integer, nullable=False)  # Money out in the smallest currency unit; money in is negative
+    balance_minor = Column(Integer, nullable=True)
+    detected = Column(Boolean, nullable=False, default=False, server_default=false())  # Set once a detection run has seen the row
+
+    # Foreign keys to the account holder and the statement the row was first stored from
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    file_id = Column(Integer, ForeignKey('uploaded_files.id'), nullable=False)
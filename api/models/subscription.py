@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 from datetime import datetime
@@ -8,7 +8,8 @@ class Subscription(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     description = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount_minor = Column(Integer, nullable=False)  # Smallest currency unit (e.g. cents)
+    amount = Column(Float, nullable=False)  # Major units, mirrored from amount_minor for older readers
     date = Column(Date, nullable=False)
     estimated_next_date = Column(Date, nullable=True)
     
@@ -26,3 +27,9 @@ class Subscription(Base):
     group_id = Column(Integer, ForeignKey('groups.id'), nullable=True)
     # Relationship to the group
     group = relationship("Group", back_populates="subscriptions")
+
+    __table_args__ = (
+        # get_or_create / bulk upsert look subscriptions up by this key
+        Index('ix_subscriptions_user_description_amount_minor', 'user_id', 'description', 'amount_minor'),
+        Index('ix_subscriptions_group_id', 'group_id'),
+    )
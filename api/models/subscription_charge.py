@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Index, UniqueConstraint
+from .base import Base
+
+class SubscriptionCharge(Base):
+    __tablename__ = 'subscription_charges'
+    __table_args__ = (
+        # A charge found in overlapping statements is stored once; also serves lookups by merchant and date
+        UniqueConstraint('user_id', 'merchant', 'charged_on', 'amount_minor', name='uq_subscription_charge'),
+        # Charges in a date window
+        Index('ix_subscription_charges_user_charged_on', 'user_id', 'charged_on'),
+        Index('ix_subscription_charges_file_id', 'file_id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    merchant = Column(String, nullable=False)  # Normalized description the rollup groups by
+    description = Column(String, nullable=False)  # As it appears on the statement
+    amount_minor = Column(Integer, nullable=False)  # Smallest currency unit (e.g. cents)
+    charged_on = Column(Date, nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month of charged_on
+
+    # Foreign keys to the user charged and the statement the charge was found in
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    file_id = Column(Integer, ForeignKey('uploaded_files.id'), nullable=False)
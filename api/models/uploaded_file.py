@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from .base import Base
 from datetime import datetime
@@ -8,7 +8,8 @@ class UploadedFile(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     file_name = Column(String, nullable=False)
-    file_content = Column(LargeBinary, nullable=False)
+    file_content = Column(LargeBinary, nullable=False)  # Empty; the content lives in the blob store
+    content_sha256 = Column(String(64), nullable=True)  # Blob store key
     file_path = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
@@ -20,4 +21,9 @@ class UploadedFile(Base):
     subscriptions = relationship("Subscription", back_populates="uploaded_file")
 
     # Remove the relationship to User
-    # owner = relationship("User", back_populates="uploaded_files") 
\ No newline at end of file
+    # owner = relationship("User", back_populates="uploaded_files")
+
+    __table_args__ = (
+        # Latest upload per user
+        Index('ix_uploaded_files_user_created_at', 'user_id', 'created_at'),
+    )
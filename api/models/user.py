@@ -20,6 +20,7 @@ class User(Base):
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')  # Bumped to revoke issued tokens
     real_card_id = Column(Integer, ForeignKey('real_cards.id'), unique=True)
     
     # Legal name fields
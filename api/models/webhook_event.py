@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from .base import Base
+from datetime import datetime
+
+class WebhookEvent(Base):
+    __tablename__ = 'webhook_events'
+
+    id = Column(String, primary_key=True)  # Stripe event ID, so a redelivery inserts nothing
+    type = Column(String, nullable=False, index=True)
+    ordering_key = Column(String, nullable=False, index=True)  # Events sharing a key are handled in arrival order
+    payload = Column(Text, nullable=False)  # Raw event JSON as verified
+    status = Column(String, nullable=False, default='pending', index=True)  # pending, processed, skipped or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # Set while waiting to be retried
+    replay_of = Column(String, nullable=True)  # Event this row re-runs, for replayed load
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
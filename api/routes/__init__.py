@@ -3,3 +3,5 @@ from .subscription_routes import router as subscription_router
 from .card_routes import router as card_router
 from .auth_routes import router as auth_router
 from .user_routes import router as user_router
+from .job_routes import router as job_router
+from .metrics_routes import router as metrics_router
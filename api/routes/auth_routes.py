@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, date
 from typing import Dict, Optional
 from pydantic import BaseModel
@@ -11,11 +12,14 @@ from api.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     authenticate_user,
     create_access_token,
+    token_claims,
     get_current_active_user,
-    get_password_hash,
-    get_db
+    get_async_db
 )
 from api.models import User
+from api.services.password_hashing import hashing_pool, HashingPoolBusy
+from api.services.principal_cache import principal_cache
+from api.services.stripe_gateway import stripe_gateway
 
 router = APIRouter(
     prefix="/auth",
@@ -26,9 +30,16 @@ router = APIRouter(
 @router.post("/token", response_model=Dict[str, str])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except HashingPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -37,7 +48,7 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -62,24 +73,31 @@ class UserRegistration(BaseModel):
 @router.post("/register", response_model=Dict[str, str])
 async def register_user(
     user_data: UserRegistration,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if username already exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    if (await db.execute(select(User.id).filter(User.username == user_data.username))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
     # Check if email already exists
-    if db.query(User).filter(User.email == user_data.email).first():
+    if (await db.execute(select(User.id).filter(User.email == user_data.email))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
         
     # Create new user with hashed password
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await hashing_pool.hash(user_data.password)
+    except HashingPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many registrations in progress, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -98,18 +116,18 @@ async def register_user(
     
     # Create Stripe customer
     try:
-        customer = stripe.Customer.create(
-            email=user_data.email,
-            name=f"{user_data.legal_name.first_name} {user_data.legal_name.last_name}",
-            phone=user_data.phone_number,
-            address={
+        customer = await stripe_gateway.call_async('customers.create', params={
+            'email': user_data.email,
+            'name': f"{user_data.legal_name.first_name} {user_data.legal_name.last_name}",
+            'phone': user_data.phone_number,
+            'address': {
                 'line1': user_data.address_line1,
                 'city': user_data.city,
                 'state': user_data.state,
                 'postal_code': user_data.postal_code,
                 'country': user_data.country,
             } if user_data.address_line1 else None
-        )
+        })
         new_user.stripe_customer_id = customer.id
     except stripe.error.StripeError as e:
         raise HTTPException(
@@ -118,13 +136,12 @@ async def register_user(
         )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     # Create access token for the new user
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": new_user.username}, expires_delta=access_token_expires
+        data=token_claims(new_user), expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -145,3 +162,42 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
         "country": current_user.country,
         "phone_number": current_user.phone_number
     }
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+@router.put("/password", response_model=Dict[str, str])
+async def change_password(
+    password_data: PasswordChange,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Change the current user's password and revoke every token issued before it."""
+    user = await db.get(User, current_user.id)
+    try:
+        verified, _ = await hashing_pool.verify_and_update(password_data.current_password, user.hashed_password)
+        if verified:
+            hashed_password = await hashing_pool.hash(password_data.new_password)
+    except HashingPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect password"
+        )
+
+    user.hashed_password = hashed_password
+    user.token_version += 1
+    await db.commit()
+    principal_cache.invalidate(user.id)
+
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=token_claims(user), expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from typing import Optional
 from api.services.cardCreation import create_cardholder, create_virtual_card, get_virtual_card, create_test_card, create_virtual_card_for_user
 from api.auth import get_current_active_user, get_db
+from api.services.principal_cache import principal_cache
 from sqlalchemy.orm import Session
 from api.models.user import User
 
@@ -31,7 +32,7 @@ async def create_cardholder_endpoint(
     full_legal_name: LegalName,
     country: str = "US"
 ):
-    result = create_cardholder(
+    result = await create_cardholder(
         name=name,
         email=email,
         phone_number=phone_number,
@@ -50,15 +51,15 @@ async def create_virtual_card_endpoint(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    # Refresh current user to ensure we have latest state
-    current_user = db.merge(current_user)
-    db.refresh(current_user)
+    # Load the latest state in this session; the cached principal stays untouched
+    current_user = db.get(User, current_user.id)
     
-    result = create_virtual_card_for_user(current_user)
+    result = await create_virtual_card_for_user(current_user)
     
     if result.get("success"):
         # If card was created successfully, update the user in database
         db.commit()
+        principal_cache.invalidate(current_user.id)
         return result
     else:
         raise HTTPException(
@@ -68,10 +69,10 @@ async def create_virtual_card_endpoint(
 
 @router.get("/virtual-card/{card_id}")
 async def get_virtual_card_endpoint(card_id: str):
-    result = get_virtual_card(card_id)
+    result = await get_virtual_card(card_id)
     return result
 
 @router.post("/test-card")
 async def test_card_endpoint():
-    result = create_test_card()
+    result = await create_test_card()
     return result 
\ No newline at end of file
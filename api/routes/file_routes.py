@@ -1,9 +1,13 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import List
 import os
 import tempfile
 import logging
 import uuid
 import shutil
+import zipfile
+from api.config import get_settings
 
 router = APIRouter(
     prefix="/files",
@@ -11,46 +15,166 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Statement formats accepted by the parser; CSV exports take the streaming fast path
+STATEMENT_EXTENSIONS = (".xlsx", ".csv")
 
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # File storage functions
-def save_file(file_id: str, file_path: str):
+def save_file(file_id: str, file_path: str, extension: str = ".xlsx"):
     """Save file to persistent storage"""
-    new_path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-    shutil.copy2(file_path, new_path)
-    os.unlink(file_path)  # Remove the temporary file
+    new_path = os.path.join(UPLOAD_DIR, f"{file_id}{extension}")
+    shutil.move(file_path, new_path)  # Rename when the temporary file is on the same filesystem
     return new_path
 
 def get_file_path(file_id: str) -> str:
     """Get file path from persistent storage"""
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-    return file_path if os.path.exists(file_path) else None
+    for extension in STATEMENT_EXTENSIONS:
+        file_path = os.path.join(UPLOAD_DIR, f"{file_id}{extension}")
+        if os.path.exists(file_path):
+            return file_path
+    return None
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+def statement_extension(filename: str) -> str:
+    """Pick the stored extension for an uploaded statement, defaulting to .xlsx"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if extension in STATEMENT_EXTENSIONS else ".xlsx"
+
+async def _store_upload(file: UploadFile, extension: str) -> str:
+    """Stream an upload into persistent storage and return its file ID."""
+    temp_file_path = None
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as temp_file:
-            temp_file.write(await file.read())
+        # Stream the upload to a temporary file in chunks so large exports never sit in memory
+        with tempfile.NamedTemporaryFile(delete=False, suffix=extension, dir=UPLOAD_DIR) as temp_file:
             temp_file_path = temp_file.name
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                temp_file.write(chunk)
 
         # Generate a unique file ID using UUID
         file_id = str(uuid.uuid4())
         
         # Store the file in persistent storage
-        file_path = save_file(file_id, temp_file_path)
+        file_path = save_file(file_id, temp_file_path, extension)
         logger.info(f"File uploaded and saved at {file_path} with ID {file_id}")
+        return file_id
+    except Exception:
+        if temp_file_path and os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+        raise
 
+class ArchiveTooLarge(Exception):
+    """A zip archive's statements expand past the batch upload size limits."""
+
+def _copy_limited(source, target, limit: int) -> int:
+    """Copy `source` to `target` in chunks, raising ArchiveTooLarge past `limit` bytes; returns the bytes copied."""
+    copied = 0
+    while chunk := source.read(settings.UPLOAD_CHUNK_SIZE):
+        copied += len(chunk)
+        if copied > limit:
+            raise ArchiveTooLarge("Archive member expands past its stated size or the size limit")
+        target.write(chunk)
+    return copied
+
+def _extract_statements(archive_path: str, limit: int) -> List[dict]:
+    """Store the statements in a zip archive, reporting each member's file ID or why it was skipped.
+
+    Members over BATCH_UPLOAD_MAX_MEMBER_BYTES are skipped. The archive is
+    rejected with ArchiveTooLarge once its statements expand past
+    BATCH_UPLOAD_MAX_ARCHIVE_BYTES, counting the bytes actually extracted
+    rather than trusting the sizes the archive states. On any failure the
+    statements already stored from the archive are removed again.
+    """
+    results = []
+    saved = []
+    stored = 0
+    total = 0
+    temp_path = None
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                extension = os.path.splitext(member.filename)[1].lower()
+                if extension not in STATEMENT_EXTENSIONS:
+                    results.append({"filename": member.filename, "error": "Not a statement"})
+                    continue
+                if stored >= limit:
+                    results.append({"filename": member.filename, "error": "Batch limit reached"})
+                    continue
+                if member.file_size > settings.BATCH_UPLOAD_MAX_MEMBER_BYTES:
+                    results.append({"filename": member.filename, "error": "Statement too large"})
+                    continue
+                remaining = settings.BATCH_UPLOAD_MAX_ARCHIVE_BYTES - total
+                if member.file_size > remaining:
+                    raise ArchiveTooLarge(f"Archive expands past {settings.BATCH_UPLOAD_MAX_ARCHIVE_BYTES} bytes")
+                # Copied out in chunks, like uploads, so a large member never sits in memory
+                with archive.open(member) as source, tempfile.NamedTemporaryFile(
+                    delete=False, suffix=extension, dir=UPLOAD_DIR
+                ) as temp_file:
+                    temp_path = temp_file.name
+                    total += _copy_limited(source, temp_file, min(member.file_size, remaining))
+                file_id = str(uuid.uuid4())
+                saved.append(save_file(file_id, temp_path, extension))
+                temp_path = None
+                results.append({"filename": member.filename, "file_id": file_id})
+                stored += 1
+    except Exception:
+        for path in saved + [temp_path]:
+            if path and os.path.exists(path):
+                os.unlink(path)
+        raise
+    return results
+
+@router.post("/upload")
+async def upload_file(file: UploadFile = File(...)):
+    try:
+        file_id = await _store_upload(file, statement_extension(file.filename))
         return {"message": "File uploaded successfully", "file_id": file_id}
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
         raise HTTPException(status_code=500, detail="Error uploading file")
 
+@router.post("/upload/batch")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """Upload several statements at once, as files or zip archives of them.
+
+    Each statement gets its own file ID, as from /files/upload; pass them to
+    POST /subscriptions/upload/batch. A file that could not be stored, or a
+    zip archive over the size limits, is reported with an error instead of
+    failing the batch.
+    """
+    results = []
+    for file in files:
+        stored = [result for result in results if "file_id" in result]
+        try:
+            if os.path.splitext(file.filename or "")[1].lower() == ".zip":
+                archive_id = await _store_upload(file, ".zip")
+                archive_path = os.path.join(UPLOAD_DIR, f"{archive_id}.zip")
+                try:
+                    limit = settings.BATCH_UPLOAD_MAX_FILES - len(stored)
+                    results.extend(await run_in_threadpool(_extract_statements, archive_path, limit))
+                finally:
+                    os.unlink(archive_path)
+            elif len(stored) >= settings.BATCH_UPLOAD_MAX_FILES:
+                results.append({"filename": file.filename, "error": "Batch limit reached"})
+            else:
+                results.append({"filename": file.filename,
+                                "file_id": await _store_upload(file, statement_extension(file.filename))})
+        except ArchiveTooLarge as e:
+            logger.warning(f"Rejected {file.filename}: {str(e)}")
+            results.append({"filename": file.filename, "error": str(e)})
+        except Exception as e:
+            logger.error(f"Error uploading {file.filename}: {str(e)}")
+            results.append({"filename": file.filename, "error": "Error uploading file"})
+
+    uploaded = sum(1 for result in results if "file_id" in result)
+    logger.info(f"Batch upload stored {uploaded} of {len(results)} files")
+    return {"message": f"{uploaded} files uploaded", "files": results}
+
 @router.get("/files/{file_id}")
 async def get_file(file_id: str):
     try:
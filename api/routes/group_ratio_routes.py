@@ -9,6 +9,8 @@ logger = logging.getLogger(__name__)
 from ..models import User, Group, GroupMemberRatio, GroupInvitation
 from ..auth import get_current_active_user
 from ..database import get_db
+from ..services.money import TOTAL_BASIS_POINTS, allocate, bps_to_percent, percent_to_bps
+from ..services.split_plans import split_plans
 
 router = APIRouter(
     prefix="/groups",
@@ -97,12 +99,14 @@ async def set_group_ratios(
         GroupMemberRatio.group_id == group_id
     ).delete()
 
-    # Create new ratios
-    for ratio in ratios.ratios:
+    # Create new ratios, in basis points that add up to exactly 10000
+    shares = allocate(TOTAL_BASIS_POINTS, [percent_to_bps(ratio.ratio_percentage) for ratio in ratios.ratios]) if ratios.ratios else []
+    for ratio, bps in zip(ratios.ratios, shares):
         new_ratio = GroupMemberRatio(
             group_id=group_id,
             user_id=ratio.user_id,
-            ratio_percentage=ratio.ratio_percentage
+            ratio_bps=bps,
+            ratio_percentage=bps_to_percent(bps)
         )
         db.add(new_ratio)
 
@@ -116,6 +120,7 @@ async def set_group_ratios(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f'Failed to update ratios: {str(e)}'
         )
+    split_plans.invalidate_group(group_id)
 
     return {'message': 'Group payment ratios updated successfully'}
 
@@ -162,17 +167,18 @@ async def get_group_ratios(
     if not ratios:
         num_members = len(member_ids)
         if num_members > 0:
-            equal_ratio = 100.0 / num_members
             # Create default ratios in database
-            for member_id in member_ids:
+            for member_id, bps in zip(member_ids, allocate(TOTAL_BASIS_POINTS, [1] * num_members)):
                 new_ratio = GroupMemberRatio(
                     group_id=group_id,
                     user_id=member_id,
-                    ratio_percentage=equal_ratio
+                    ratio_bps=bps,
+                    ratio_percentage=bps_to_percent(bps)
                 )
                 db.add(new_ratio)
             try:
                 db.commit()
+                split_plans.invalidate_group(group_id)
                 # Fetch the newly created ratios
                 ratios = db.query(GroupMemberRatio).filter(
                     GroupMemberRatio.group_id == group_id
@@ -188,7 +194,7 @@ async def get_group_ratios(
         ratios=[
             MemberRatio(
                 user_id=ratio.user_id,
-                ratio_percentage=ratio.ratio_percentage
+                ratio_percentage=bps_to_percent(ratio.ratio_bps)
             )
             for ratio in ratios
         ]
@@ -1,15 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, delete
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from pydantic import BaseModel, validator
 from datetime import datetime
 
 from ..models import User, Group, VirtualCard, CardMember, GroupInvitation, Subscription
 from ..auth import get_current_active_user
-from ..database import get_db
-from ..services.cardCreation import create_cardholder, create_virtual_card, get_virtual_card
+from ..database import get_async_db
+from ..services.cardCreation import get_virtual_card
+from ..services.authorization import authorization_policies
+from ..services.split_plans import split_plans
+from ..services.card_details_cache import card_details_cache
+from ..services.group_provisioning import FINISHED_STATUSES, provisioning_events, submit_provisioning
+from ..services.job_queue import JobQueueFull
+from ..services.principal_cache import principal_cache
 
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,12 +50,34 @@ class GroupCreate(BaseModel):
             raise ValueError('Name cannot be longer than 50 characters')
         return v
 
-@router.post('/', status_code=status.HTTP_201_CREATED)
+def _require_provisioned(group: Group):
+    if group.provisioning_status != 'active':
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f'Group card is not ready (provisioning {group.provisioning_status})'
+        )
+
+async def _queue_provisioning(db: AsyncSession, group: Group, user_id: int) -> str:
+    try:
+        return await run_in_threadpool(submit_provisioning, group.id, user_id)
+    except JobQueueFull as e:
+        logger.warning(f"Could not queue provisioning for group {group.id}: {str(e)}")
+        group.provisioning_status = 'failed'
+        group.provisioning_error = str(e)
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many groups are being set up, retry with POST /groups/{group.id}/provision shortly",
+            headers={"Retry-After": "5"}
+        )
+
+@router.post('/', status_code=status.HTTP_202_ACCEPTED, responses={202: {"description": "Group created; its card is provisioned in the background", "content": {"application/json": {"example": {"message": "Group created, its card is being provisioned", "group_id": 7, "provisioning_status": "pending", "job_id": "0b6f..."}}}}, 503: {"description": "Job queue is full"}})
 async def create_group(
     group_data: GroupCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Create a group and queue its Stripe cardholder and card; poll GET /groups/{group_id}/provisioning."""
     logger.info(f"Creating new group '{group_data.name}' for user {current_user.id}")
     
     # Check if user has a real card
@@ -55,114 +87,107 @@ async def create_group(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='You must add a real card before creating a group'
         )
+
+    # Verify country is Ireland before creating cardholder
+    if current_user.country != 'IE':
+        logger.warning(f"User {current_user.id} from {current_user.country} attempted to create group")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Only users from Ireland (IE) can create groups at this time'
+        )
     
     try:
-        # Create the group
+        # Create the group; the cardholder and card follow in the provision_group job
         new_group = Group(
             name=group_data.name,
-            admin_id=current_user.id
+            admin_id=current_user.id,
+            provisioning_status='pending'
         )
         db.add(new_group)
-        db.flush()  # Get the group ID
-        
-        logger.info(f"Created group {new_group.id} with name '{group_data.name}'")
-        
-        logging.debug(f"User {current_user.id} is creating group {new_group.id}")
-        logging.debug(f"User {current_user.id} is from {current_user.country}")
-        # Verify country is Ireland before creating cardholder
-        if current_user.country != 'IE':
-            logger.warning(f"User {current_user.id} from {current_user.country} attempted to create group")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail='Only users from Ireland (IE) can create groups at this time'
-            )
-
-        # Create Stripe cardholder for the group
-        logger.info(f"Creating Stripe cardholder for group {new_group.id}")
-        display_name = f"{current_user.first_name} {current_user.last_name}"
-        cardholder_result = create_cardholder(
-            name=display_name,  # Use admin's full name for Stripe cardholder
-            email=current_user.email,  # Use admin's email for now
-            phone_number=current_user.phone_number,
-            address_line1=current_user.address_line1,
-            city=current_user.city,
-            state=current_user.state,
-            postal_code=current_user.postal_code,
-            country=current_user.country,  # Pass the user's country
-            date_of_birth=current_user.date_of_birth,
-            full_legal_name={
-                'first_name': current_user.first_name,
-                'last_name': current_user.last_name,
-            }
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        logger.error("IntegrityError: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Group creation failed'
         )
-        
-        if not cardholder_result["success"]:
-            logger.error(f"Failed to create Stripe cardholder for group {new_group.id}: {cardholder_result['error']}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f'Failed to create Stripe cardholder: {cardholder_result["error"]}'
-            )
-            
-        logger.info(f"Successfully created Stripe cardholder for group {new_group.id}")
-        
-        # Create Stripe virtual card
-        logger.info(f"Creating virtual card for group {new_group.id}")
-        card_result = create_virtual_card(cardholder_result["cardholder"].id)
 
-        if not card_result["success"]:
-            logger.error(f"Failed to create virtual card for group {new_group.id}: {card_result['error']}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f'Failed to create virtual card: {card_result["error"]}'
-            )
+    logger.info(f"Created group {new_group.id} with name '{group_data.name}', provisioning its card")
+    job_id = await _queue_provisioning(db, new_group, current_user.id)
+    return {
+        'message': 'Group created, its card is being provisioned',
+        'group_id': new_group.id,
+        'provisioning_status': new_group.provisioning_status,
+        'job_id': job_id
+    }
 
-        logger.info(f"Successfully created virtual card for group {new_group.id}")
-        
-        # Store virtual card details with the group
-        new_group.virtual_card_id = card_result["card"].id
-        new_group.virtual_card_last4 = card_result["card"].last4
-        new_group.virtual_card_exp_month = card_result["card"].exp_month
-        new_group.virtual_card_exp_year = card_result["card"].exp_year
-        db.add(new_group)
-        db.flush()  # This will assign an ID to new_group
-        
-        # Create virtual card record
-        virtual_card = VirtualCard(
-            virtual_card_id=card_result["card"].id,
-            group_id=new_group.id
+@router.get('/{group_id}/provisioning', responses={200: {"description": "Provisioning state of the group's card", "content": {"application/json": {"example": {"group_id": 7, "provisioning_status": "active", "provisioning_error": None, "virtual_card_id": "ic_1Nv..."}}}}})
+async def get_group_provisioning(
+    group_id: int,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for provisioning to finish before answering"),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Report whether the group's card is ready, optionally waiting for it instead of polling."""
+    group = await db.get(Group, group_id)
+    if not group or group.admin_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Group not found'
         )
-        db.add(virtual_card)
-        db.flush()  # This will assign an ID to virtual_card
-        
-        # Add the creator as a member of the group via CardMember
-        card_member = CardMember(
-            card_id=virtual_card.id,
-            user_id=current_user.id
+    if wait and group.provisioning_status not in FINISHED_STATUSES:
+        # Watch before reading again, so a job finishing in between still wakes us
+        with provisioning_events.watch(group_id) as finished:
+            await db.refresh(group)
+            if group.provisioning_status not in FINISHED_STATUSES:
+                try:
+                    await asyncio.wait_for(finished.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                await db.refresh(group)
+    return {
+        'group_id': group.id,
+        'provisioning_status': group.provisioning_status,
+        'provisioning_error': group.provisioning_error,
+        'virtual_card_id': group.virtual_card_id
+    }
+
+@router.post('/{group_id}/provision', status_code=status.HTTP_202_ACCEPTED, responses={503: {"description": "Job queue is full"}})
+async def retry_group_provisioning(
+    group_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Queue provisioning again for a group whose provisioning failed."""
+    group = await db.get(Group, group_id)
+    if not group or group.admin_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Group not found'
         )
-        db.add(card_member)
-        
-        db.commit()
-        logger.info(f"Group {new_group.id} created successfully")
-        return {
-            'message': 'Group created successfully',
-            'group_id': new_group.id,
-            'virtual_card_id': new_group.virtual_card_id
-        }
-        
-    except IntegrityError as e:
-        db.rollback()
-        logger.error("IntegrityError: %s", e)
+    if group.provisioning_status != 'failed':
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Group creation failed'
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f'Group provisioning is {group.provisioning_status}, not failed'
         )
+    group.provisioning_status = 'pending'
+    group.provisioning_error = None
+    await db.commit()
+    job_id = await _queue_provisioning(db, group, current_user.id)
+    return {
+        'message': 'Group provisioning queued',
+        'group_id': group.id,
+        'provisioning_status': group.provisioning_status,
+        'job_id': job_id
+    }
 
 
 @router.post('/{group_id}/join', status_code=status.HTTP_200_OK)
 async def join_group(
     group_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} attempting to join group {group_id}")
     
@@ -176,18 +201,21 @@ async def join_group(
     
     try:
         # Check if group exists
-        group = db.query(Group).get(group_id)
+        group = await db.get(Group, group_id)
         if not group:
             logger.warning(f"User {current_user.id} attempted to join non-existent group {group_id}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Group not found'
             )
+        _require_provisioned(group)
         # Check if user is already a member
-        existing_membership = db.query(CardMember).join(VirtualCard).filter(
-            VirtualCard.group_id == group_id,
-            CardMember.user_id == current_user.id
-        ).first()
+        existing_membership = (await db.execute(
+            select(CardMember.id).join(VirtualCard).filter(
+                VirtualCard.group_id == group_id,
+                CardMember.user_id == current_user.id
+            )
+        )).first()
         
         if existing_membership:
             logger.warning(f"User {current_user.id} is already a member of group {group_id}")
@@ -197,17 +225,20 @@ async def join_group(
             )
             
         # Add user as member
-        virtual_card = db.query(VirtualCard).filter_by(group_id=group_id).first()
+        virtual_card = (await db.execute(select(VirtualCard).filter_by(group_id=group_id))).scalars().first()
         member = CardMember(
             card_id=virtual_card.id,
             user_id=current_user.id
         )
         db.add(member)
-        db.commit()
+        await db.commit()
+        authorization_policies.invalidate_group(group_id)
+        split_plans.invalidate_group(group_id)
+        principal_cache.invalidate(current_user.id)
         logger.info(f"User {current_user.id} joined group {group_id} successfully")
         return {'message': 'Successfully joined group'}
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Failed to add user {current_user.id} to group {group_id}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -227,13 +258,13 @@ class GroupMember(BaseModel):
 async def get_group_members(
     group_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} retrieving members of group {group_id}")
     """Get all members of a group"""
     try:
         # Check if group exists
-        group = db.query(Group).get(group_id)
+        group = await db.get(Group, group_id)
         if not group:
             logger.warning(f"User {current_user.id} attempted to retrieve members of non-existent group {group_id}")
             raise HTTPException(
@@ -241,9 +272,11 @@ async def get_group_members(
                 detail='Group not found'
             )
         # Get all members
-        members = db.query(User).join(CardMember).join(VirtualCard).filter(
-            VirtualCard.group_id == group_id
-        ).all()
+        members = (await db.execute(
+            select(User).join(CardMember).join(VirtualCard).filter(
+                VirtualCard.group_id == group_id
+            )
+        )).scalars().all()
         
         logger.info(f"Successfully retrieved members of group {group_id}")
         return [
@@ -269,34 +302,38 @@ class UserGroup(BaseModel):
     id: int
     group_name: str  # This is the group's name, not the user's name
     is_admin: bool
-    virtual_card_id: str
+    virtual_card_id: Optional[str] = None
+    provisioning_status: str = 'active'
 
 @router.get('/', response_model=List[UserGroup], status_code=status.HTTP_200_OK)
 async def get_user_groups(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    groups = db.query(Group).filter(Group.admin_id == current_user.id).all()
+    groups = (await db.execute(select(Group).filter(Group.admin_id == current_user.id))).scalars().all()
     return [
         UserGroup(
             id=group.id,
             group_name=group.name,
             is_admin=True,
-            virtual_card_id=group.virtual_card_id
+            virtual_card_id=group.virtual_card_id,
+            provisioning_status=group.provisioning_status
         ) for group in groups
     ]
 
 @router.get('/my', response_model=List[UserGroup])
 async def get_user_groups(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} retrieving their groups")
     try:
         # Get all groups user is a member of
-        groups = db.query(Group).join(VirtualCard).join(CardMember).filter(
-            CardMember.user_id == current_user.id
-        ).all()
+        groups = (await db.execute(
+            select(Group).join(VirtualCard).join(CardMember).filter(
+                CardMember.user_id == current_user.id
+            )
+        )).scalars().all()
         
         logger.info(f"Successfully retrieved groups for user {current_user.id}")
         return [
@@ -320,11 +357,13 @@ async def invite_to_group(
     group_id: int,
     invite_data: InviteUser,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} attempting to invite {invite_data.username} to group {group_id}")
     # Check if group exists and user is admin
-    group = db.query(Group).filter(Group.id == group_id).first()
+    group = (await db.execute(
+        select(Group).options(selectinload(Group.virtual_card)).filter(Group.id == group_id)
+    )).scalars().first()
     if not group:
         logger.warning(f"User {current_user.id} attempted to invite to non-existent group {group_id}")
         raise HTTPException(
@@ -338,9 +377,10 @@ async def invite_to_group(
             status_code=status.HTTP_403_FORBIDDEN,
             detail='Only group admin can invite users'
         )
+    _require_provisioned(group)
     
     # Find invitee by username
-    invitee = db.query(User).filter(User.username == invite_data.username).first()
+    invitee = (await db.execute(select(User).filter(User.username == invite_data.username))).scalars().first()
     if not invitee:
         logger.warning(f"User {current_user.id} attempted to invite non-existent user {invite_data.username}")
         raise HTTPException(
@@ -349,10 +389,12 @@ async def invite_to_group(
         )
     
     # Check if user is already in group
-    existing_member = db.query(CardMember).filter(
-        CardMember.user_id == invitee.id,
-        CardMember.card_id == group.virtual_card.id
-    ).first()
+    existing_member = (await db.execute(
+        select(CardMember.id).filter(
+            CardMember.user_id == invitee.id,
+            CardMember.card_id == group.virtual_card.id
+        )
+    )).first()
     
     if existing_member:
         logger.warning(f"User {current_user.id} attempted to invite {invite_data.username} who is already a member of group {group_id}")
@@ -362,11 +404,13 @@ async def invite_to_group(
         )
     
     # Check if invitation already exists
-    existing_invitation = db.query(GroupInvitation).filter(
-        GroupInvitation.group_id == group_id,
-        GroupInvitation.invitee_id == invitee.id,
-        GroupInvitation.accepted == False
-    ).first()
+    existing_invitation = (await db.execute(
+        select(GroupInvitation.id).filter(
+            GroupInvitation.group_id == group_id,
+            GroupInvitation.invitee_id == invitee.id,
+            GroupInvitation.accepted == False
+        )
+    )).first()
     
     if existing_invitation:
         logger.warning(f"User {current_user.id} attempted to invite {invite_data.username} who has already been invited to group {group_id}")
@@ -383,20 +427,24 @@ async def invite_to_group(
     )
     
     db.add(invitation)
-    db.commit()
+    await db.commit()
     logger.info(f"User {current_user.id} invited {invite_data.username} to group {group_id} successfully")
     return {'message': f'Invitation sent to {invitee.username}'}
 
 @router.get('/invitations/pending', response_model=List[dict])
 async def get_pending_invitations(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} retrieving pending invitations")
-    invitations = db.query(GroupInvitation).filter(
-        GroupInvitation.invitee_id == current_user.id,
-        GroupInvitation.accepted == False
-    ).all()
+    invitations = (await db.execute(
+        select(GroupInvitation)
+        .options(selectinload(GroupInvitation.group), selectinload(GroupInvitation.inviter))
+        .filter(
+            GroupInvitation.invitee_id == current_user.id,
+            GroupInvitation.accepted == False
+        )
+    )).scalars().all()
     
     logger.info(f"Successfully retrieved pending invitations for user {current_user.id}")
     return [{
@@ -410,14 +458,18 @@ async def get_pending_invitations(
 async def accept_invitation(
     invitation_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} attempting to accept invitation {invitation_id}")
-    invitation = db.query(GroupInvitation).filter(
-        GroupInvitation.id == invitation_id,
-        GroupInvitation.invitee_id == current_user.id,
-        GroupInvitation.accepted == False
-    ).first()
+    invitation = (await db.execute(
+        select(GroupInvitation)
+        .options(selectinload(GroupInvitation.group).selectinload(Group.virtual_card))
+        .filter(
+            GroupInvitation.id == invitation_id,
+            GroupInvitation.invitee_id == current_user.id,
+            GroupInvitation.accepted == False
+        )
+    )).scalars().first()
     
     if not invitation:
         logger.warning(f"User {current_user.id} attempted to accept non-existent invitation {invitation_id}")
@@ -442,62 +494,69 @@ async def accept_invitation(
     
     invitation.accepted = True
     db.add(new_member)
-    db.commit()
+    await db.commit()
+    authorization_policies.invalidate_group(group.id)
+    split_plans.invalidate_group(group.id)
+    principal_cache.invalidate(current_user.id)
     logger.info(f"User {current_user.id} accepted invitation {invitation_id} successfully")
     return {'message': f'Successfully joined group {group.name}'}
 
 @router.get('/{group_id}/card')
 async def get_group_card_details(
     group_id: int,
+    reveal: bool = True,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Card details for a group member. Pass `reveal=false` to skip the number and CVC,
+    which are the only fields that ever need Stripe."""
     logger.info(f"User {current_user.id} retrieving card details for group {group_id}")
-    # Check if user is a member of the group by joining through virtual_cards
-    member = db.query(CardMember).join(
-        VirtualCard, CardMember.card_id == VirtualCard.id
-    ).filter(
-        VirtualCard.group_id == group_id,
-        CardMember.user_id == current_user.id
-    ).first()
+    # The group's card, provided the user is a member of it through virtual_cards
+    row = (await db.execute(
+        select(VirtualCard, Group).join(
+            Group, VirtualCard.group_id == Group.id
+        ).join(
+            CardMember, CardMember.card_id == VirtualCard.id
+        ).filter(
+            VirtualCard.group_id == group_id,
+            CardMember.user_id == current_user.id
+        )
+    )).first()
     
-    if not member:
+    if not row:
         logger.warning(f"User {current_user.id} is not a member of group {group_id}")
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail='You are not a member of this group'
         )
-    
-    # Retrieve the virtual card id associated with the group id
-    virtual_card = db.query(VirtualCard).filter(VirtualCard.group_id == group_id).first()
-    if not virtual_card:
-        logger.error(f"Virtual card not found for group {group_id}")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Virtual card not found for this group'
-        )
+    virtual_card, group = row
 
-
-    # Return the virtual card id along with other card details
-    card_data = get_virtual_card(virtual_card.virtual_card_id)
-    if not card_data:
-        logger.error(f"Failed to retrieve card data for group {group_id}")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Group not found'
-        )
+    # Last4, expiry and status were stored with the group and kept current by webhooks
+    card_details = {
+        'last4': group.virtual_card_last4,
+        'exp_month': group.virtual_card_exp_month,
+        'exp_year': group.virtual_card_exp_year,
+        'status': group.virtual_card_status or 'active',
+        'type': 'virtual'
+    }
+    if reveal:
+        sensitive = card_details_cache.get(virtual_card.virtual_card_id)
+        if sensitive is None:
+            card_data = await get_virtual_card(virtual_card.virtual_card_id)
+            if not card_data['success']:
+                logger.error(f"Failed to retrieve card data for group {group_id}: {card_data['error']}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f'Failed to retrieve virtual card: {card_data["error"]}'
+                )
+            sensitive = {'number': card_data['card']['number'], 'cvc': card_data['card']['cvc']}
+            card_details_cache.put(virtual_card.virtual_card_id, sensitive)
+        card_details.update(sensitive)
     
     logger.info(f"Successfully retrieved card details for group {group_id}")
     return {
         'virtual_card_id': virtual_card.id,
-        'card_details': {
-            'number': card_data['card']['number'],
-            'exp_month': card_data['card']['exp_month'],
-            'exp_year': card_data['card']['exp_year'],
-            'cvc': card_data['card']['cvc'],
-            'status': card_data['card'].get('status', 'active'),
-            'type': card_data['card'].get('type', 'debit')
-        }
+        'card_details': card_details
     }
 
 class SubscriptionResponse(BaseModel):
@@ -511,12 +570,12 @@ class SubscriptionResponse(BaseModel):
 async def get_group_subscriptions(
     group_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Fetching subscriptions for group {group_id}")
     
     # Check if group exists and user is a member
-    group = db.query(Group).get(group_id)
+    group = await db.get(Group, group_id)
     if not group:
         logger.warning(f"Group {group_id} not found")
         raise HTTPException(
@@ -525,10 +584,12 @@ async def get_group_subscriptions(
         )
     
     # Check if user is a member of the group
-    is_member = db.query(CardMember).join(VirtualCard).filter(
-        VirtualCard.group_id == group_id,
-        CardMember.user_id == current_user.id
-    ).first()
+    is_member = (await db.execute(
+        select(CardMember.id).join(VirtualCard).filter(
+            VirtualCard.group_id == group_id,
+            CardMember.user_id == current_user.id
+        )
+    )).first()
     
     if not is_member:
         logger.warning(f"User {current_user.id} is not a member of group {group_id}")
@@ -538,9 +599,11 @@ async def get_group_subscriptions(
         )
     
     # Get all subscriptions for the group
-    subscriptions = db.query(Subscription).filter(
-        Subscription.group_id == group_id
-    ).all()
+    subscriptions = (await db.execute(
+        select(Subscription).filter(
+            Subscription.group_id == group_id
+        )
+    )).scalars().all()
     
     return subscriptions
 
@@ -548,13 +611,15 @@ async def get_group_subscriptions(
 async def delete_group(
     group_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"User {current_user.id} attempting to delete group {group_id}")
     """Delete a group. Only the group admin can delete their group."""
     
     # Get the group
-    group = db.query(Group).get(group_id)
+    group = (await db.execute(
+        select(Group).options(selectinload(Group.virtual_card)).filter(Group.id == group_id)
+    )).scalars().first()
     if not group:
         logger.warning(f"User {current_user.id} attempted to delete non-existent group {group_id}")
         raise HTTPException(
@@ -572,23 +637,33 @@ async def delete_group(
     
     try:
         # Delete all card memberships associated with the group's virtual card
-        db.query(CardMember).filter(
-            CardMember.card_id == group.virtual_card.id
-        ).delete()
+        member_ids = []
+        if group.virtual_card:  # Groups still provisioning have no card or members yet
+            member_ids = (await db.execute(
+                select(CardMember.user_id).filter(CardMember.card_id == group.virtual_card.id)
+            )).scalars().all()
+            await db.execute(delete(CardMember).filter(
+                CardMember.card_id == group.virtual_card.id
+            ))
         
         # Delete the virtual card
-        db.query(VirtualCard).filter(
+        await db.execute(delete(VirtualCard).filter(
             VirtualCard.group_id == group.id
-        ).delete()
+        ))
         
         # Delete the group
-        db.delete(group)
-        db.commit()
+        await db.delete(group)
+        await db.commit()
+        authorization_policies.invalidate_group(group_id)
+        split_plans.invalidate_group(group_id)
+        principal_cache.invalidate(*member_ids)
+        if group.virtual_card_id:
+            card_details_cache.invalidate(group.virtual_card_id)
         logger.info(f"Group {group_id} deleted successfully")
         return {'message': 'Group deleted successfully'}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Failed to delete group {group_id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from api.database import get_db
+from api.auth import get_current_active_user
+from api.models import User, Job
+import json
+import logging
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"],
+    responses={404: {"description": "Not found"}}
+)
+logger = logging.getLogger(__name__)
+
+@router.get("/{job_id}", responses={200: {"description": "Job status", "content": {"application/json": {"example": {"id": "0b6f...", "kind": "process_statement", "status": "succeeded", "progress": 100, "result": {"subscriptions": 4}, "error": None}}}}})
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Report the status, progress, result or error of a background job."""
+    job = db.query(Job).filter(
+        Job.id == job_id,
+        Job.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat()
+    }
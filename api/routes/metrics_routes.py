@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from api.services.metrics import snapshot_all
+from api.services.stripe_gateway import stripe_gateway
+from api.services.webhook_handlers import webhook_inbox
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+@router.get("/latency", responses={200: {"description": "Latency histograms by name", "content": {"application/json": {"example": {"issuing_authorization_decision": {"count": 1200, "mean_ms": 0.8, "max_ms": 4.1, "p50_ms": 1, "p95_ms": 1, "p99_ms": 2.5, "buckets": {"le_0.1": 0, "le_inf": 0}}}}}}})
+async def get_latency_metrics():
+    """Report the latency histograms recorded by this process."""
+    return snapshot_all()
+
+@router.get("/stripe", responses={200: {"description": "State of the Stripe gateway", "content": {"application/json": {"example": {"circuit_breaker": "closed", "api_base": "https://api.stripe.com"}}}}})
+async def get_stripe_metrics():
+    """Report whether the Stripe circuit breaker is closed, open or half open."""
+    return stripe_gateway.status()
+
+@router.get("/webhooks", responses={200: {"description": "Stored webhook events by status", "content": {"application/json": {"example": {"events": {"processed": 1480, "pending": 3, "failed": 1}, "active_lanes": 2}}}}})
+def get_webhook_metrics():
+    """Report how many stored webhook events are pending, processed, skipped or failed."""
+    return webhook_inbox.status()
@@ -8,6 +8,9 @@ from ..config import settings
 from ..models import User, RealCard
 from ..auth import get_current_active_user
 from ..database import get_db
+from ..services.principal_cache import principal_cache
+from ..services.split_plans import split_plans
+from ..services.stripe_gateway import stripe_gateway
 
 import logging
 
@@ -32,9 +35,8 @@ async def add_real_card(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    # Refresh current user to ensure we have latest state
-    current_user = db.merge(current_user)
-    db.refresh(current_user)
+    # Load the latest state in this session; the cached principal stays untouched
+    current_user = db.get(User, current_user.id)
     
     # Check if user already has a real card
     if current_user.real_card:
@@ -53,7 +55,7 @@ async def add_real_card(
                 )
 
             # Retrieve payment method to get card details
-            payment_method = stripe.PaymentMethod.retrieve(card_data.payment_method_id)
+            payment_method = await stripe_gateway.call_async('payment_methods.retrieve', card_data.payment_method_id)
             if not payment_method or payment_method.type != 'card':
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -62,16 +64,20 @@ async def add_real_card(
 
             # Attach payment method to customer if not already attached
             if payment_method.customer != current_user.stripe_customer_id:
-                stripe.PaymentMethod.attach(
+                await stripe_gateway.call_async(
+                    'payment_methods.attach',
                     card_data.payment_method_id,
-                    customer=current_user.stripe_customer_id,
+                    params={'customer': current_user.stripe_customer_id}
                 )
 
             # Set as default payment method
-            stripe.Customer.modify(
+            await stripe_gateway.call_async(
+                'customers.update',
                 current_user.stripe_customer_id,
-                invoice_settings={
-                    'default_payment_method': card_data.payment_method_id
+                params={
+                    'invoice_settings': {
+                        'default_payment_method': card_data.payment_method_id
+                    }
                 }
             )
 
@@ -91,6 +97,7 @@ async def add_real_card(
             # Add and commit
             db.add(real_card)
             db.commit()
+            principal_cache.invalidate(current_user.id)
             
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error while adding card for user {current_user.id}: {str(e)}")
@@ -124,18 +131,11 @@ class RealCardResponse(BaseModel):
 
 @router.get('/', response_model=RealCardResponse)
 async def get_real_card(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user)
 ):
     """Get user's real card information"""
-    # Get fresh user data with relationships
-    user = db.query(User).filter(User.id == current_user.id).first()
-    
-    # Debug information
-    print(f"User ID: {user.id}")
-    print(f"Real Card ID: {user.real_card_id}")
-    
-    if not user.real_card:
+    # current_user already has its real card loaded, and card changes invalidate the principal cache
+    if not current_user.real_card:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='No real card found'
@@ -149,14 +149,9 @@ async def get_real_card(
 
 @router.get('/has-card', response_model=dict)
 async def check_has_card(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user)
 ):
     """Check if user has a real card"""
-    # Refresh current user to ensure we have latest state
-    current_user = db.merge(current_user)
-    db.refresh(current_user)
-    
     return {"has_card": bool(current_user.real_card)}
 
 @router.delete('/', status_code=status.HTTP_200_OK)
@@ -165,6 +160,8 @@ async def remove_real_card(
     db: Session = Depends(get_db)
 ):
     """Remove user's real card"""
+    # Load the user in this session; the cached principal stays untouched
+    current_user = db.get(User, current_user.id)
     if not current_user.real_card:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -183,6 +180,8 @@ async def remove_real_card(
         db.delete(current_user.real_card)
         current_user.real_card_id = None
         db.commit()
+        principal_cache.invalidate(current_user.id)
+        split_plans.invalidate_user(current_user.id)
         
         return {'message': 'Real card removed successfully'}
     except Exception as e:
@@ -1,8 +1,20 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from api.config import get_settings
 from api.routes.file_routes import get_file_path
-from api.services.subscription_parser import process_subscriptions, get_subscriptions_sorted_by_date
-from api.database import get_db
+from api.services.subscription_parser import process_subscriptions, sort_subscription_dates
+from api.services.job_queue import job_queue, JobQueueFull
+from api.services.subscription_store import bulk_upsert_subscriptions
+from api.services.money import sum_minor, to_major, to_minor
+from api.services.blob_store import blob_store
+from api.services.statement_store import (
+    detect_statement_subscriptions, detect_subscriptions, has_transactions, ingest_statement, ingest_statements, update_recurrences
+)
+from api.services.spend_rollup import months_back, record_charges, spend_by_merchant, spend_by_month, spent_since
+from api.database import get_async_db
 from api.auth import get_current_active_user
 from api.models.user import User
 from api.models.uploaded_file import UploadedFile
@@ -13,7 +25,7 @@ from pydantic import BaseModel, Field
 import logging
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 
 # Define the Subscription models
@@ -40,14 +52,18 @@ class SubscriptionSchema(SubscriptionBaseSchema):
 class AddToGroupRequest(BaseModel):
     group_id: int
 
+class BatchUploadRequest(BaseModel):
+    file_ids: List[str] = Field(..., min_length=1)  # Processed in this order; overlapping rows are stored with the first
+
 router = APIRouter(
     prefix="/subscriptions",
     tags=["Subscriptions"],
     responses={404: {"description": "Not found"}}
 )
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
-async def get_or_create_subscription(
+def get_or_create_subscription(
     db: Session,
     user_id: int,
     description: str,
@@ -63,10 +79,11 @@ async def get_or_create_subscription(
     try:
         print("get_or_create_subscription")
         # Try to find existing subscription
+        amount_minor = to_minor(amount)
         subscription = db.query(SubscriptionModel).filter(
             SubscriptionModel.user_id == user_id,
             SubscriptionModel.description == description,
-            SubscriptionModel.amount == amount
+            SubscriptionModel.amount_minor == amount_minor
         ).first()
 
         if subscription:
@@ -98,9 +115,10 @@ async def get_or_create_subscription(
 
         new_subscription = SubscriptionModel(
             description=description,
-            amount=amount,
+            amount_minor=amount_minor,
+            amount=to_major(amount_minor),
             date=datetime.strptime(date, '%Y-%m-%d').date() if isinstance(date, str) else date,
-            estimated_next_date=datetime.strptime(estimated_next_date, '%Y-%m-%d').date() if estimated_next_date else None,
+            estimated_next_date=datetime.strptime(estimated_next_date, '%Y-%m-%d').date() if isinstance(estimated_next_date, str) else estimated_next_date,
             user_id=user_id,
             file_id=file_id
         )
@@ -117,79 +135,179 @@ async def get_or_create_subscription(
         db.rollback()
         raise
 
-@router.post("/upload/{file_id}")
-async def create_subscriptions_from_file(
-    file_id: str,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Create subscriptions from an uploaded file and associate them with the current user."""
-    try:
-        # Get the file path and verify it exists
-        file_path = get_file_path(file_id)
-        if not file_path:
-            raise HTTPException(status_code=404, detail="File not found")
-            
-        # Process subscriptions from the file
-        subscriptions_data = process_subscriptions(file_path)
-        
-        # Create UploadedFile record
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
+def _uploaded_file(db: Session, user_id: int, file_path: str) -> UploadedFile:
+    """The UploadedFile of a statement, created unless an earlier attempt already did."""
+    uploaded_file = db.query(UploadedFile).filter(
+        UploadedFile.user_id == user_id,
+        UploadedFile.file_path == file_path
+    ).first()
+    if not uploaded_file:
         uploaded_file = UploadedFile(
             file_name=os.path.basename(file_path),
-            file_content=file_content,
+            file_content=b"",
+            content_sha256=blob_store.put_file(file_path),
             file_path=file_path,
-            user_id=current_user.id
+            user_id=user_id
         )
         db.add(uploaded_file)
-        db.commit()
-        db.refresh(uploaded_file)
-        
-        # Delete any existing subscriptions for this user from this file
-        db.query(SubscriptionModel).filter(
-            SubscriptionModel.user_id == current_user.id,
-            SubscriptionModel.file_id == uploaded_file.id
-        ).delete()
-        
-        # Create new subscription records
-        for sub in subscriptions_data:
-            subscription = await get_or_create_subscription(
-                db=db,
-                user_id=current_user.id,
-                description=sub["Description"],
-                amount=sub["Amount"],
-                date=datetime.strptime(sub["Dates"][-1], '%Y-%m-%d').date(),
-                estimated_next_date=datetime.strptime(sub["Estimated_Next"], '%Y-%m-%d').date() if sub.get("Estimated_Next") else None,
-                file_id=uploaded_file.id
-            )
-            logger.info(f"Prepared to add subscription: {sub['Description']} for user ID: {current_user.id}")
+        db.flush()
+    return uploaded_file
+
+def _save_subscriptions(db: Session, user_id: int, file_id: int) -> dict:
+    """Re-detect the user's subscriptions and store them and their charges against a statement."""
+    merchants = update_recurrences(db, user_id)
+    subscriptions_data = detect_subscriptions(db, user_id)
+
+    # Delete any existing subscriptions for this user from this file
+    db.query(SubscriptionModel).filter(
+        SubscriptionModel.user_id == user_id,
+        SubscriptionModel.file_id == file_id
+    ).delete()
+
+    # Create new subscription records in one batch
+    bulk_upsert_subscriptions(db, user_id, [{
+        "description": sub["Description"],
+        "amount": sub["Amount"],
+        "date": sub["Dates"][-1],
+        "estimated_next_date": sub.get("Estimated_Next"),
+        "file_id": file_id
+    } for sub in subscriptions_data])
+
+    # Store every charge of the subscriptions and update the monthly spend rollup
+    charges = record_charges(db, user_id, file_id, subscriptions_data)
+    return {"redetected_merchants": merchants, "subscriptions": len(subscriptions_data), "charges": charges}
+
+def process_statement_job(db: Session, payload: dict, report_progress) -> dict:
+    """Job handler that stores an uploaded statement's rows and the subscriptions found in them.
+
+    The file record, the rows and every subscription are written in one
+    transaction, so re-running it after a restart neither duplicates nor
+    half-applies. Subscriptions are detected over all of the user's stored
+    rows, so overlapping statements extend each other's history, but only
+    merchants the statement added rows for are re-detected.
+    """
+    file_id = payload["file_id"]
+    user_id = payload["user_id"]
 
-        db.commit()
-        logger.info(f"Successfully saved {len(subscriptions_data)} subscriptions for user ID: {current_user.id}")
-        return {"message": "Subscriptions created successfully"}
-        
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error creating subscriptions: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    # Get the file path and verify it still exists
+    file_path = get_file_path(file_id)
+    if not file_path:
+        raise ValueError(f"File {file_id} not found")
+    uploaded_file = _uploaded_file(db, user_id, file_path)
+
+    # Store the statement's rows, then re-detect the merchants they added charges for
+    rows, stored = ingest_statement(db, user_id, uploaded_file.id, file_path)
+    report_progress(50)
+    saved = _save_subscriptions(db, user_id, uploaded_file.id)
+
+    db.commit()
+    logger.info(f"Successfully saved {saved['subscriptions']} subscriptions for user ID: {user_id}")
+    return {"uploaded_file_id": uploaded_file.id, "rows": rows, "stored_rows": stored, **saved}
+
+def process_statement_batch_job(db: Session, payload: dict, report_progress) -> dict:
+    """Job handler that stores a batch of statements' rows and detects subscriptions once over them.
+
+    The files are parsed in parallel and merged into one deduplicated set of
+    rows (see ingest_statements), all in one transaction. Every file gets a
+    status: `processed`, `not_found` if it is missing or `failed` if it could
+    not be parsed; the others are stored either way. Subscriptions and their
+    charges are recorded against the last processed file.
+    """
+    user_id = payload["user_id"]
+    files = [{"file_id": file_id} for file_id in payload["file_ids"]]
+    statements = []
+    for entry in files:
+        file_path = get_file_path(entry["file_id"])
+        if not file_path:
+            entry["status"] = "not_found"
+            continue
+        entry["uploaded_file_id"] = _uploaded_file(db, user_id, file_path).id
+        statements.append((entry, file_path))
+    report_progress(10)
+
+    results = ingest_statements(db, user_id, [(entry["uploaded_file_id"], file_path) for entry, file_path in statements])
+    for (entry, _), result in zip(statements, results):
+        entry.update(result, status="failed" if "error" in result else "processed")
+    report_progress(70)
+
+    processed = [entry for entry in files if entry.get("status") == "processed"]
+    saved = _save_subscriptions(db, user_id, processed[-1]["uploaded_file_id"]) if processed else {}
+
+    db.commit()
+    logger.info(f"Processed {len(processed)} of {len(files)} statements for user ID: {user_id}")
+    return {"files": files, **saved}
+
+job_queue.register("process_statement", process_statement_job)
+job_queue.register("process_statements", process_statement_batch_job)
+
+@router.post("/upload/batch", status_code=202, responses={202: {"description": "Statements queued for processing", "content": {"application/json": {"example": {"message": "2 statements queued for processing", "job_id": "0b6f..."}}}}, 503: {"description": "Job queue is full"}})
+async def create_subscriptions_from_files(
+    request: BatchUploadRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Queue uploaded files for parallel parsing and one detection run; GET /jobs/{job_id} reports each file's status."""
+    file_ids = list(dict.fromkeys(request.file_ids))
+    if len(file_ids) > settings.BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_UPLOAD_MAX_FILES} statements per batch")
+
+    try:
+        job_id = await run_in_threadpool(
+            job_queue.submit,
+            "process_statements",
+            user_id=current_user.id,
+            payload={"file_ids": file_ids, "user_id": current_user.id}
+        )
+    except JobQueueFull as e:
+        logger.warning(f"Rejected statement batch for user ID {current_user.id}: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many statements are being processed, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    return {"message": f"{len(file_ids)} statements queued for processing", "job_id": job_id}
+
+@router.post("/upload/{file_id}", status_code=202, responses={202: {"description": "Statement queued for processing", "content": {"application/json": {"example": {"message": "Statement queued for processing", "job_id": "0b6f..."}}}}, 503: {"description": "Job queue is full"}})
+async def create_subscriptions_from_file(
+    file_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Queue an uploaded file for subscription detection; poll GET /jobs/{job_id} for the outcome."""
+    if not get_file_path(file_id):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        job_id = await run_in_threadpool(
+            job_queue.submit,
+            "process_statement",
+            user_id=current_user.id,
+            payload={"file_id": file_id, "user_id": current_user.id}
+        )
+    except JobQueueFull as e:
+        logger.warning(f"Rejected statement upload for user ID {current_user.id}: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many statements are being processed, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    return {"message": "Statement queued for processing", "job_id": job_id}
 
 @router.get("/user")
 async def get_user_subscriptions(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all subscriptions for the current user."""
     try:
-        subscriptions = db.query(SubscriptionModel).filter(
-            SubscriptionModel.user_id == current_user.id
-        ).all()
+        subscriptions = (await db.execute(
+            select(SubscriptionModel).filter(
+                SubscriptionModel.user_id == current_user.id
+            )
+        )).scalars().all()
         
         return [{
             "id": sub.id,
             "Description": sub.description,  
-            "Amount": float(sub.amount),     
+            "Amount": to_major(sub.amount_minor),
             "date": sub.date.strftime("%Y-%m-%d") if sub.date else None,
             "estimated_next_date": sub.estimated_next_date.strftime("%Y-%m-%d") if sub.estimated_next_date else None,
             "file_id": sub.file_id,
@@ -200,24 +318,39 @@ async def get_user_subscriptions(
         logger.error(f"Error getting user subscriptions: {str(e)}")
         raise HTTPException(status_code=500, detail="Error getting subscriptions")
 
+@router.get("/user/total", responses={200: {"description": "Total of the current user's subscriptions", "content": {"application/json": {"example": {"count": 4, "total": 52.96, "total_minor": 5296}}}}})
+async def get_user_subscription_total(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Sum the current user's subscription amounts in the database, in integer cents."""
+    count, total_minor = (await db.execute(
+        select(func.count(SubscriptionModel.id), func.coalesce(func.sum(SubscriptionModel.amount_minor), 0)).filter(
+            SubscriptionModel.user_id == current_user.id
+        )
+    )).one()
+    return {"count": count, "total": to_major(total_minor), "total_minor": total_minor}
+
 @router.delete("/{subscription_id}")
 async def delete_subscription(
     subscription_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a specific subscription."""
     try:
-        subscription = db.query(SubscriptionModel).filter(
-            SubscriptionModel.id == subscription_id,
-            SubscriptionModel.user_id == current_user.id
-        ).first()
+        subscription = (await db.execute(
+            select(SubscriptionModel).filter(
+                SubscriptionModel.id == subscription_id,
+                SubscriptionModel.user_id == current_user.id
+            )
+        )).scalars().first()
         
         if not subscription:
             raise HTTPException(status_code=404, detail="Subscription not found")
             
-        db.delete(subscription)
-        db.commit()
+        await db.delete(subscription)
+        await db.commit()
         
         return {"message": "Subscription deleted successfully"}
         
@@ -225,8 +358,34 @@ async def delete_subscription(
         logger.error(f"Error deleting subscription: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/subscriptions/{file_id}", responses={200: {"description": "List of subscriptions", "content": {"application/json": {"example": [{"Description": "POS NETFLIX", "Amount": 15.99, "Dates": ["2025-01-03"], "Estimated_Next": "2025-02-03"}]}}}})
-async def get_subscriptions(file_id: str):
+async def processed_statement(db: AsyncSession, file_path: str) -> Optional[UploadedFile]:
+    """The UploadedFile of a processed statement with stored rows, or None."""
+    uploaded_file = (await db.execute(
+        select(UploadedFile).filter(UploadedFile.file_path == file_path).order_by(UploadedFile.id).limit(1)
+    )).scalars().first()
+    if uploaded_file and await db.run_sync(lambda sync_db: has_transactions(sync_db, uploaded_file.id)):
+        return uploaded_file
+    return None
+
+async def statement_subscriptions(db: AsyncSession, file_id: str, file_path: str) -> List[dict]:
+    """Subscriptions of a statement, read without side effects.
+
+    Once the statement has been processed these are detected over the rows
+    stored from it, never the uploading user's other statements (see
+    detect_statement_subscriptions); before that the statement itself is
+    parsed, on a worker thread to keep the event loop free.
+    """
+    uploaded_file = await processed_statement(db, file_path)
+    if uploaded_file:
+        return await db.run_sync(lambda sync_db: detect_statement_subscriptions(sync_db, uploaded_file.id))
+    return await run_in_threadpool(process_subscriptions, file_path, file_id=file_id)
+
+def spend_window_start() -> date:
+    """First day of the last-12-months window, the same days the parsed statements are filtered on."""
+    return (datetime.now() - timedelta(days=365)).date() + timedelta(days=1)
+
+@router.get("/subscriptions/{file_id}", responses={200: {"description": "List of subscriptions", "content": {"application/json": {"example": [{"Description": "POS NETFLIX", "Amount": 15.99, "Dates": ["2025-01-03"], "Estimated_Next": "2025-02-03", "Amounts": [15.99], "Cadence": "monthly", "Confidence": 0.5}]}}}})
+async def get_subscriptions(file_id: str, db: AsyncSession = Depends(get_async_db)):
     logger.debug(f"Fetching subscriptions for file ID: {file_id}")
     try:
         # Retrieve the file path using the file ID from in-memory storage
@@ -235,8 +394,7 @@ async def get_subscriptions(file_id: str):
             logger.error(f"File ID {file_id} not found")
             raise HTTPException(status_code=404, detail="File ID not found")
 
-        # Directly return the result from process_subscriptions
-        subscriptions = process_subscriptions(file_path)
+        subscriptions = await statement_subscriptions(db, file_id, file_path)
         logger.info(f"Subscriptions retrieved for file ID {file_id}")
         return subscriptions
     except Exception as e:
@@ -244,7 +402,7 @@ async def get_subscriptions(file_id: str):
         raise HTTPException(status_code=500, detail="Error processing subscriptions")
 
 @router.get("/subscriptions/sorted/{file_id}", responses={200: {"description": "Sorted list of subscription transactions", "content": {"application/json": {"example": [{"Description": "POS NETFLIX", "Amount": 15.99, "Date": "2025-01-03", "Estimated_Next": "2025-02-03"}]}}}})
-async def get_sorted_subscriptions(file_id: str):
+async def get_sorted_subscriptions(file_id: str, db: AsyncSession = Depends(get_async_db)):
     logger.debug(f"Fetching sorted subscriptions for file ID: {file_id}")
     try:
         # Retrieve the file path using the file ID from in-memory storage
@@ -253,16 +411,15 @@ async def get_sorted_subscriptions(file_id: str):
             logger.error(f"File ID {file_id} not found")
             raise HTTPException(status_code=404, detail="File ID not found")
 
-        # Directly return the result from get_subscriptions_sorted_by_date
-        sorted_subscriptions = get_subscriptions_sorted_by_date(file_path)
+        sorted_subscriptions = sort_subscription_dates(await statement_subscriptions(db, file_id, file_path))
         logger.info(f"Sorted subscriptions retrieved for file ID {file_id}")
         return sorted_subscriptions
     except Exception as e:
         logger.error(f"Error processing sorted subscriptions: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing sorted subscriptions")
 
-@router.get("/filter/{file_id}", responses={200: {"description": "Filtered list of subscriptions", "content": {"application/json": {"example": [{"Description": "POS NETFLIX", "Amount": 15.99, "Dates": ["2025-01-03"], "Estimated_Next": "2025-02-03"}]}}}})
-async def filter_subscriptions(file_id: str, price: float = Query(None), description: str = Query(None)):
+@router.get("/filter/{file_id}", responses={200: {"description": "Filtered list of subscriptions", "content": {"application/json": {"example": [{"Description": "POS NETFLIX", "Amount": 15.99, "Dates": ["2025-01-03"], "Estimated_Next": "2025-02-03", "Amounts": [15.99], "Cadence": "monthly", "Confidence": 0.5}]}}}})
+async def filter_subscriptions(file_id: str, price: float = Query(None), description: str = Query(None), db: AsyncSession = Depends(get_async_db)):
     logger.debug(f"Filtering subscriptions for file ID: {file_id} with price: {price}, description: {description}")
     try:
         # Retrieve the file path using the file ID from in-memory storage
@@ -272,7 +429,7 @@ async def filter_subscriptions(file_id: str, price: float = Query(None), descrip
             raise HTTPException(status_code=404, detail="File ID not found")
 
         # Get all subscriptions for the file
-        all_subscriptions = process_subscriptions(file_path)
+        all_subscriptions = await statement_subscriptions(db, file_id, file_path)
 
         # Filter subscriptions based on price and description
         filtered_subscriptions = [
@@ -288,7 +445,13 @@ async def filter_subscriptions(file_id: str, price: float = Query(None), descrip
         raise HTTPException(status_code=500, detail="Error filtering subscriptions")
 
 @router.get("/total_spent/{file_id}", responses={200: {"description": "Total amount spent on subscriptions in the last 12 months", "content": {"application/json": {"example": {"total_spent": 150.75}}}}})
-async def total_spent(file_id: str):
+async def total_spent(file_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Total spent on the statement's subscriptions in the last 12 months.
+
+    Only the statement's own subscriptions are summed (see
+    statement_subscriptions); the uploading user's spend across statements
+    is at /spend/total.
+    """
     logger.debug(f"Calculating total spent for file ID: {file_id}")
     try:
         file_path = get_file_path(file_id)
@@ -297,16 +460,17 @@ async def total_spent(file_id: str):
             logger.error(f"File ID {file_id} not found")
             raise HTTPException(status_code=404, detail="File ID not found")
 
-        subscriptions = process_subscriptions(file_path)
+        subscriptions = await statement_subscriptions(db, file_id, file_path)
         logger.debug(f"Subscriptions: {subscriptions}")
         one_year_ago = datetime.now() - timedelta(days=365)
         logger.debug(f"One year ago: {one_year_ago}")
 
-        total_spent = sum(
-            sub['Amount'] for sub in subscriptions
-            for date in sub['Dates']
+        # Summed exactly in cents; float sums drift by fractions of a cent
+        total_spent = to_major(sum_minor([
+            amount for sub in subscriptions
+            for date, amount in zip(sub['Dates'], sub['Amounts'])
             if datetime.strptime(date, "%Y-%m-%d") >= one_year_ago
-        )
+        ]))
 
         logger.info(f"Total spent in the last 12 months: {total_spent}")
         return {"total_spent": total_spent}
@@ -315,7 +479,7 @@ async def total_spent(file_id: str):
         raise HTTPException(status_code=500, detail="Error calculating total spent")
 
 @router.get("/specific_spent/{file_id}", responses={200: {"description": "Amount spent on a specific subscription in the last 12 months", "content": {"application/json": {"example": {"specific_spent": 59.97}}}}})
-async def specific_spent(file_id: str, description: str, price: float):
+async def specific_spent(file_id: str, description: str, price: float, db: AsyncSession = Depends(get_async_db)):
     logger.setLevel(logging.DEBUG)
     logger.debug(f"Calculating specific spent for file ID: {file_id}, description: {description}, price: {price}")
     try:
@@ -325,17 +489,18 @@ async def specific_spent(file_id: str, description: str, price: float):
             logger.error(f"File ID {file_id} not found")
             raise HTTPException(status_code=404, detail="File ID not found")
 
-        subscriptions = process_subscriptions(file_path)
+        price_minor = to_minor(price)
+        subscriptions = await statement_subscriptions(db, file_id, file_path)
         logger.debug(f"Subscriptions: {subscriptions}")
         one_year_ago = datetime.now() - timedelta(days=365)
         logger.debug(f"One year ago: {one_year_ago}")
 
-        specific_spent = sum(
-            sub['Amount'] for sub in subscriptions
-            if sub['Description'].lower() == description.lower() and sub['Amount'] == price
-            for date in sub['Dates']
-            if datetime.strptime(date, "%Y-%m-%d") >= one_year_ago
-        )
+        specific_spent = to_major(sum_minor([
+            amount for sub in subscriptions
+            if sub['Description'].lower() == description.lower()
+            for date, amount in zip(sub['Dates'], sub['Amounts'])
+            if to_minor(amount) == price_minor and datetime.strptime(date, "%Y-%m-%d") >= one_year_ago
+        ]))
 
         logger.info(f"Specific spent in the last 12 months: {specific_spent}")
         return {"specific_spent": specific_spent}
@@ -343,8 +508,59 @@ async def specific_spent(file_id: str, description: str, price: float):
         logger.error(f"Error calculating specific spent: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/spend/total", responses={200: {"description": "The current user's subscription spend in the last 12 months", "content": {"application/json": {"example": {"total": 150.75, "total_minor": 15075}}}}})
+async def get_total_spend(
+    description: Optional[str] = Query(None),
+    price: Optional[float] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """The current user's subscription spend in the last 12 months across all of their statements, from the rollup.
+
+    Narrowed to one subscription by `description` and optionally `price`.
+    """
+    since = spend_window_start()
+    price_minor = to_minor(price) if price is not None else None
+    total_minor = await db.run_sync(
+        lambda sync_db: spent_since(sync_db, current_user.id, since, description, price_minor)
+    )
+    return {"total": to_major(total_minor), "total_minor": total_minor}
+
+@router.get("/spend/monthly", responses={200: {"description": "Subscription spend per month, oldest first", "content": {"application/json": {"example": [{"month": "2025-01", "total": 29.97, "total_minor": 2997, "charges": 3}]}}}})
+async def get_monthly_spend(
+    months: int = Query(12, ge=1, le=120),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """The current user's subscription spend in each of the last `months` months, from the rollup."""
+    since_month = months_back(datetime.now().date(), months)
+    rows = await db.run_sync(lambda sync_db: spend_by_month(sync_db, current_user.id, since_month))
+    return [{
+        "month": row["month"].strftime("%Y-%m"),
+        "total": to_major(row["total_minor"]),
+        "total_minor": row["total_minor"],
+        "charges": row["charges"]
+    } for row in rows]
+
+@router.get("/spend/merchants", responses={200: {"description": "Subscription spend per merchant, largest first", "content": {"application/json": {"example": [{"merchant": "NETFLIX", "description": "POS NETFLIX", "total": 191.88, "total_minor": 19188, "charges": 12}]}}}})
+async def get_merchant_spend(
+    months: int = Query(12, ge=1, le=120),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """The current user's subscription spend per merchant over the last `months` months, from the rollup."""
+    since_month = months_back(datetime.now().date(), months)
+    rows = await db.run_sync(lambda sync_db: spend_by_merchant(sync_db, current_user.id, since_month))
+    return [{
+        "merchant": row["merchant"],
+        "description": row["description"],
+        "total": to_major(row["total_minor"]),
+        "total_minor": row["total_minor"],
+        "charges": row["charges"]
+    } for row in rows]
+
 @router.delete("/subscriptions/{file_id}/{description}/{amount}/{date}", responses={200: {"description": "Subscription deleted"}})
-async def delete_subscription(file_id: str, description: str, amount: float, date: str):
+async def delete_subscription(file_id: str, description: str, amount: float, date: str, db: AsyncSession = Depends(get_async_db)):
     logger.debug(f"Deleting subscription for file ID: {file_id} with description: {description}, amount: {amount}, date: {date}")
     try:
         # Retrieve the file path using the file ID from in-memory storage
@@ -354,7 +570,7 @@ async def delete_subscription(file_id: str, description: str, amount: float, dat
             raise HTTPException(status_code=404, detail="File ID not found")
 
         # Process the subscriptions to get the current data
-        subscriptions_data = get_subscriptions_sorted_by_date(file_path)
+        subscriptions_data = sort_subscription_dates(await statement_subscriptions(db, file_id, file_path))
 
         # Find the subscription to delete
         subscription_to_delete = next(
@@ -375,31 +591,29 @@ async def delete_subscription(file_id: str, description: str, amount: float, dat
         raise HTTPException(status_code=500, detail="Error deleting subscription")
 
 @router.post("/subscriptions/create")
-async def create_subscriptions(subscriptions: List[SubscriptionCreateSchema], db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def create_subscriptions(subscriptions: List[SubscriptionCreateSchema], db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_active_user)):
     try:
-        created_subscriptions = []
-        for sub in subscriptions:
-            subscription = await get_or_create_subscription(
-                db=db,
-                user_id=current_user.id,
-                description=sub.description,
-                amount=sub.amount,
-                date=sub.date,
-                estimated_next_date=sub.estimated_next_date,
-                file_id=sub.file_id
-            )
-            created_subscriptions.append({
-                "id": subscription.id,
-                "description": subscription.description,
-                "amount": subscription.amount,
-                "date": subscription.date.strftime("%Y-%m-%d"),
-                "estimated_next_date": subscription.estimated_next_date.strftime("%Y-%m-%d") if subscription.estimated_next_date else None
-            })
-            logger.info(f"Prepared to add subscription: {sub.description} for user ID: {current_user.id}")
-        db.commit()
+        rows = [{
+            "description": sub.description,
+            "amount": sub.amount,
+            "date": sub.date,
+            "estimated_next_date": sub.estimated_next_date,
+            "file_id": sub.file_id
+        } for sub in subscriptions]
+        saved = await db.run_sync(bulk_upsert_subscriptions, current_user.id, rows)
+        # Serialise before committing, since commit expires the loaded rows
+        created_subscriptions = [{
+            "id": subscription.id,
+            "description": subscription.description,
+            "amount": to_major(subscription.amount_minor),
+            "date": subscription.date.strftime("%Y-%m-%d"),
+            "estimated_next_date": subscription.estimated_next_date.strftime("%Y-%m-%d") if subscription.estimated_next_date else None
+        } for subscription in saved]
+        await db.commit()
         logger.info(f"Successfully saved {len(subscriptions)} subscriptions for user ID: {current_user.id}")
         return created_subscriptions
     except Exception as e:
+        await db.rollback()
         logger.error(f"Error creating subscriptions: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating subscriptions")
 
@@ -407,47 +621,50 @@ async def create_subscriptions(subscriptions: List[SubscriptionCreateSchema], db
 async def add_subscription_to_group(
     subscription_id: int,
     request: AddToGroupRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Add a subscription to a group"""
     print("Request received:", subscription_id, request.group_id)
 
-    subscription = db.query(SubscriptionModel).filter(
-        SubscriptionModel.id == subscription_id,
-        SubscriptionModel.user_id == current_user.id  # Ensure user owns the subscription
-    ).first()
+    subscription = (await db.execute(
+        select(SubscriptionModel).filter(
+            SubscriptionModel.id == subscription_id,
+            SubscriptionModel.user_id == current_user.id  # Ensure user owns the subscription
+        )
+    )).scalars().first()
     
     if not subscription:
         logger.warning(f"Subscription not found for id: {subscription_id}")
         raise HTTPException(status_code=404, detail="Subscription not found")
 
-    group = db.query(Group).filter(
-        Group.id == request.group_id,
-        Group.admin_id == current_user.id  # Ensure user is group admin
-    ).first()
+    group = (await db.execute(
+        select(Group.id).filter(
+            Group.id == request.group_id,
+            Group.admin_id == current_user.id  # Ensure user is group admin
+        )
+    )).first()
     
     if not group:
         logger.warning(f"Group not found for id: {request.group_id}")
         raise HTTPException(status_code=404, detail="Group not found")
 
     subscription.group_id = request.group_id
-    db.commit()
-    db.refresh(subscription)
+    await db.commit()
     return {"message": "Subscription added to group successfully"}
 
 @router.get("/find_subscription")
 async def find_subscription(
     description: str,
     amount: float,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Find a subscription by description and amount, creating it if it doesn't exist."""
     try:
         print("find_subscription")
-        subscription = await get_or_create_subscription(
-            db=db,
+        subscription = await db.run_sync(
+            get_or_create_subscription,
             user_id=current_user.id,
             description=description,
             amount=amount
@@ -456,7 +673,7 @@ async def find_subscription(
         return {
             "id": subscription.id,
             "Description": subscription.description,
-            "Amount": float(subscription.amount),
+            "Amount": to_major(subscription.amount_minor),
             "date": subscription.date.strftime("%Y-%m-%d"),
             "estimated_next_date": subscription.estimated_next_date.strftime("%Y-%m-%d") if subscription.estimated_next_date else None,
             "file_id": subscription.file_id,
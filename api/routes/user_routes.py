@@ -8,6 +8,7 @@ from datetime import date
 from ..models import User
 from ..database import get_db
 from ..auth import get_current_active_user
+from ..services.principal_cache import principal_cache
 
 import logging
 
@@ -93,6 +94,7 @@ async def update_user(
         logger.error(f"Error updating user: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     else:
+        principal_cache.invalidate(db_user.id)
         db.refresh(db_user)
         return db_user
 
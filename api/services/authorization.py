@@ -0,0 +1,178 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import stripe
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from api.config import get_settings
+from api.models import CardMember, User, VirtualCard
+from api.services.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Time from receiving an issuing_authorization.request webhook to having its decision
+decision_latency = get_histogram("issuing_authorization_decision")
+
+class WebhookVerifier:
+    """Verifies Stripe webhook signatures with a precomputed HMAC key.
+
+    Equivalent to stripe.WebhookSignature.verify_header, but the HMAC key
+    schedule is computed once per secret and copied per request, and the
+    payload is verified as raw bytes without decoding it first.
+    """
+
+    def __init__(self, secret: str, tolerance: int = 300):
+        self.secret = secret
+        self.tolerance = tolerance
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def verify(self, payload: bytes, sig_header: str, now: Optional[float] = None) -> None:
+        """Check `sig_header` against `payload`.
+
+        Raises:
+            stripe.error.SignatureVerificationError: If the header is malformed,
+                no v1 signature matches or the timestamp is too old
+        """
+        timestamp = None
+        signatures = []
+        for item in sig_header.split(","):
+            key, _, value = item.strip().partition("=")
+            if key == "t":
+                timestamp = value
+            elif key == "v1":
+                signatures.append(value)
+        if not timestamp or not timestamp.isdigit() or not signatures:
+            raise stripe.error.SignatureVerificationError(
+                "Unable to extract timestamp and signatures from header", sig_header, payload)
+
+        mac = self._mac.copy()
+        mac.update(timestamp.encode("ascii"))
+        mac.update(b".")
+        mac.update(payload)
+        expected = mac.hexdigest()
+        if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+            raise stripe.error.SignatureVerificationError(
+                "No signatures found matching the expected signature for payload", sig_header, payload)
+
+        if self.tolerance and int(timestamp) < (now or time.time()) - self.tolerance:
+            raise stripe.error.SignatureVerificationError(
+                "Timestamp outside the tolerance zone", sig_header, payload)
+
+_verifier = None
+
+def get_webhook_verifier(secret: str) -> WebhookVerifier:
+    """Return a verifier for `secret`, rebuilding it only when the secret changes."""
+    global _verifier
+    verifier = _verifier
+    if verifier is None or verifier.secret != secret:
+        verifier = _verifier = WebhookVerifier(secret, settings.STRIPE_WEBHOOK_TOLERANCE_SECONDS)
+    return verifier
+
+# Returned by AuthorizationPolicyCache.get when a card's policy has to be loaded
+_MISSING = object()
+
+@dataclass(frozen=True)
+class CardPolicy:
+    """What the approval decision needs to know about one virtual card."""
+    card_id: str
+    group_id: int
+    payer_count: int  # Group members with a real card the charge can be split onto
+    approval_limit: int
+
+    def approves(self, amount: int) -> bool:
+        return self.payer_count > 0 and amount < self.approval_limit
+
+def _policy_query():
+    return (
+        select(VirtualCard.virtual_card_id, VirtualCard.group_id, func.count(User.real_card_id))
+        .select_from(VirtualCard)
+        .outerjoin(CardMember, CardMember.card_id == VirtualCard.id)
+        .outerjoin(User, User.id == CardMember.user_id)
+        .group_by(VirtualCard.id, VirtualCard.virtual_card_id, VirtualCard.group_id)
+    )
+
+class AuthorizationPolicyCache:
+    """In-memory map from Stripe card ID to the CardPolicy of its group.
+
+    Entries expire after `ttl_seconds` and are also dropped explicitly when a
+    group is created, joined or deleted. Real cards need no invalidation: a
+    user must hold one to join a group and cannot remove it while a member.
+    Unknown cards are cached as None so repeated requests for them do not
+    reach the database.
+    """
+
+    def __init__(self, ttl_seconds=300, approval_limit=10_000_000_000_000):
+        self.ttl_seconds = ttl_seconds
+        self.approval_limit = approval_limit
+        self._entries = {}  # card_id -> (policy or None, expires_at)
+        self._lock = threading.Lock()
+
+    def _store(self, card_id, policy):
+        with self._lock:
+            self._entries[card_id] = (policy, time.monotonic() + self.ttl_seconds)
+
+    def _policy(self, row):
+        card_id, group_id, payer_count = row
+        return CardPolicy(card_id=card_id, group_id=group_id, payer_count=payer_count,
+                          approval_limit=self.approval_limit)
+
+    def get(self, card_id):
+        """Return the cached policy (possibly None), or _MISSING if it must be loaded."""
+        entry = self._entries.get(card_id)
+        if entry is None or entry[1] < time.monotonic():
+            return _MISSING
+        return entry[0]
+
+    async def fetch(self, db: AsyncSession, card_id: str) -> Optional[CardPolicy]:
+        row = (await db.execute(_policy_query().filter(VirtualCard.virtual_card_id == card_id))).first()
+        policy = self._policy(row) if row else None
+        self._store(card_id, policy)
+        return policy
+
+    def warm(self, db: Session) -> int:
+        """Load the policy of every virtual card in one query, returning how many were cached."""
+        policies = [self._policy(row) for row in db.execute(_policy_query())]
+        for policy in policies:
+            self._store(policy.card_id, policy)
+        logger.info(f"Cached authorization policies for {len(policies)} cards")
+        return len(policies)
+
+    def invalidate_card(self, card_id: str):
+        with self._lock:
+            self._entries.pop(card_id, None)
+
+    def invalidate_group(self, group_id: int):
+        with self._lock:
+            for card_id, (policy, _) in list(self._entries.items()):
+                if policy is not None and policy.group_id == group_id:
+                    del self._entries[card_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+authorization_policies = AuthorizationPolicyCache(
+    ttl_seconds=settings.AUTHORIZATION_POLICY_TTL_SECONDS,
+    approval_limit=settings.AUTHORIZATION_APPROVAL_LIMIT
+)
+
+async def decide_authorization(db: AsyncSession, authorization: dict) -> bool:
+    """Approve or decline an issuing authorization request from its raw event object.
+
+    Cards that belong to no group, or whose group has nobody to split the
+    charge onto, are declined.
+    """
+    card = authorization["card"]
+    card_id = card["id"] if isinstance(card, dict) else card
+    policy = authorization_policies.get(card_id)
+    if policy is _MISSING:
+        policy = await authorization_policies.fetch(db, card_id)
+    return policy is not None and policy.approves(authorization["pending_request"]["amount"])
@@ -0,0 +1,70 @@
+"""Content-addressed storage for uploaded statement files.
+
+A blob lives at `<root>/<first two hex digits>/<sha256>`, so the same
+statement uploaded twice is stored once and a stored blob never changes.
+Files already on the same filesystem are hard-linked in rather than copied.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+from api.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put_file(self, file_path: str) -> str:
+        """Store a file's content and return its SHA-256 hex digest."""
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        if self.exists(digest):
+            return digest
+
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(file_path, tmp_path)
+        except OSError:
+            shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, target)
+        logger.info(f"Stored blob {digest} from {file_path}")
+        return digest
+
+    def put_bytes(self, content: bytes) -> str:
+        """Store in-memory content, such as a blob moved out of the database, and return its digest."""
+        digest = hashlib.sha256(content).hexdigest()
+        if self.exists(digest):
+            return digest
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), delete=False) as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_file.name, target)
+        logger.info(f"Stored blob {digest}")
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+blob_store = BlobStore(
+    settings.BLOB_STORE_DIR or os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "blobs")
+)
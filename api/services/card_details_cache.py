@@ -0,0 +1,65 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from cryptography.fernet import Fernet
+
+from api.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class CardDetailsCache:
+    """Short-lived, encrypted in-memory cache of virtual card numbers and CVCs.
+
+    Keyed by Stripe card ID and filled on the first GET /groups/{id}/card
+    after expiry, so members polling the same card share one Stripe
+    retrieve per `ttl_seconds`. Values are Fernet tokens under a key that is
+    generated per process and never leaves memory, so a heap dump or a log
+    of the cache holds no card numbers in the clear. The issuing_card.updated
+    webhook calls `invalidate` for the card.
+    """
+
+    def __init__(self, ttl_seconds=120, max_entries=10000, key: Optional[bytes] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._fernet = Fernet(key or Fernet.generate_key())
+        self._entries = OrderedDict()  # card_id -> (token, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, card_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(card_id)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[card_id]
+                return None
+            self._entries.move_to_end(card_id)
+        return json.loads(self._fernet.decrypt(entry[0]))
+
+    def put(self, card_id: str, details: dict):
+        if self.ttl_seconds <= 0:
+            return
+        token = self._fernet.encrypt(json.dumps(details).encode())
+        with self._lock:
+            self._entries[card_id] = (token, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(card_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, card_id: str):
+        with self._lock:
+            self._entries.pop(card_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+card_details_cache = CardDetailsCache(
+    ttl_seconds=settings.CARD_DETAILS_CACHE_TTL_SECONDS,
+    max_entries=settings.CARD_DETAILS_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,134 @@
+"""On-disk columnar cache of preprocessed statements.
+
+Reading a workbook through openpyxl is the slowest step of parsing, so the
+preprocessed debit rows of a statement are kept as NumPy arrays under
+`<root>/<sha256>.v<COLUMN_CACHE_VERSION>/`, one .npy file per column, and
+later loads memory-map them instead of opening the workbook again:
+
+- date.npy: datetime64[D] posting dates
+- money_out.npy: float64 amounts, as preprocess_data leaves them
+- description_codes.npy: int32 index of each row's description into
+- descriptions.npy: the distinct cleaned descriptions, fixed-width unicode
+
+Entries are keyed by content hash, so they never go stale for a file, and
+by COLUMN_CACHE_VERSION, so a change to preprocessing orphans them; orphans
+are removed, and the least recently used entries after them, whenever the
+cache grows past its size cap. Entries are written to a temporary directory
+and renamed into place; ones a crashed worker left behind are removed then
+too. Nothing else in the directory is touched.
+"""
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from api.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Bump when preprocess_data changes what it produces so older entries aren't served
+COLUMN_CACHE_VERSION = 1
+
+# Names of entries, of any version, and of the temporary directories they are written to
+ENTRY_NAME = re.compile(r"[0-9a-f]{64}\.v(\d+)")
+TMP_NAME = re.compile(r"[0-9a-f]{64}\.v\d+\.[0-9a-f]{32}\.tmp")
+
+# A save takes well under this; older temporary directories were left by a crashed worker
+STALE_TMP_SECONDS = 600
+
+class ColumnCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, f"{digest}.v{COLUMN_CACHE_VERSION}")
+
+    def load(self, digest: str) -> Optional[pd.DataFrame]:
+        """The cached Date, Description and Money Out columns of a statement, or None."""
+        path = self.path(digest)
+        try:
+            columns = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ("date", "money_out", "description_codes", "descriptions")
+            }
+            os.utime(path)  # Recently used entries are evicted last
+        except (OSError, ValueError):
+            return None
+        logger.debug(f"Column cache hit for {digest}")
+        return pd.DataFrame({
+            "Date": columns["date"].astype("datetime64[ns]"),
+            "Description": columns["descriptions"][columns["description_codes"]].astype(object),
+            "Money Out": columns["money_out"],
+        })
+
+    def save(self, digest: str, df: pd.DataFrame):
+        """Store a preprocessed statement's columns, then evict entries over the size cap."""
+        path = self.path(digest)
+        if os.path.exists(path):
+            return
+        codes, descriptions = pd.factorize(df["Description"].astype(str), use_na_sentinel=False)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(tmp_path)
+            np.save(os.path.join(tmp_path, "date.npy"), df["Date"].to_numpy(dtype="datetime64[D]"))
+            np.save(os.path.join(tmp_path, "money_out.npy"), df["Money Out"].to_numpy(dtype=np.float64))
+            np.save(os.path.join(tmp_path, "description_codes.npy"), codes.astype(np.int32))
+            np.save(os.path.join(tmp_path, "descriptions.npy"), np.asarray(descriptions, dtype=str))
+            os.rename(tmp_path, path)
+        except OSError as e:
+            # Another worker stored the same statement first, or the disk is full
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.exists(path):
+                logger.warning(f"Could not write column cache entry for {digest}: {str(e)}")
+            return
+        logger.info(f"Cached {len(df)} statement rows as columns under {digest}")
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove stale temporary directories and older cache versions, then the least recently used until under max_bytes."""
+        stale_before = time.time() - STALE_TMP_SECONDS
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if TMP_NAME.fullmatch(name):
+                try:
+                    if os.stat(path).st_mtime < stale_before:
+                        shutil.rmtree(path, ignore_errors=True)
+                        logger.info(f"Removed stale column cache directory {name}")
+                except OSError:
+                    pass  # Renamed into place or removed meanwhile
+                continue
+            match = ENTRY_NAME.fullmatch(name)
+            if not match:
+                continue  # Not ours
+            if int(match.group(1)) != COLUMN_CACHE_VERSION:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, path, size))
+            except OSError:
+                continue  # Removed by another worker meanwhile
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted column cache entry {os.path.basename(path)}")
+
+column_cache = ColumnCache(
+    settings.STATEMENT_COLUMN_CACHE_DIR or os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "columns"),
+    settings.STATEMENT_COLUMN_CACHE_MAX_BYTES
+)
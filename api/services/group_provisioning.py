@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy.orm import Session
+
+from api.models import CardMember, Group, VirtualCard
+from api.services.authorization import authorization_policies
+from api.services.cardCreation import cardholder_params, virtual_card_params
+from api.services.job_queue import job_queue
+from api.services.principal_cache import principal_cache
+from api.services.stripe_gateway import stripe_gateway
+
+logger = logging.getLogger(__name__)
+
+# Provisioning has stopped in these states; anything else is still in progress
+FINISHED_STATUSES = ("active", "failed")
+
+class ProvisioningNotifier:
+    """Wakes requests waiting for a group's provisioning to finish.
+
+    A waiter watches before reading the group's status again, so a job that
+    finishes in between still sets the event it then waits on. Each waiter
+    gets its own asyncio.Event, set on its event loop from the job's thread.
+    """
+
+    def __init__(self):
+        self._waiters = {}  # group_id -> {asyncio.Event: its event loop}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def watch(self, group_id: int):
+        """Yield an asyncio.Event set once the group's provisioning finishes."""
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.setdefault(group_id, {})[event] = asyncio.get_running_loop()
+        try:
+            yield event
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(group_id)
+                if waiters is not None:
+                    waiters.pop(event, None)
+                    if not waiters:
+                        del self._waiters[group_id]
+
+    def notify(self, group_id: int):
+        with self._lock:
+            waiters = self._waiters.pop(group_id, {})
+        for event, loop in waiters.items():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # The waiter's loop has closed; nobody is left to wake
+
+provisioning_events = ProvisioningNotifier()
+
+def cardholder_idempotency_key(provisioning_id: str, params: dict) -> str:
+    # Changed details make a new request instead of an idempotency error for a mismatched one
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"cardholder-{provisioning_id}-{digest}"
+
+def card_idempotency_key(provisioning_id: str) -> str:
+    return f"card-{provisioning_id}"
+
+def provision_group_job(db: Session, payload: dict, report_progress) -> dict:
+    """Give a pending group its Stripe cardholder and virtual card.
+
+    Steps are recorded on the group as they complete and both Stripe calls
+    carry idempotency keys scoped to the group's provisioning ID, so a re-run
+    after a crash or failure resumes where the last one stopped without
+    creating duplicates, and keys never repeat across databases. The admin's
+    cardholder is reused when they already have one.
+    """
+    group_id = payload["group_id"]
+    group = db.query(Group).filter(Group.id == group_id).first()
+    if not group:
+        raise ValueError(f"Group {group_id} not found")
+    if group.provisioning_status == 'active':
+        return {"group_id": group.id, "virtual_card_id": group.virtual_card_id}
+
+    admin = group.admin
+    try:
+        if not admin.card_holder_id:
+            logger.info(f"Creating Stripe cardholder for group {group_id} admin {admin.id}")
+            params = cardholder_params(
+                name=f"{admin.first_name} {admin.last_name}",  # Use admin's full name for Stripe cardholder
+                email=admin.email,
+                phone_number=admin.phone_number,
+                address_line1=admin.address_line1,
+                city=admin.city,
+                state=admin.state,
+                postal_code=admin.postal_code,
+                date_of_birth=admin.date_of_birth,
+                full_legal_name={'first_name': admin.first_name, 'last_name': admin.last_name},
+                country=admin.country
+            )
+            cardholder = stripe_gateway.call('issuing.cardholders.create', params=params,
+                                             idempotency_key=cardholder_idempotency_key(group.provisioning_id, params))
+            admin.card_holder_id = cardholder.id
+        group.provisioning_status = 'cardholder_ready'
+        db.commit()
+        report_progress(50)
+
+        logger.info(f"Creating virtual card for group {group_id}")
+        card = stripe_gateway.call('issuing.cards.create', params=virtual_card_params(admin.card_holder_id),
+                                   idempotency_key=card_idempotency_key(group.provisioning_id))
+        group.virtual_card_id = card.id
+        group.virtual_card_last4 = card.last4
+        group.virtual_card_exp_month = card.exp_month
+        group.virtual_card_exp_year = card.exp_year
+        group.virtual_card_status = card.status
+        virtual_card = VirtualCard(virtual_card_id=card.id, group_id=group.id)
+        db.add(virtual_card)
+        db.flush()
+        # The admin becomes the first member once there is a card to be a member of
+        db.add(CardMember(card_id=virtual_card.id, user_id=admin.id))
+        group.provisioning_status = 'active'
+        group.provisioning_error = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        group.provisioning_status = 'failed'
+        group.provisioning_error = str(e)
+        db.commit()
+        provisioning_events.notify(group_id)
+        logger.error(f"Provisioning group {group_id} failed: {str(e)}")
+        raise
+
+    # The card may have been looked up, and cached as unknown, before it was stored
+    authorization_policies.invalidate_card(group.virtual_card_id)
+    principal_cache.invalidate(admin.id)
+    provisioning_events.notify(group_id)
+    logger.info(f"Group {group_id} provisioned with card {group.virtual_card_id}")
+    return {"group_id": group.id, "virtual_card_id": group.virtual_card_id}
+
+job_queue.register("provision_group", provision_group_job)
+
+def submit_provisioning(group_id: int, user_id: int) -> str:
+    """Queue the provision_group job for a group, returning the job ID.
+
+    Raises:
+        JobQueueFull: If the job queue has no room
+    """
+    return job_queue.submit("provision_group", user_id=user_id, payload={"group_id": group_id})
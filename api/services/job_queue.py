@@ -0,0 +1,167 @@
+import json
+import logging
+import queue
+import threading
+import uuid
+from datetime import datetime
+
+from api.config import get_settings
+from api.database import SessionLocal
+from api.models import Job
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Jobs in these states are picked up again when the queue starts after a restart
+UNFINISHED_STATUSES = ("queued", "running")
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs."""
+
+class JobQueue:
+    """In-process job queue backed by a fixed pool of worker threads.
+
+    Every job is recorded in the `jobs` table so clients can poll it and so
+    unfinished jobs are re-queued on start-up. Handlers are registered per
+    job kind and called as `handler(db, payload, report_progress)`; they must
+    be safe to re-run, and their return value is stored as the JSON result.
+    A job that was started `max_attempts` times without finishing, such as
+    one that takes the process down, is marked failed instead of run again.
+    """
+
+    def __init__(self, workers=2, max_pending=32, max_attempts=3, session_factory=SessionLocal):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.session_factory = session_factory
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._threads = []
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Re-queue jobs left unfinished by a previous process and start the workers."""
+        if self._threads:
+            return
+        db = self.session_factory()
+        try:
+            unfinished = db.query(Job).filter(Job.status.in_(UNFINISHED_STATUSES)).order_by(Job.created_at).all()
+            for job in unfinished:
+                job.status = "queued"
+                job.progress = 0
+            db.commit()
+            job_ids = [job.id for job in unfinished]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            # Recovered jobs bypass the pending limit so none are lost
+            self._queue.put((job_id, False))
+        if job_ids:
+            logger.info(f"Re-queued {len(job_ids)} unfinished jobs")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue started with {self.workers} workers")
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, kind, user_id, payload):
+        """Record a new job and queue it, returning its ID.
+
+        Raises:
+            JobQueueFull: If `max_pending` jobs are already queued or running
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull(f"Job queue is full ({self.max_pending} pending jobs)")
+        try:
+            job = Job(id=str(uuid.uuid4()), kind=kind, user_id=user_id, payload=json.dumps(payload))
+            db = self.session_factory()
+            try:
+                db.add(job)
+                db.commit()
+                job_id = job.id
+            finally:
+                db.close()
+        except Exception:
+            self._slots.release()
+            raise
+        self._queue.put((job_id, True))
+        logger.info(f"Queued {kind} job {job_id} for user {user_id}")
+        return job_id
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, holds_slot = item
+            try:
+                self._run(job_id)
+            except Exception as e:
+                # Keep the worker alive; the job is left unfinished and resumed on the next start
+                logger.error(f"Worker error on job {job_id}: {str(e)}")
+            finally:
+                if holds_slot:
+                    self._slots.release()
+
+    def _update(self, job_id, **fields):
+        db = self.session_factory()
+        try:
+            fields["updated_at"] = datetime.utcnow()
+            db.query(Job).filter(Job.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job_id):
+        db = self.session_factory()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job or job.status not in UNFINISHED_STATUSES:
+                return
+            if job.attempts >= self.max_attempts:
+                logger.error(f"Job {job_id} failed: gave up after {job.attempts} attempts")
+                job.status = "failed"
+                job.error = f"Gave up after {job.attempts} attempts"
+                job.updated_at = datetime.utcnow()
+                db.commit()
+                return
+            job.status = "running"
+            job.attempts += 1
+            db.commit()
+            kind, payload = job.kind, json.loads(job.payload or "{}")
+
+            def report_progress(percent):
+                self._update(job_id, progress=max(0, min(100, int(percent))))
+
+            logger.info(f"Running {kind} job {job_id}")
+            result = self._handlers[kind](db, payload, report_progress)
+            self._update(job_id, status="succeeded", progress=100, result=json.dumps(result))
+            logger.info(f"Job {job_id} succeeded")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            try:
+                self._update(job_id, status="failed", error=str(e))
+            except Exception as update_error:
+                logger.error(f"Could not mark job {job_id} failed: {str(update_error)}")
+        finally:
+            db.close()
+
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_pending=settings.JOB_QUEUE_MAX_PENDING,
+    max_attempts=settings.JOB_MAX_ATTEMPTS
+)
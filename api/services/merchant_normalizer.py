@@ -0,0 +1,141 @@
+"""Merchant normalization for statement descriptions.
+
+Bank exports describe one merchant many ways ("POS NETFLIX", "NETFLIX.COM
+123", "Netflix.com Dublin"). A precompiled ruleset strips payment-channel
+prefixes, card-processor noise, reference numbers and location suffixes to
+a canonical merchant name, and MerchantDirectory interns each name as a
+small integer id that detection groups by.
+
+Rules run as vectorized string operations over the distinct descriptions
+of a column only, and the directory remembers which id every description
+it has seen maps to, across uploads, so a description is normalized once
+per process.
+"""
+import logging
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from api.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Trailing "DD/MM ..." card-terminal noise stripped from descriptions
+DESCRIPTION_SUFFIX = re.compile(r'\s\d{2}/\d{2}.*$')
+
+# Payment-channel prefixes banks put in front of the merchant, possibly several
+CHANNEL_PREFIX = re.compile(
+    r'^(?:(?:POS|CARD PAYMENT(?: TO)?|CONTACTLESS|DIRECT DEBIT|D/D|DD|STO|VD[ACP])\b[\s\-:/]*)+'
+)
+# Card processors and marketplaces that prefix the merchant: "PAYPAL *NETFLIX", "SQ *CAFE"
+PROCESSOR_PREFIX = re.compile(r'^(?:PAYPAL|SQ|SUMUP|ZETTLE|IZ|SP|TST|GOOGLE|AMZN MKTP|AMZ)\s*[\*_]\s*')
+# Web addresses: "WWW.NETFLIX.COM 123" is NETFLIX, whatever follows the domain
+WEB_ADDRESS = re.compile(r'^WWW\.|\.(?:COM|CO\.UK|IE|NET|ORG|IO|EU)\b.*$')
+# Processor references glued on with "*" ("AMAZON*MK1234") and other punctuation
+REFERENCE = re.compile(r'\*\S*')
+PUNCTUATION = re.compile(r'[^A-Z0-9& ]+')
+# Trailing store and reference numbers: digit runs, and codes mixing letters and digits.
+# Only stripped after at least two name tokens, so "SHOP 123" and "SHOP 456" stay apart
+STORE_NUMBER = re.compile(r'(?:\s+(?:\d{2,}|(?=[A-Z]*\d)(?=\d*[A-Z])[A-Z0-9]{4,}))+$')
+NAMED = re.compile(r'[A-Z&][A-Z0-9&]*\s+\S')
+# Towns and countries card terminals append after the merchant. Two-letter country
+# codes are left out, since they end names too ("TOYS R US", "CAFE DE FR")
+LOCATIONS = (
+    r'DUBLIN|CORK|GALWAY|LIMERICK|WATERFORD|KILKENNY|SLIGO|ATHLONE|DROGHEDA|DUNDALK|'
+    r'BELFAST|LONDON|AMSTERDAM|LUXEMBOURG|LUX|IRL|IRELAND|GBR|NLD|USA'
+)
+LOCATION_SUFFIX = re.compile(rf'(?:\s+(?:{LOCATIONS}))+$')
+# A name that is only towns keeps them: "DUBLIN CORK" is not DUBLIN
+ONLY_LOCATIONS = re.compile(rf'(?:{LOCATIONS})(?:\s+(?:{LOCATIONS}))*')
+WHITESPACE = re.compile(r'\s+')
+
+def clean_descriptions(descriptions: pd.Series) -> pd.Series:
+    """Strip the card-terminal suffix from a column of raw descriptions, as preprocess_data did per row.
+
+    Only the column's distinct values are cleaned, then mapped back.
+    """
+    codes, uniques = pd.factorize(descriptions.astype(str), use_na_sentinel=False)
+    cleaned = pd.Series(uniques, dtype=object).str.replace(DESCRIPTION_SUFFIX, '', regex=True)
+    return pd.Series(cleaned.to_numpy()[codes], index=descriptions.index)
+
+def normalize_merchants(descriptions: pd.Series) -> pd.Series:
+    """Canonical merchant names for a column of cleaned descriptions.
+
+    Trailing store numbers are only dropped after a name of at least two
+    words, and trailing towns only when something other than a town is
+    left. A description the rules would reduce to nothing keeps its
+    upper-cased, whitespace-collapsed form.
+    """
+    upper = descriptions.astype(str).str.upper().str.strip()
+    names = upper
+    for pattern, replacement in (
+        (CHANNEL_PREFIX, ''),
+        (PROCESSOR_PREFIX, ''),
+        (WEB_ADDRESS, ' '),
+        (REFERENCE, ' '),
+        (PUNCTUATION, ' '),
+        (WHITESPACE, ' '),
+    ):
+        names = names.str.replace(pattern, replacement, regex=True)
+    names = names.str.strip()
+    unlocated = names.str.replace(LOCATION_SUFFIX, '', regex=True)
+    names = unlocated.where(~unlocated.str.fullmatch(ONLY_LOCATIONS), names)
+    numbered = names.str.replace(STORE_NUMBER, '', regex=True)
+    names = numbered.where(numbered.str.match(NAMED), names)
+    fallback = upper.str.replace(WHITESPACE, ' ', regex=True)
+    return names.where(names != '', fallback)
+
+class MerchantDirectory:
+    """Interned integer ids for canonical merchant names.
+
+    Ids are assigned in first-seen order and never change while the process
+    runs. The description -> id map is bounded by `max_descriptions` and
+    starts over when full; merchant names and ids are kept.
+    """
+
+    def __init__(self, max_descriptions=100_000):
+        self.max_descriptions = max_descriptions
+        self._ids = {}  # Canonical name -> id
+        self._names = []  # Id -> canonical name
+        self._by_description = {}  # Cleaned description -> id
+        self._lock = threading.Lock()
+
+    def name(self, merchant_id: int) -> str:
+        return self._names[merchant_id]
+
+    def id_for(self, description: str) -> int:
+        """The merchant id of one cleaned description, for row-at-a-time callers."""
+        merchant_id = self._by_description.get(description)
+        if merchant_id is None:
+            merchant_id = int(self.ids_for(pd.Series([description]))[0])
+        return merchant_id
+
+    def ids_for(self, descriptions: pd.Series) -> np.ndarray:
+        """Merchant ids for a column of cleaned descriptions, as an int64 array."""
+        codes, uniques = pd.factorize(descriptions.astype(str), use_na_sentinel=False)
+        ids = np.fromiter((self._by_description.get(d, -1) for d in uniques), dtype=np.int64, count=len(uniques))
+        missing = np.flatnonzero(ids < 0)
+        if len(missing):
+            unseen = uniques[missing]
+            names = normalize_merchants(pd.Series(unseen, dtype=object)).tolist()
+            with self._lock:
+                if len(self._by_description) + len(unseen) > self.max_descriptions:
+                    logger.info(f"Merchant description cache full at {len(self._by_description)} entries, starting over")
+                    self._by_description.clear()
+                for i, description, name in zip(missing, unseen, names):
+                    merchant_id = self._ids.get(name)
+                    if merchant_id is None:
+                        merchant_id = self._ids[name] = len(self._names)
+                        self._names.append(name)
+                    self._by_description[description] = merchant_id
+                    ids[i] = merchant_id
+        return ids[codes]
+
+    def canonical(self, description: str) -> str:
+        """The canonical merchant name of one cleaned description."""
+        return self.name(self.id_for(description))
+
+merchant_directory = MerchantDirectory(max_descriptions=settings.MERCHANT_CACHE_MAX_DESCRIPTIONS)
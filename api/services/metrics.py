@@ -0,0 +1,81 @@
+import bisect
+import threading
+
+# Bucket upper bounds in milliseconds; the last bucket catches everything slower
+DEFAULT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram that is cheap enough for hot paths.
+
+    `observe` is a bisect and two additions under a lock, so it can be called
+    on every request. Percentiles are estimated from the bucket counts and
+    reported as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, name, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.buckets_ms = tuple(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._count = 0
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms):
+        index = bisect.bisect_left(self.buckets_ms, elapsed_ms)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum_ms += elapsed_ms
+            if elapsed_ms > self._max_ms:
+                self._max_ms = elapsed_ms
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the `pct` percentile, or None if empty."""
+        with self._lock:
+            counts, total, max_ms = list(self._counts), self._count, self._max_ms
+        if not total:
+            return None
+        rank = total * pct / 100
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets_ms[index] if index < len(self.buckets_ms) else max_ms
+        return max_ms
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets_ms) + 1)
+            self._count = 0
+            self._sum_ms = 0.0
+            self._max_ms = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, sum_ms, max_ms = list(self._counts), self._count, self._sum_ms, self._max_ms
+        buckets = {f"le_{bound}": count for bound, count in zip(self.buckets_ms, counts)}
+        buckets["le_inf"] = counts[-1]
+        return {
+            "count": total,
+            "mean_ms": sum_ms / total if total else None,
+            "max_ms": max_ms if total else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": buckets
+        }
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+def get_histogram(name, buckets_ms=DEFAULT_BUCKETS_MS):
+    """Return the process-wide histogram called `name`, creating it on first use."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram(name, buckets_ms))
+    return histogram
+
+def snapshot_all():
+    return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
@@ -0,0 +1,62 @@
+"""Exact money arithmetic in integer minor units (cents) and basis points.
+
+Amounts are stored and summed as integers and only turned into major units
+(euros) for display. Shares are integer basis points, 10000 to the whole,
+and `allocate` splits an amount by them so the parts always add up to it.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+MINOR_UNITS = 100  # Cents per euro
+TOTAL_BASIS_POINTS = 10_000
+
+def to_minor(amount) -> int:
+    """Major units (e.g. 15.99 or "15.99") to minor units, rounding half away from zero."""
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_major(minor: int) -> float:
+    """Minor units to major units, for JSON responses and display."""
+    return minor / MINOR_UNITS
+
+def percent_to_bps(percent) -> int:
+    """A percentage such as 33.33 to basis points (3333)."""
+    return int((Decimal(str(percent)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def bps_to_percent(bps: int) -> float:
+    return bps / 100
+
+def allocate(amount: int, weights: Sequence[int]) -> List[int]:
+    """Split an integer amount in proportion to integer weights with the largest-remainder method.
+
+    Every part is the floor of its exact share, and the units left over go
+    one each to the parts with the largest fractional remainders (earlier
+    parts first on ties), so the parts sum to `amount` exactly and no part is
+    off from its exact share by a whole unit. Negative amounts (refunds) are
+    split like their absolute value.
+    """
+    total = sum(weights)
+    if total <= 0 or any(weight < 0 for weight in weights):
+        raise ValueError(f"Cannot allocate by weights {list(weights)}")
+    sign = -1 if amount < 0 else 1
+    amount = abs(amount)
+    parts = []
+    remainders = []
+    for i, weight in enumerate(weights):
+        part, remainder = divmod(amount * weight, total)
+        parts.append(part)
+        remainders.append((-remainder, i))
+    for _, i in sorted(remainders)[:amount - sum(parts)]:
+        parts[i] += 1
+    return [sign * part for part in parts]
+
+def to_minor_array(amounts: Iterable) -> np.ndarray:
+    """Vectorized `to_minor` for a column of major-unit amounts, as int64."""
+    values = np.asarray(amounts, dtype=np.float64)
+    # Scaled amounts sit within float error of a whole or half cent, so nudge before rounding half away from zero
+    return (np.sign(values) * np.floor(np.abs(values) * MINOR_UNITS + 0.5 + 1e-9)).astype(np.int64)
+
+def sum_minor(amounts: Iterable) -> int:
+    """Exact total, in minor units, of a column of major-unit amounts."""
+    return int(to_minor_array(amounts).sum())
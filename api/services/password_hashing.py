@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from api.config import get_settings
+from api.services.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Pinning min and max rounds to the configured cost makes passlib flag every
+# hash made with a different cost as needing an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+class HashingPoolBusy(Exception):
+    """Raised when the hashing pool already has its maximum number of calls queued."""
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+class PasswordHashingPool:
+    """Runs bcrypt in worker processes so it never blocks the event loop.
+
+    A process pool is used rather than threads because passlib's os_crypt
+    backend holds the GIL while it hashes. At most `max_queue` calls may be
+    waiting or running; beyond that calls fail at once with HashingPoolBusy
+    instead of queueing behind a login burst. With `workers=0` hashing runs
+    inline on the event loop. A pool broken by a worker process dying is
+    replaced and the call retried once. Every call's time, queueing
+    included, is recorded in the `password_hash` and `password_verify`
+    histograms.
+    """
+
+    def __init__(self, workers=2, max_queue=32):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = None
+        self._pending = 0
+
+    async def _run(self, name, fn, *args):
+        if self._pending >= self.max_queue:
+            raise HashingPoolBusy(f"Password hashing pool is full ({self.max_queue} pending calls)")
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            if not self.workers:
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                logger.warning(f"Password hashing pool broke during {name}; starting a new one")
+                if self._pool is pool:
+                    self._pool = None
+                    pool.shutdown(wait=False)
+                return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self._pending -= 1
+            get_histogram(f"password_{name}").observe((time.perf_counter() - started) * 1000)
+
+    def _get_pool(self):
+        # No lock needed: the pool is only created and replaced on the event loop thread
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify `password`, also returning a new hash if the stored one uses an outdated cost.
+
+        Returns:
+            Tuple[bool, Optional[str]]: Whether the password matched, and the
+            replacement hash or None if the stored hash is current
+        """
+        return await self._run("verify", _verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+hashing_pool = PasswordHashingPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
@@ -0,0 +1,67 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from api.config import get_settings
+from api.models import User
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class PrincipalCache:
+    """Short-lived cache of authenticated users, keyed by user ID and token version.
+
+    Holds the detached User that get_current_user loaded, with its real card
+    and card memberships, so a repeat request with the same token does not
+    touch the users table. Entries expire after `ttl_seconds` and are evicted
+    least recently used beyond `max_entries`. Routes that change a user's
+    profile, password, card or memberships call `invalidate`. The cache is
+    per process, so another worker can serve an entry for up to the TTL after
+    a change; revoking tokens by bumping `User.token_version` is enforced as
+    soon as that expires.
+    """
+
+    def __init__(self, ttl_seconds=60, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, token_version) -> (user, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, token_version: int) -> Optional[User]:
+        key = (user_id, token_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, user: User):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[(user.id, user.token_version)] = (user, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end((user.id, user.token_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids: int):
+        """Drop every cached entry for the given users, whatever their token version."""
+        user_ids = set(user_ids)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in user_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,172 @@
+"""Recurrence detection over columnar charge data.
+
+Charges are grouped into series by merchant and amount band: a merchant's
+amounts split into bands wherever one is more than AMOUNT_BAND_PERCENT
+above the next smaller, so a subscription whose price drifts stays one
+series. A drifting price is charged at one amount after another, so a band
+in which two amounts were each charged more than once over overlapping
+spans holds concurrent plans instead, and is split into one series per
+amount. Each series' gaps between consecutive charges are bucketed into
+the cadences below, and the bucket holding most of its gaps is its
+cadence. Everything up to the final list of subscriptions is done with
+array operations over the sorted columns, so the cost is the sorts plus a
+linear pass.
+
+A series is a subscription when enough of its gaps fall in its cadence's
+bucket and its confidence, the product of
+
+- the share of gaps in the cadence bucket,
+- the share of consecutive charges without a price change, and
+- gaps / (gaps + 1), which grows with the length of the history,
+
+reaches MIN_CONFIDENCE.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List
+
+import numpy as np
+
+from api.services.money import to_major
+
+@dataclass(frozen=True)
+class Cadence:
+    name: str
+    min_gap: int  # Days between charges, inclusive
+    max_gap: int
+    months: int  # Period used to project the next charge; 0 for weekly
+    min_charges: int
+
+CADENCES = (
+    Cadence("weekly", 5, 9, 0, 4),
+    Cadence("monthly", 25, 35, 1, 2),
+    Cadence("quarterly", 80, 100, 3, 2),
+    Cadence("annual", 350, 380, 12, 2),
+)
+# Longest gap any cadence accepts; one-off charges older than this can't start a series
+MAX_CADENCE_GAP = max(cadence.max_gap for cadence in CADENCES)
+
+AMOUNT_BAND_PERCENT = 20
+MIN_CADENCE_SHARE = 0.75
+MIN_CONFIDENCE = 0.4
+
+def cadence_index(gaps: np.ndarray) -> np.ndarray:
+    """Index into CADENCES of the bucket each gap falls in, or -1."""
+    index = np.full(len(gaps), -1, dtype=np.int64)
+    for i, cadence in enumerate(CADENCES):
+        index[(gaps >= cadence.min_gap) & (gaps <= cadence.max_gap)] = i
+    return index
+
+def add_months(day: date, months: int) -> date:
+    """Same date `months` later, clamped to month end like pd.DateOffset(months=months)."""
+    index = day.year * 12 + day.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+def next_charge(last: date, cadence: Cadence) -> date:
+    return add_months(last, cadence.months) if cadence.months else last + timedelta(days=7)
+
+def split_concurrent_plans(breaks: np.ndarray, amounts: np.ndarray, ordinals: np.ndarray) -> np.ndarray:
+    """Band breaks of charges sorted by merchant and amount, with bands holding concurrent plans split per amount."""
+    # Each band's exact amounts, a plan when charged more than once, with their first and last dates
+    plan_breaks = breaks.copy()
+    plan_breaks[1:] |= amounts[1:] != amounts[:-1]
+    starts = np.flatnonzero(plan_breaks)
+    bands = np.cumsum(breaks) - 1
+    repeated = np.diff(starts, append=len(amounts)) >= 2
+    plan_bands = bands[starts][repeated]
+    first_day = np.minimum.reduceat(ordinals, starts)[repeated]
+    last_day = np.maximum.reduceat(ordinals, starts)[repeated]
+
+    # In order of first charge within each band, a plan overlaps when it starts before an earlier one ended
+    order = np.lexsort((first_day, plan_bands))
+    plan_bands, first_day, last_day = plan_bands[order], first_day[order], last_day[order]
+    offset = int(last_day.max(initial=0)) + 1  # Keeps the running maximum of last days within each band
+    latest_end = np.maximum.accumulate(plan_bands * offset + last_day) - plan_bands * offset
+    overlaps = np.zeros(len(order), dtype=bool)
+    overlaps[1:] = (plan_bands[1:] == plan_bands[:-1]) & (first_day[1:] <= latest_end[:-1])
+    concurrent = np.zeros(int(bands[-1]) + 1, dtype=bool)
+    concurrent[plan_bands[overlaps]] = True
+    return np.where(concurrent[bands], plan_breaks, breaks)
+
+def detect_recurrences(merchants: np.ndarray, amounts: np.ndarray, ordinals: np.ndarray, descriptions) -> List[dict]:
+    """Find recurring series in parallel columns of charges.
+
+    Args:
+        merchants: Merchant id of each charge
+        amounts: Amount of each charge in minor units
+        ordinals: Date of each charge as a proleptic Gregorian ordinal
+        descriptions: Description of each charge; a series shows its latest
+
+    Returns:
+        List[dict]: Subscriptions with Description, Amount (the latest
+        price), Dates, Estimated_Next, plus Amounts parallel to Dates,
+        Cadence and Confidence, ordered by description and amount
+    """
+    if len(merchants) == 0:
+        return []
+    merchants = np.asarray(merchants, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.int64)
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+
+    # Amount bands: sorted by merchant and amount, a band ends at a merchant change or a jump,
+    # and a band of concurrent plans at every amount
+    order = np.lexsort((amounts, merchants))
+    m, a = merchants[order], amounts[order]
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (m[1:] != m[:-1]) | (np.abs(a[1:]) * 100 > np.abs(a[:-1]) * (100 + AMOUNT_BAND_PERCENT))
+    breaks = split_concurrent_plans(breaks, a, ordinals[order])
+    bands = np.empty(len(order), dtype=np.int64)
+    bands[order] = np.cumsum(breaks) - 1
+
+    # Each band's charges in date order, and the gaps between them
+    order = np.lexsort((ordinals, bands))
+    b, d, a = bands[order], ordinals[order], amounts[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = b[1:] != b[:-1]
+    gaps = np.diff(d, prepend=d[0])
+    price_changes = np.zeros(len(order), dtype=bool)
+    price_changes[1:] = a[1:] != a[:-1]
+    price_changes &= ~first
+
+    # Interval histogram per band: how many of its gaps fall in each cadence's bucket
+    buckets = cadence_index(gaps)
+    buckets[first] = -1
+    n_bands = int(b[-1]) + 1
+    counted = buckets >= 0
+    histogram = np.bincount(
+        b[counted] * len(CADENCES) + buckets[counted], minlength=n_bands * len(CADENCES)
+    ).reshape(n_bands, len(CADENCES))
+    cadence = histogram.argmax(axis=1)
+    hits = histogram.max(axis=1)
+
+    charges = np.bincount(b, minlength=n_bands)
+    gap_count = np.maximum(charges - 1, 1)
+    share = hits / gap_count
+    stability = 1 - np.bincount(b, weights=price_changes, minlength=n_bands) / gap_count
+    confidence = share * stability * (charges - 1) / charges
+    min_charges = np.array([c.min_charges for c in CADENCES])[cadence]
+    recurring = np.flatnonzero(
+        (charges >= min_charges) & (hits > 0) & (share >= MIN_CADENCE_SHARE) & (confidence >= MIN_CONFIDENCE)
+    )
+
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(order))
+    subscriptions = []
+    for band in recurring:
+        start, end = starts[band], ends[band]
+        dates = [date.fromordinal(int(ordinal)) for ordinal in d[start:end]]
+        band_amounts = [to_major(int(amount)) for amount in a[start:end]]
+        band_cadence = CADENCES[cadence[band]]
+        subscriptions.append({
+            "Description": descriptions[order[end - 1]],
+            "Amount": band_amounts[-1],
+            "Dates": [day.strftime('%Y-%m-%d') for day in dates],
+            "Estimated_Next": next_charge(dates[-1], band_cadence).strftime('%Y-%m-%d'),
+            "Amounts": band_amounts,
+            "Cadence": band_cadence.name,
+            "Confidence": round(float(confidence[band]), 2)
+        })
+    subscriptions.sort(key=lambda sub: (sub["Description"], sub["Amount"]))
+    return subscriptions
@@ -0,0 +1,179 @@
+"""Persisted subscription charges and the monthly spend rollup built from them.
+
+Every charge of a detected subscription is stored as a SubscriptionCharge
+row when its statement is processed, and MonthlySpend keeps one row per
+user, merchant and month with the total of those charges. Only the
+(merchant, month) keys an upload touches are recomputed, so spend queries
+read a handful of rollup rows instead of re-parsing statements.
+"""
+import logging
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from api.models import MonthlySpend, SubscriptionCharge
+from api.services.merchant_normalizer import merchant_directory
+from api.services.money import to_minor
+
+logger = logging.getLogger(__name__)
+
+def merchant_key(description: str) -> str:
+    """The key charges are grouped by: the description's canonical merchant name."""
+    return merchant_directory.canonical(description)
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def months_back(day: date, months: int) -> date:
+    """First day of the month `months - 1` months before `day`'s, so the range holds `months` months."""
+    index = day.year * 12 + day.month - months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _insert(dialect_name: str):
+    if dialect_name == "postgresql":
+        return postgresql.insert(SubscriptionCharge)
+    return sqlite.insert(SubscriptionCharge)
+
+def _charge_rows(user_id: int, file_id: int, subscriptions: Iterable[dict]) -> List[dict]:
+    rows = {}
+    for sub in subscriptions:
+        merchant = merchant_key(sub["Description"])
+        for charged, amount in zip(sub["Dates"], sub["Amounts"]):
+            charged_on = datetime.strptime(charged, "%Y-%m-%d").date()
+            amount_minor = to_minor(amount)
+            rows[(merchant, charged_on, amount_minor)] = {
+                "merchant": merchant,
+                "description": sub["Description"],
+                "amount_minor": amount_minor,
+                "charged_on": charged_on,
+                "month": month_start(charged_on),
+                "user_id": user_id,
+                "file_id": file_id
+            }
+    return list(rows.values())
+
+def record_charges(db: Session, user_id: int, file_id: int, subscriptions: Iterable[dict]) -> int:
+    """Make the user's charges those of `subscriptions` and refresh the rollup.
+
+    `subscriptions` are parser results (Description, Dates and the Amounts
+    charged on them) detected over all of the user's statements, so a charge
+    belongs to the user rather than to a statement: stored charges no longer
+    detected are deleted whichever statement recorded them, charges already
+    stored are kept as they are, so overlapping statements count each charge
+    once, and new ones are stored against `file_id`. Committing is left to the
+    caller so an upload is stored in one transaction.
+
+    Returns:
+        int: The number of charges in `subscriptions`
+    """
+    rows = _charge_rows(user_id, file_id, subscriptions)
+    found = {(row["merchant"], row["charged_on"], row["amount_minor"]) for row in rows}
+    stored = db.execute(
+        select(SubscriptionCharge.id, SubscriptionCharge.merchant, SubscriptionCharge.charged_on,
+               SubscriptionCharge.amount_minor, SubscriptionCharge.month)
+        .filter(SubscriptionCharge.user_id == user_id)
+    ).all()
+    stale = [charge for charge in stored if (charge.merchant, charge.charged_on, charge.amount_minor) not in found]
+    known = {(charge.merchant, charge.charged_on, charge.amount_minor) for charge in stored}
+    new_rows = [row for row in rows if (row["merchant"], row["charged_on"], row["amount_minor"]) not in known]
+    touched = {(charge.merchant, charge.month) for charge in stale}
+    touched.update((row["merchant"], row["month"]) for row in new_rows)
+
+    if stale:
+        db.execute(delete(SubscriptionCharge).where(SubscriptionCharge.id.in_([charge.id for charge in stale])))
+    if new_rows:
+        db.execute(_insert(db.get_bind().dialect.name).on_conflict_do_nothing(), new_rows)
+    refresh_rollup(db, user_id, touched)
+    logger.info(f"Recorded {len(new_rows)} new and deleted {len(stale)} stale charges for user {user_id} "
+                f"from file {file_id} ({len(touched)} rollup keys refreshed)")
+    return len(rows)
+
+def refresh_rollup(db: Session, user_id: int, keys: Set[Tuple[str, date]]):
+    """Recompute the MonthlySpend rows of a user's (merchant, month) keys from their charges."""
+    if not keys:
+        return
+    merchants = {merchant for merchant, _ in keys}
+    months = {month for _, month in keys}
+    totals = db.execute(
+        select(SubscriptionCharge.merchant, SubscriptionCharge.month, func.min(SubscriptionCharge.description),
+               func.sum(SubscriptionCharge.amount_minor), func.count(SubscriptionCharge.id))
+        .filter(
+            SubscriptionCharge.user_id == user_id,
+            SubscriptionCharge.merchant.in_(merchants),
+            SubscriptionCharge.month.in_(months)
+        )
+        .group_by(SubscriptionCharge.merchant, SubscriptionCharge.month)
+    ).all()
+
+    db.execute(delete(MonthlySpend).where(
+        MonthlySpend.user_id == user_id,
+        MonthlySpend.merchant.in_(merchants),
+        MonthlySpend.month.in_(months)
+    ))
+    db.add_all(
+        MonthlySpend(user_id=user_id, merchant=merchant, month=month, description=description,
+                     total_minor=total_minor, charges=charges)
+        for merchant, month, description, total_minor, charges in totals
+    )
+    db.flush()
+
+def spent_since(db: Session, user_id: int, since: date, description: Optional[str] = None,
+                amount_minor: Optional[int] = None) -> int:
+    """A user's subscription spend, in minor units, charged on or after `since`.
+
+    Months after the one containing `since` are read from the rollup and the
+    part of that first month from the charges themselves. Narrowed to one
+    description and amount, the charges are summed directly through the
+    (user, merchant, date) index.
+    """
+    if description is not None:
+        query = select(func.coalesce(func.sum(SubscriptionCharge.amount_minor), 0)).filter(
+            SubscriptionCharge.user_id == user_id,
+            SubscriptionCharge.merchant == merchant_key(description),
+            SubscriptionCharge.charged_on >= since
+        )
+        if amount_minor is not None:
+            query = query.filter(SubscriptionCharge.amount_minor == amount_minor)
+        return db.execute(query).scalar()
+
+    first_month = month_start(since)
+    whole_months = db.execute(select(func.coalesce(func.sum(MonthlySpend.total_minor), 0)).filter(
+        MonthlySpend.user_id == user_id,
+        MonthlySpend.month > first_month
+    )).scalar()
+    partial_month = db.execute(select(func.coalesce(func.sum(SubscriptionCharge.amount_minor), 0)).filter(
+        SubscriptionCharge.user_id == user_id,
+        SubscriptionCharge.charged_on >= since,
+        SubscriptionCharge.charged_on < _next_month(first_month)
+    )).scalar()
+    return whole_months + partial_month
+
+def spend_by_month(db: Session, user_id: int, since_month: date) -> List[dict]:
+    """Totals per month from `since_month` on, oldest first."""
+    rows = db.execute(
+        select(MonthlySpend.month, func.sum(MonthlySpend.total_minor), func.sum(MonthlySpend.charges))
+        .filter(MonthlySpend.user_id == user_id, MonthlySpend.month >= since_month)
+        .group_by(MonthlySpend.month)
+        .order_by(MonthlySpend.month)
+    ).all()
+    return [{"month": month, "total_minor": total_minor, "charges": charges} for month, total_minor, charges in rows]
+
+def spend_by_merchant(db: Session, user_id: int, since_month: date) -> List[dict]:
+    """Totals per merchant from `since_month` on, largest first."""
+    total = func.sum(MonthlySpend.total_minor)
+    rows = db.execute(
+        select(MonthlySpend.merchant, func.min(MonthlySpend.description), total, func.sum(MonthlySpend.charges))
+        .filter(MonthlySpend.user_id == user_id, MonthlySpend.month >= since_month)
+        .group_by(MonthlySpend.merchant)
+        .order_by(total.desc(), MonthlySpend.merchant)
+    ).all()
+    return [
+        {"merchant": merchant, "description": description, "total_minor": total_minor, "charges": charges}
+        for merchant, description, total_minor, charges in rows
+    ]
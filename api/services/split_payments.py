@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import stripe
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from api.config import get_settings
+from api.database import SessionLocal
+from api.models import Payment, RealCard, User
+from api.services.stripe_gateway import stripe_gateway
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Stripe would give the same answer to a retry of these, so the leg fails at once
+PERMANENT_ERRORS = (
+    stripe.error.CardError,
+    stripe.error.InvalidRequestError,
+    stripe.error.AuthenticationError,
+    stripe.error.PermissionError,
+    stripe.error.IdempotencyError,
+)
+
+def idempotency_key(authorization_id: str, user_id: int) -> str:
+    return f"split-{authorization_id}-{user_id}"
+
+class SplitPaymentExecutor:
+    """Charges each member's share of an authorization through a bounded thread pool.
+
+    Every leg is first recorded in the `payments` ledger, then charged with an
+    idempotency key derived from the authorization and member, so neither a
+    redelivered webhook nor a retry can charge anyone twice. Legs that fail
+    with a transient error are retried in the background with exponential
+    backoff, up to `max_attempts`, and pending legs are resumed on start-up.
+    The first attempt charges the payment methods it is given (the card's
+    split plan); retries and resumed legs look the member's up again.
+    """
+
+    def __init__(self, workers=8, max_attempts=5, retry_seconds=2.0, session_factory=SessionLocal):
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.session_factory = session_factory
+        self.workers = workers
+        self._pool = None
+        self._timers = set()
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def record(self, db: Session, authorization_id: str, currency: str, group_id: int,
+               legs: Iterable[Tuple[int, int]]) -> List[int]:
+        """Add a pending ledger row for each (user_id, amount) leg not recorded yet.
+
+        Committing is left to the caller. Returns the IDs of every leg of the
+        authorization, including ones recorded by an earlier delivery.
+        """
+        existing = {
+            payment.user_id: payment
+            for payment in db.query(Payment).filter(Payment.authorization_id == authorization_id)
+        }
+        for user_id, amount in legs:
+            if user_id in existing:
+                continue
+            payment = Payment(
+                authorization_id=authorization_id,
+                user_id=user_id,
+                group_id=group_id,
+                amount=amount,
+                currency=currency,
+                idempotency_key=idempotency_key(authorization_id, user_id)
+            )
+            db.add(payment)
+            existing[user_id] = payment
+        db.flush()
+        return [payment.id for payment in existing.values()]
+
+    async def dispatch(self, payment_ids: Iterable[int],
+                       payment_methods: Optional[Dict[int, Tuple[Optional[str], str]]] = None) -> dict:
+        """Make the first attempt at every leg concurrently and wait for the outcomes.
+
+        Args:
+            payment_ids: Ledger rows to charge
+            payment_methods: (customer_id, payment_method_id) by user ID, as
+                given by SplitPlan.payment_methods; members left out are
+                looked up
+
+        Returns:
+            dict: Status of each payment ID after its first attempt; legs that
+            will be retried are still "pending"
+        """
+        payment_ids = list(payment_ids)
+        outcomes = await asyncio.gather(*(
+            asyncio.wrap_future(self._submit(payment_id, payment_methods))
+            for payment_id in payment_ids
+        ))
+        return dict(zip(payment_ids, outcomes))
+
+    def charge(self, payment_ids: Iterable[int],
+               payment_methods: Optional[Dict[int, Tuple[Optional[str], str]]] = None) -> dict:
+        """Blocking variant of `dispatch`, for callers on worker threads."""
+        futures = {payment_id: self._submit(payment_id, payment_methods) for payment_id in payment_ids}
+        return {payment_id: future.result() for payment_id, future in futures.items()}
+
+    def start(self):
+        """Resume legs left pending by a previous process."""
+        db = self.session_factory()
+        try:
+            pending = [payment_id for (payment_id,) in db.query(Payment.id).filter(Payment.status == 'pending')]
+        finally:
+            db.close()
+        for payment_id in pending:
+            self._submit(payment_id)
+        if pending:
+            logger.info(f"Resumed {len(pending)} pending split payments")
+
+    def shutdown(self):
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+    def _submit(self, payment_id, payment_methods=None):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="split-payment")
+            return self._pool.submit(self._attempt, payment_id, payment_methods or {})
+
+    def _schedule_retry(self, payment_id, attempts):
+        delay = self.retry_seconds * 2 ** (attempts - 1)
+        timer = threading.Timer(delay, self._retry, [payment_id])
+        timer.daemon = True
+        with self._lock:
+            self._timers.add(timer)
+        timer.start()
+        logger.info(f"Retrying split payment {payment_id} in {delay:.1f}s")
+
+    def _retry(self, payment_id):
+        with self._lock:
+            # Runs on the timer's own thread
+            self._timers.discard(threading.current_thread())
+        self._submit(payment_id)
+
+    def _attempt(self, payment_id, payment_methods) -> str:
+        with self._lock:
+            if payment_id in self._inflight:
+                return 'pending'
+            self._inflight.add(payment_id)
+        db = self.session_factory()
+        try:
+            payment = db.query(Payment).filter(Payment.id == payment_id).first()
+            if not payment or payment.status != 'pending':
+                return payment.status if payment else 'failed'
+            payment_method = payment_methods.get(payment.user_id) or self._payment_method(db, payment.user_id)
+            return self._charge(db, payment, payment_method)
+        finally:
+            db.close()
+            with self._lock:
+                self._inflight.discard(payment_id)
+
+    @staticmethod
+    def _payment_method(db: Session, user_id: int) -> Optional[Tuple[Optional[str], str]]:
+        """A member's (customer_id, payment_method_id), or None without a real card."""
+        return db.execute(
+            select(User.stripe_customer_id, RealCard.stripe_payment_method_id)
+            .join(RealCard, RealCard.id == User.real_card_id)
+            .filter(User.id == user_id)
+        ).first()
+
+    def _charge(self, db: Session, payment: Payment, payment_method: Optional[Tuple[Optional[str], str]]) -> str:
+        payment.attempts += 1
+        payment.updated_at = datetime.utcnow()
+        if not payment_method or not payment_method[1]:
+            payment.status = 'failed'
+            payment.error = f"No valid payment method for user {payment.user_id}"
+            db.commit()
+            logger.error(f"Split payment {payment.id} failed: {payment.error}")
+            return payment.status
+
+        customer_id, payment_method_id = payment_method
+        try:
+            # Create a PaymentIntent with the specific payment method. Retries are
+            # scheduled here against the ledger, so the gateway makes a single attempt
+            payment_intent = stripe_gateway.call('payment_intents.create', params={
+                'amount': payment.amount,  # amount in cents
+                'currency': payment.currency,  # Use same currency as authorization
+                'customer': customer_id,
+                'payment_method': payment_method_id,
+                'payment_method_types': ['card'],  # Explicitly only allow card payments
+                'confirm': True,  # Confirm the payment immediately
+                'off_session': True,  # Indicate this is a background payment
+                'description': f'Split payment for authorization {payment.authorization_id}',
+                'metadata': {
+                    'authorization_id': payment.authorization_id,
+                    'user_id': payment.user_id
+                }
+            }, idempotency_key=payment.idempotency_key, max_retries=0)
+        except Exception as e:
+            payment.error = str(e)
+            retry = not isinstance(e, PERMANENT_ERRORS) and payment.attempts < self.max_attempts
+            if not retry:
+                payment.status = 'failed'
+            db.commit()
+            logger.error(f"Failed to charge user {payment.user_id} for authorization {payment.authorization_id} "
+                         f"(attempt {payment.attempts}): {str(e)}")
+            if retry:
+                self._schedule_retry(payment.id, payment.attempts)
+            return payment.status
+
+        payment.status = 'succeeded'
+        payment.payment_intent_id = payment_intent.id
+        payment.error = None
+        db.commit()
+        logger.info(f"Successfully charged user {payment.user_id} amount {payment.amount} "
+                    f"for authorization {payment.authorization_id}")
+        return payment.status
+
+split_payments = SplitPaymentExecutor(
+    workers=settings.SPLIT_PAYMENT_WORKERS,
+    max_attempts=settings.SPLIT_PAYMENT_MAX_ATTEMPTS,
+    retry_seconds=settings.SPLIT_PAYMENT_RETRY_SECONDS
+)
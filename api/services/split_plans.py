@@ -0,0 +1,121 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+
+from api.models import CardMember, GroupMemberRatio, RealCard, User, VirtualCard
+from api.services.money import TOTAL_BASIS_POINTS, allocate
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class SplitPlan:
+    """Who pays what share of an authorization on one virtual card.
+
+    The tuples are parallel and ordered by user ID; only members with a real
+    card are included. Shares are integer basis points.
+    """
+    card_id: str
+    group_id: int
+    user_ids: Tuple[int, ...]
+    payment_method_ids: Tuple[str, ...]
+    customer_ids: Tuple[Optional[str], ...]
+    basis_points: Tuple[int, ...]
+
+    def legs(self, amount: int) -> List[Tuple[int, int]]:
+        """(user_id, amount) for each payer, adding up to `amount` by largest remainder."""
+        return list(zip(self.user_ids, allocate(amount, self.basis_points)))
+
+    def payment_methods(self) -> Dict[int, Tuple[Optional[str], str]]:
+        """(customer_id, payment_method_id) of each payer, by user ID."""
+        return dict(zip(self.user_ids, zip(self.customer_ids, self.payment_method_ids)))
+
+def _plan_query(card_id: str):
+    return (
+        select(VirtualCard.group_id, User.id, RealCard.stripe_payment_method_id, User.stripe_customer_id,
+               GroupMemberRatio.ratio_bps)
+        .select_from(VirtualCard)
+        .join(CardMember, CardMember.card_id == VirtualCard.id)
+        .join(User, User.id == CardMember.user_id)
+        .join(RealCard, RealCard.id == User.real_card_id)
+        .outerjoin(GroupMemberRatio, and_(
+            GroupMemberRatio.group_id == VirtualCard.group_id,
+            GroupMemberRatio.user_id == User.id
+        ))
+        .filter(VirtualCard.virtual_card_id == card_id)
+        .order_by(User.id)
+    )
+
+def build_plan(db: Session, card_id: str) -> Optional[SplitPlan]:
+    """Load a card's SplitPlan with one query, or None if nobody can pay for it.
+
+    Members get their group ratio. When no payer has one the charge is split
+    equally; otherwise payers without a ratio (or with a zero one) are left out.
+    """
+    rows = db.execute(_plan_query(card_id)).all()
+    if any(row.ratio_bps for row in rows):
+        rows = [row for row in rows if row.ratio_bps]
+        basis_points = [row.ratio_bps for row in rows]
+    elif rows:
+        basis_points = allocate(TOTAL_BASIS_POINTS, [1] * len(rows))
+    if not rows:
+        return None
+    return SplitPlan(
+        card_id=card_id,
+        group_id=rows[0].group_id,
+        user_ids=tuple(row.id for row in rows),
+        payment_method_ids=tuple(row.stripe_payment_method_id for row in rows),
+        customer_ids=tuple(row.stripe_customer_id for row in rows),
+        basis_points=tuple(basis_points)
+    )
+
+class SplitPlanCache:
+    """In-memory map from Stripe card ID to its SplitPlan.
+
+    A plan is built on the first authorization on its card and kept until the
+    group's membership or ratios, or a member's real card, change; the routes
+    making those changes call `invalidate_group` or `invalidate_user`. Cards
+    without a plan are not cached, so a card that gains payers is picked up
+    straight away.
+    """
+
+    def __init__(self):
+        self._plans = {}  # card_id -> SplitPlan
+        self._generation = 0  # Bumped by every invalidation
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, card_id: str) -> Optional[SplitPlan]:
+        plan = self._plans.get(card_id)
+        if plan is not None:
+            return plan
+        generation = self._generation
+        plan = build_plan(db, card_id)
+        with self._lock:
+            # A plan built while it was being invalidated may already be stale
+            if plan is not None and generation == self._generation:
+                self._plans[card_id] = plan
+        return plan
+
+    def invalidate_group(self, group_id: int):
+        with self._lock:
+            self._generation += 1
+            for card_id, plan in list(self._plans.items()):
+                if plan.group_id == group_id:
+                    del self._plans[card_id]
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generation += 1
+            for card_id, plan in list(self._plans.items()):
+                if user_id in plan.user_ids:
+                    del self._plans[card_id]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._plans.clear()
+
+split_plans = SplitPlanCache()
@@ -0,0 +1,83 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List
+
+from api.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+class StatementParsePool:
+    """Parses a batch of statements in worker processes, one file per task.
+
+    Reading workbooks and cleaning their rows is CPU-bound Python, so a
+    process pool is used rather than threads to put every core to work. A
+    batch of one file, or a pool with `workers=0`, is parsed in the calling
+    thread. The pool is started on first use, under a lock since job worker
+    threads share it. A worker process that dies breaks the whole pool: the
+    files it took down are reported as errors and the next batch starts a
+    new pool.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def map(self, fn: Callable, file_paths: List[str]) -> List:
+        """Apply `fn` to every file, returning its result or the exception it raised, in input order."""
+        if not self.workers or len(file_paths) < 2:
+            return [self._call(fn, file_path) for file_path in file_paths]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            pool = self._pool
+        futures = []
+        for file_path in file_paths:
+            try:
+                futures.append(pool.submit(fn, file_path))
+            except BrokenProcessPool as e:
+                self._discard(pool)
+                futures.append(e)
+        results = []
+        for file_path, future in zip(file_paths, futures):
+            if isinstance(future, BrokenProcessPool):
+                logger.error(f"Could not parse {file_path}: {str(future)}")
+                results.append(future)
+                continue
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                self._discard(pool)
+                logger.error(f"Could not parse {file_path}: {str(e)}")
+                results.append(e)
+            except Exception as e:
+                logger.warning(f"Could not parse {file_path}: {str(e)}")
+                results.append(e)
+        return results
+
+    def _discard(self, pool):
+        """Drop a broken pool so the next batch starts a new one."""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False)
+
+    @staticmethod
+    def _call(fn, file_path):
+        try:
+            return fn(file_path)
+        except Exception as e:
+            logger.warning(f"Could not parse {file_path}: {str(e)}")
+            return e
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+statement_parse_pool = StatementParsePool(workers=settings.STATEMENT_PARSE_WORKERS)
@@ -0,0 +1,370 @@
+"""Statement rows stored once at ingest, and subscription detection over them.
+
+Processing a statement streams its rows into statement_transactions with
+the date, cleaned description, amount and balance. Each row carries a
+fingerprint of its raw cells and its occurrence among identical rows that
+day, so a re-uploaded or overlapping statement adds only the rows not seen
+before. Analytics then read a user's ledger from the database instead of
+parsing workbooks again, and a statement's own views only the rows stored
+from it.
+
+A batch of statements is parsed across a process pool and merged into one
+set of rows before detection runs once.
+
+Subscriptions are detected per merchant and the result kept in
+merchant_recurrences, so a statement that adds rows for a few merchants
+re-detects only those. Rows are flagged once a detection run has seen
+them, whatever order concurrent jobs commit them in.
+"""
+import hashlib
+import json
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, distinct, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from api.config import get_settings
+from api.models import MerchantRecurrence, StatementTransaction, User
+from api.services.merchant_normalizer import merchant_directory
+from api.services.money import to_minor
+from api.services.recurrence import detect_recurrences
+from api.services.statement_pool import statement_parse_pool
+from api.services.subscription_parser import DETECTOR_VERSION, iter_statement_transactions, parse_cache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+def row_fingerprint(posted_on, raw_description: str, amount_minor: int, balance_minor, occurrence: int) -> str:
+    key = f"{posted_on.isoformat()}|{raw_description}|{amount_minor}|{balance_minor}|{occurrence}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+# Changed merchants are read back this many to a query
+MERCHANT_BATCH = 500
+
+def _insert(dialect_name: str, model=StatementTransaction):
+    if dialect_name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def statement_rows(file_path: str) -> Iterator[dict]:
+    """Stream a statement's rows as statement_transactions values, without the user and file.
+
+    Identical rows on one day are told apart by their order within the day,
+    which assumes a statement lists a day's rows together, as bank exports do.
+    """
+    occurrences = {}
+    current_day = None
+    for posted_on, raw_description, description, amount, balance in iter_statement_transactions(file_path):
+        amount_minor = to_minor(amount)
+        balance_minor = None if balance is None else to_minor(balance)
+        if posted_on != current_day:
+            occurrences.clear()
+            current_day = posted_on
+        key = (raw_description, amount_minor, balance_minor)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+
+        yield {
+            "fingerprint": row_fingerprint(posted_on, raw_description, amount_minor, balance_minor, occurrence),
+            "posted_on": posted_on,
+            "description": description,
+            "merchant": merchant_directory.canonical(description),
+            "amount_minor": amount_minor,
+            "balance_minor": balance_minor
+        }
+
+def read_statement_rows(file_path: str) -> List[dict]:
+    """All of a statement's rows; runs in the parse pool's worker processes."""
+    return list(statement_rows(file_path))
+
+def _store_rows(db: Session, user_id: int, file_id: int, rows: Iterable[dict]) -> Tuple[int, int]:
+    """Insert rows for a user's statement in batches, skipping rows already stored.
+
+    Returns:
+        Tuple[int, int]: Rows given, and rows of the file now stored
+    """
+    statement = _insert(db.get_bind().dialect.name).on_conflict_do_nothing()
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(dict(row, user_id=user_id, file_id=file_id))
+        count += 1
+        if len(batch) >= settings.STATEMENT_INGEST_BATCH_ROWS:
+            db.execute(statement, batch)
+            batch = []
+    if batch:
+        db.execute(statement, batch)
+
+    stored = db.execute(
+        select(func.count(StatementTransaction.id)).filter(StatementTransaction.file_id == file_id)
+    ).scalar()
+    logger.info(f"Ingested {count} rows from file {file_id} for user {user_id} ({stored} stored from this file)")
+    return count, stored
+
+def ingest_statement(db: Session, user_id: int, file_id: int, file_path: str) -> Tuple[int, int]:
+    """Store a statement's rows for a user, skipping rows already stored.
+
+    Rows are streamed from the file and inserted in batches, so memory use
+    does not grow with the statement. Committing is left to the caller so an
+    upload is stored in one transaction.
+
+    Returns:
+        Tuple[int, int]: Rows read from the file, and rows stored from it
+    """
+    return _store_rows(db, user_id, file_id, statement_rows(file_path))
+
+def ingest_statements(db: Session, user_id: int, statements: List[Tuple[int, str]]) -> List[dict]:
+    """Store the rows of a batch of (file id, path) statements for a user.
+
+    The files are parsed in parallel across the statement parse pool, then
+    merged in batch order into one set of rows: a row already taken from an
+    earlier file of the batch, as overlapping exports share, is stored with
+    that file only. A file that fails to parse is reported and the rest are
+    stored. Unlike ingest_statement each file's rows are held in memory, so
+    this suits monthly exports rather than very large statements. Committing
+    is left to the caller.
+
+    Returns:
+        List[dict]: Per file, in input order, its `rows` and `stored_rows`,
+        or the `error` that stopped it parsing
+    """
+    results = []
+    seen = set()
+    parsed = statement_parse_pool.map(read_statement_rows, [file_path for _, file_path in statements])
+    for (file_id, file_path), rows in zip(statements, parsed):
+        if isinstance(rows, Exception):
+            results.append({"error": str(rows) or type(rows).__name__})
+            continue
+        new_rows = [row for row in rows if row["fingerprint"] not in seen]
+        seen.update(row["fingerprint"] for row in new_rows)
+        _, stored = _store_rows(db, user_id, file_id, new_rows)
+        results.append({"rows": len(rows), "stored_rows": stored})
+    return results
+
+def has_transactions(db: Session, file_id: int) -> bool:
+    """Whether any rows are stored from a statement; statements processed before ingest existed have none."""
+    return db.execute(
+        select(StatementTransaction.id).filter(StatementTransaction.file_id == file_id).limit(1)
+    ).first() is not None
+
+def _ledger_version(db: Session, user_id: int) -> str:
+    count, last_id = db.execute(
+        select(func.count(StatementTransaction.id), func.max(StatementTransaction.id))
+        .filter(StatementTransaction.user_id == user_id)
+    ).one()
+    return f"{count}-{last_id}.{DETECTOR_VERSION}"
+
+def _assign_merchants(db: Session, user_id: int):
+    """Name the merchant of a user's rows stored before merchants were, or named by older rules.
+
+    Names are worked out once per distinct description and written with one
+    UPDATE per merchant, touching only rows whose name changes.
+    """
+    descriptions = db.execute(
+        select(distinct(StatementTransaction.description)).filter(StatementTransaction.user_id == user_id)
+    ).scalars().all()
+    if not descriptions:
+        return
+    by_merchant = {}
+    ids = merchant_directory.ids_for(pd.Series(descriptions, dtype=object))
+    for description, merchant_id in zip(descriptions, ids):
+        by_merchant.setdefault(merchant_directory.name(merchant_id), []).append(description)
+    renamed = 0
+    for merchant, merchant_descriptions in by_merchant.items():
+        for start in range(0, len(merchant_descriptions), MERCHANT_BATCH):
+            renamed += db.execute(
+                update(StatementTransaction)
+                .where(
+                    StatementTransaction.user_id == user_id,
+                    StatementTransaction.description.in_(merchant_descriptions[start:start + MERCHANT_BATCH]),
+                    StatementTransaction.merchant.is_distinct_from(merchant)
+                )
+                .values(merchant=merchant)
+            ).rowcount
+    if renamed:
+        logger.info(f"Named the merchant of {renamed} stored rows for user {user_id}")
+
+def _merchant_debits(db: Session, user_id: int, merchants: Optional[List[str]]):
+    """A user's debits ordered by merchant and date, for the given merchants or all of them."""
+    chunks = [None] if merchants is None else [
+        merchants[start:start + MERCHANT_BATCH] for start in range(0, len(merchants), MERCHANT_BATCH)
+    ]
+    for chunk in chunks:
+        query = select(
+            StatementTransaction.merchant, StatementTransaction.posted_on,
+            StatementTransaction.description, StatementTransaction.amount_minor
+        ).filter(StatementTransaction.user_id == user_id, StatementTransaction.amount_minor > 0)
+        if chunk is not None:
+            query = query.filter(StatementTransaction.merchant.in_(chunk))
+        yield from db.execute(
+            query.order_by(StatementTransaction.merchant, StatementTransaction.posted_on).execution_options(yield_per=10000)
+        )
+
+def _detect_by_merchant(rows) -> Dict[str, List[dict]]:
+    """Subscriptions in (merchant, posted_on, description, amount_minor) rows, keyed by merchant."""
+    merchants, posted_on, descriptions, amounts = zip(*rows)
+    codes = {merchant: code for code, merchant in enumerate(dict.fromkeys(merchants))}
+    merchant_of = dict(zip(descriptions, merchants))
+    found = {merchant: [] for merchant in codes}
+    for sub in detect_recurrences(
+        np.fromiter((codes[merchant] for merchant in merchants), dtype=np.int64, count=len(merchants)),
+        np.array(amounts, dtype=np.int64),
+        np.fromiter((day.toordinal() for day in posted_on), dtype=np.int64, count=len(posted_on)),
+        descriptions
+    ):
+        found[merchant_of[sub["Description"]]].append(sub)
+    return found
+
+def _pending_merchants(db: Session, user_id: int) -> Tuple[bool, Dict[str, int]]:
+    """Whether the user's detection state must be rebuilt, and the merchants with debits no run has seen.
+
+    The merchants are mapped to the newest of those rows' ids; when
+    rebuilding, every merchant is.
+    """
+    states, oldest_version = db.execute(
+        select(func.count(MerchantRecurrence.id), func.min(MerchantRecurrence.detector_version))
+        .filter(MerchantRecurrence.user_id == user_id)
+    ).one()
+    rebuild = states == 0 or oldest_version != DETECTOR_VERSION
+    query = (
+        select(StatementTransaction.merchant, func.max(StatementTransaction.id))
+        .filter(StatementTransaction.user_id == user_id, StatementTransaction.amount_minor > 0)
+        .group_by(StatementTransaction.merchant)
+    )
+    if not rebuild:
+        query = query.filter(StatementTransaction.detected.is_(False))
+    return rebuild, dict(db.execute(query).all())
+
+def _detect_merchants(db: Session, user_id: int, merchants: Optional[List[str]]) -> Dict[str, List[dict]]:
+    """Subscriptions of the given merchants, or all of them, keyed by merchant."""
+    found = {}
+    batch = []
+    for row in _merchant_debits(db, user_id, merchants):
+        # Cut batches between merchants so each is detected over its whole history
+        if len(batch) >= settings.STATEMENT_INGEST_BATCH_ROWS and row.merchant != batch[-1].merchant:
+            found.update(_detect_by_merchant(batch))
+            batch = []
+        batch.append(row)
+    if batch:
+        found.update(_detect_by_merchant(batch))
+    return found
+
+def update_recurrences(db: Session, user_id: int) -> int:
+    """Re-detect subscriptions for the merchants whose debits no run has seen.
+
+    Rows a run has seen are flagged detected, so unseen ones are found through
+    the (user, detected) index and only their merchants' charges are read
+    back, through the (user, merchant, date) index, in batches of
+    STATEMENT_INGEST_BATCH_ROWS rows. With no state for the user, or state
+    from an older detector, every row's merchant is named again and every
+    merchant re-detected. Statement processing calls this after storing rows;
+    committing is left to the caller.
+
+    Runs for one user are serialized by locking the user's row until the
+    caller commits, so a run reads every row stored by jobs that finished
+    before it, whatever order their ids were assigned in. SQLite serializes
+    writers anyway.
+
+    Returns:
+        int: The number of merchants re-detected
+    """
+    db.execute(select(User.id).filter(User.id == user_id).with_for_update())
+    rebuild, changed = _pending_merchants(db, user_id)
+    if rebuild:
+        _assign_merchants(db, user_id)
+        db.execute(delete(MerchantRecurrence).where(MerchantRecurrence.user_id == user_id))
+        changed = _pending_merchants(db, user_id)[1]
+    if not changed:
+        return 0
+
+    found = _detect_merchants(db, user_id, None if rebuild else sorted(changed))
+    statement = _insert(db.get_bind().dialect.name, MerchantRecurrence)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "merchant"],
+        set_={column: statement.excluded[column] for column in ("subscriptions", "last_transaction_id", "detector_version")}
+    )
+    db.execute(statement, [{
+        "merchant": merchant,
+        "subscriptions": json.dumps(found.get(merchant, [])),
+        "last_transaction_id": last_id,
+        "detector_version": DETECTOR_VERSION,
+        "user_id": user_id
+    } for merchant, last_id in changed.items()])
+    db.execute(
+        update(StatementTransaction)
+        .where(StatementTransaction.user_id == user_id, StatementTransaction.detected.is_(False))
+        .values(detected=True)
+    )
+    logger.info(f"Re-detected {len(changed)} merchants for user {user_id}" + (" from scratch" if rebuild else ""))
+    return len(changed)
+
+def detect_subscriptions(db: Session, user_id: int) -> List[dict]:
+    """Subscriptions in a user's stored debits, in the parser's result shape.
+
+    The per-merchant results kept by update_recurrences are combined; this
+    only reads, so merchants with rows stored since (or every merchant, if
+    the state is from an older detector) are detected again in memory
+    without being stored. Up-to-date results are kept in the parse cache
+    under the user's ledger version and rebuilt once new rows are stored.
+    """
+    cache_key = f"user-{user_id}"
+    version = _ledger_version(db, user_id)
+    subscriptions = parse_cache.get(cache_key, version)
+    if subscriptions is None:
+        rebuild, changed = _pending_merchants(db, user_id)
+        if rebuild:
+            found = _detect_merchants(db, user_id, None)
+        else:
+            found = {
+                merchant: json.loads(kept) for merchant, kept in db.execute(
+                    select(MerchantRecurrence.merchant, MerchantRecurrence.subscriptions)
+                    .filter(MerchantRecurrence.user_id == user_id, MerchantRecurrence.subscriptions != "[]")
+                )
+            }
+            if changed:
+                found.update(_detect_merchants(db, user_id, sorted(changed)))
+        subscriptions = sorted(
+            (sub for subs in found.values() for sub in subs), key=lambda sub: (sub["Description"], sub["Amount"])
+        )
+        if not changed:
+            parse_cache.put(cache_key, version, subscriptions)
+    return _copies(subscriptions)
+
+def detect_statement_subscriptions(db: Session, file_id: int) -> List[dict]:
+    """Subscriptions in the rows stored from one statement, in the parser's result shape.
+
+    Only this statement's rows are read, so the result doesn't reach into
+    the user's other statements; a row an earlier, overlapping statement
+    stored first counts towards that one. Merchants are named from the
+    descriptions, so rows stored before merchants were are grouped too.
+    Results are kept in the parse cache under the statement's row count and
+    newest row id.
+    """
+    count, last_id = db.execute(
+        select(func.count(StatementTransaction.id), func.max(StatementTransaction.id))
+        .filter(StatementTransaction.file_id == file_id)
+    ).one()
+    cache_key = f"statement-{file_id}"
+    version = f"{count}-{last_id}.{DETECTOR_VERSION}"
+    subscriptions = parse_cache.get(cache_key, version)
+    if subscriptions is None:
+        rows = db.execute(
+            select(StatementTransaction.posted_on, StatementTransaction.description, StatementTransaction.amount_minor)
+            .filter(StatementTransaction.file_id == file_id, StatementTransaction.amount_minor > 0)
+        ).all()
+        subscriptions = detect_recurrences(
+            merchant_directory.ids_for(pd.Series([row.description for row in rows], dtype=object)),
+            np.array([row.amount_minor for row in rows], dtype=np.int64),
+            np.array([row.posted_on.toordinal() for row in rows], dtype=np.int64),
+            [row.description for row in rows]
+        )
+        parse_cache.put(cache_key, version, subscriptions)
+    return _copies(subscriptions)
+
+def _copies(subscriptions: List[dict]) -> List[dict]:
+    # Hand out copies so callers can't mutate the cached entry
+    return [dict(sub, Dates=list(sub["Dates"]), Amounts=list(sub["Amounts"])) for sub in subscriptions]
@@ -0,0 +1,319 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+import uuid
+import weakref
+from typing import Optional
+
+import httpx
+import stripe
+
+from api.config import get_settings
+from api.services.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Seconds allowed per endpoint; anything not listed gets the gateway's default timeout
+ENDPOINT_TIMEOUTS = {
+    "customers.create": 10.0,
+    "customers.update": 10.0,
+    "payment_methods.retrieve": 5.0,
+    "payment_methods.attach": 10.0,
+    "payment_intents.create": 30.0,  # Confirms against the card network
+    "issuing.cardholders.create": 15.0,
+    "issuing.cards.create": 15.0,
+    "issuing.cards.retrieve": 5.0,
+}
+
+# Methods that only read, so a retry needs no idempotency key
+READ_METHODS = {"retrieve", "list", "search"}
+
+# Set by the gateway around each call and read by the HTTP client underneath it
+_request_timeout = contextvars.ContextVar("stripe_request_timeout", default=None)
+
+class StripeUnavailable(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Stops calling Stripe after `failure_threshold` consecutive transient failures.
+
+    While open, calls fail at once. After `reset_seconds` one trial call is
+    let through (half-open); its success closes the breaker and its failure
+    opens it for another `reset_seconds`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Stripe circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logger.warning(f"Stripe circuit breaker opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def reset(self):
+        self.record_success()
+
+class PooledHTTPClient(stripe.HTTPClient):
+    """Stripe HTTP client over httpx with persistent keep-alive connections.
+
+    One sync client is shared by every thread, and one async client is kept
+    per event loop, so TLS handshakes are paid once per connection rather
+    than once per call. `max_connections` caps concurrent requests to Stripe;
+    callers beyond it wait for a free connection. The timeout of each request
+    comes from the gateway call that made it.
+    """
+
+    name = "httpx-pooled"
+
+    def __init__(self, max_connections=20, default_timeout=10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.default_timeout = default_timeout
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+        self._lock = threading.Lock()
+
+    def _timeout(self):
+        return httpx.Timeout(_request_timeout.get() or self.default_timeout)
+
+    def _sync_client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(limits=self._limits, verify=self._verify_ssl_certs)
+        return self._client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(limits=self._limits, verify=self._verify_ssl_certs)
+        return client
+
+    def request(self, method, url, headers, post_data=None):
+        try:
+            response = self._sync_client().request(method, url, headers=headers, content=post_data,
+                                                   timeout=self._timeout())
+        except httpx.HTTPError as e:
+            self._handle_request_error(e)
+        return response.content, response.status_code, response.headers
+
+    async def request_async(self, method, url, headers, post_data=None):
+        try:
+            response = await self._async_client().request(method, url, headers=headers, content=post_data,
+                                                          timeout=self._timeout())
+        except httpx.HTTPError as e:
+            self._handle_request_error(e)
+        return response.content, response.status_code, response.headers
+
+    def sleep_async(self, secs):
+        return asyncio.sleep(secs)
+
+    def _handle_request_error(self, e):
+        raise stripe.error.APIConnectionError(
+            f"Network error communicating with Stripe: {type(e).__name__}", should_retry=True
+        ) from e
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def close_async(self):
+        self.close()
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+class StripeGateway:
+    """The one way this app talks to the Stripe API.
+
+    `call("customers.create", params={...})` runs the named StripeClient
+    method, and `call_async` its async variant, through a pooled HTTP client.
+    Each call gets the timeout for its endpoint, up to `max_retries` retries
+    with jittered exponential backoff on connection errors, rate limits and
+    5xx responses, and an idempotency key for every write so those retries
+    are safe. Calls are timed into the `stripe.<endpoint>` latency histograms,
+    and transient failures feed a circuit breaker that fails calls fast with
+    StripeUnavailable while Stripe is down.
+    """
+
+    def __init__(self, api_key: str, api_base: Optional[str] = None, timeout=10.0, timeouts=None,
+                 max_retries=2, retry_base_seconds=0.5, max_connections=20,
+                 breaker_threshold=5, breaker_reset_seconds=30.0):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.timeout = timeout
+        self.timeouts = dict(ENDPOINT_TIMEOUTS if timeouts is None else timeouts)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.max_connections = max_connections
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset_seconds)
+        self._http_client = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> stripe.StripeClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._http_client = PooledHTTPClient(self.max_connections, self.timeout)
+                    self._client = stripe.StripeClient(
+                        self.api_key,
+                        http_client=self._http_client,
+                        max_network_retries=0,  # Retries are ours, so the breaker sees every attempt
+                        base_addresses={"api": self.api_base} if self.api_base else {}
+                    )
+        return self._client
+
+    def configure(self, api_key: Optional[str] = None, api_base: Optional[str] = None):
+        """Point the gateway at another key or API base, e.g. a local fake, and reset the breaker."""
+        with self._lock:
+            if api_key is not None:
+                self.api_key = api_key
+            self.api_base = api_base
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._client = None
+        self.breaker.reset()
+
+    def _method(self, endpoint: str, is_async: bool):
+        *path, name = endpoint.split(".")
+        service = self.client
+        for attribute in path:
+            service = getattr(service, attribute)
+        return getattr(service, f"{name}_async" if is_async else name), name
+
+    def _options(self, method_name: str, idempotency_key: Optional[str]):
+        if method_name in READ_METHODS:
+            return {}
+        return {"idempotency_key": idempotency_key or str(uuid.uuid4())}
+
+    def _should_retry(self, error: Exception) -> bool:
+        if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+            return True
+        return (getattr(error, "http_status", None) or 0) >= 500
+
+    def _backoff(self, retry: int) -> float:
+        delay = self.retry_base_seconds * 2 ** retry
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _before_attempt(self, endpoint: str):
+        if not self.breaker.allow():
+            raise StripeUnavailable(f"Stripe is unavailable; not calling {endpoint} while the circuit breaker is open")
+
+    def _after_failure(self, endpoint: str, error: Exception, attempt: int, retries: int) -> bool:
+        """Record a failed attempt and return whether to retry it."""
+        if not self._should_retry(error):
+            self.breaker.record_success()  # Stripe answered; the request itself was bad
+            return False
+        self.breaker.record_failure()
+        logger.warning(f"Stripe {endpoint} attempt {attempt + 1} failed: {str(error)}")
+        return attempt < retries
+
+    def call(self, endpoint: str, *args, params=None, idempotency_key: Optional[str] = None,
+             max_retries: Optional[int] = None):
+        """Call a StripeClient method by its dotted path, e.g. "issuing.cards.retrieve"."""
+        method, name = self._method(endpoint, is_async=False)
+        options = self._options(name, idempotency_key)
+        retries = self.max_retries if max_retries is None else max_retries
+        histogram = get_histogram(f"stripe.{endpoint}")
+        token = _request_timeout.set(self.timeouts.get(endpoint, self.timeout))
+        start = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                self._before_attempt(endpoint)
+                try:
+                    result = method(*args, params=params or {}, options=options)
+                except stripe.error.StripeError as e:
+                    if not self._after_failure(endpoint, e, attempt, retries):
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            _request_timeout.reset(token)
+            histogram.observe((time.perf_counter() - start) * 1000)
+
+    async def call_async(self, endpoint: str, *args, params=None, idempotency_key: Optional[str] = None,
+                         max_retries: Optional[int] = None):
+        """Async variant of `call`, for use on the event loop."""
+        method, name = self._method(endpoint, is_async=True)
+        options = self._options(name, idempotency_key)
+        retries = self.max_retries if max_retries is None else max_retries
+        histogram = get_histogram(f"stripe.{endpoint}")
+        token = _request_timeout.set(self.timeouts.get(endpoint, self.timeout))
+        start = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                self._before_attempt(endpoint)
+                try:
+                    result = await method(*args, params=params or {}, options=options)
+                except stripe.error.StripeError as e:
+                    if not self._after_failure(endpoint, e, attempt, retries):
+                        raise
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            _request_timeout.reset(token)
+            histogram.observe((time.perf_counter() - start) * 1000)
+
+    def status(self) -> dict:
+        return {"circuit_breaker": self.breaker.state, "api_base": self.api_base or stripe.api_base}
+
+    async def close(self):
+        if self._http_client is not None:
+            await self._http_client.close_async()
+
+stripe_gateway = StripeGateway(
+    api_key=settings.STRIPE_SECRET_KEY,
+    timeout=settings.STRIPE_TIMEOUT_SECONDS,
+    max_retries=settings.STRIPE_MAX_RETRIES,
+    retry_base_seconds=settings.STRIPE_RETRY_BASE_SECONDS,
+    max_connections=settings.STRIPE_MAX_CONNECTIONS,
+    breaker_threshold=settings.STRIPE_BREAKER_THRESHOLD,
+    breaker_reset_seconds=settings.STRIPE_BREAKER_RESET_SECONDS
+)
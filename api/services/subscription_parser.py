@@ -1,13 +1,30 @@
+import numpy as np
 import pandas as pd
-from datetime import timedelta
-import re
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+import csv
+import hashlib
+import threading
+import glob
+import os
+import sys
 import json
 import logging
+from api.config import get_settings
+from api.services.column_cache import column_cache
+from api.services.merchant_normalizer import DESCRIPTION_SUFFIX, clean_descriptions, merchant_directory
+from api.services.money import MINOR_UNITS, to_minor_array
+from api.services.recurrence import CADENCES, MAX_CADENCE_GAP, detect_recurrences
 
 # Set up logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+settings = get_settings()
+
 def load_data(file_path):
     logger.info(f"Loading data from {file_path}")
     try:
@@ -24,7 +41,7 @@ def preprocess_data(df):
     try:
         df["Money Out"] = pd.to_numeric(df["Money Out"].str.replace('€', '').str.replace(',', ''), errors='coerce')
         df["Money Out"] = df["Money Out"].fillna(0)
-        df["Description"] = df["Description"].apply(lambda x: re.sub(r'\s\d{2}/\d{2}.*$', '', str(x)))
+        df["Description"] = clean_descriptions(df["Description"])
         df = df[df["Money Out"] > 0]
         df["Date"] = pd.to_datetime(df["Date"], format="%d/%m/%Y")
         logger.debug(f"Data preprocessed with {len(df)} records")
@@ -33,49 +50,451 @@ def preprocess_data(df):
         logger.error(f"Error preprocessing data: {str(e)}")
         raise
 
+# Day ordinal of the Unix epoch, to turn datetime64 days into date ordinals
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
 def find_subscriptions(df):
+    """Detect recurring charges: weekly, monthly, quarterly and annual.
+
+    Merchants are the interned ids of the normalized descriptions, so one
+    merchant described several ways is one series, and amounts within a band
+    of each other are one series, so a price change doesn't split it. The
+    columns go to detect_recurrences as arrays, which sorts them and
+    classifies every series in one vectorized pass.
+    """
     logger.info("Finding subscriptions")
-    subscriptions = []
     try:
-        for (description, amount), group in df.groupby(["Description", "Money Out"]):
-            group = group.sort_values(by="Date")
-            if len(group) > 1:
-                date_diffs = group["Date"].diff().dropna()
-                is_monthly = all(timedelta(days=25) <= diff <= timedelta(days=35) for diff in date_diffs)
-                if is_monthly:
-                    last_date = group["Date"].iloc[-1]
-                    # Calculate the estimated next date by adding one month
-                    estimated_next_date = (last_date + pd.DateOffset(months=1)).strftime('%Y-%m-%d')
-                    logger.debug(f"Last date: {last_date}, Estimated next date: {estimated_next_date}")
-                    formatted_dates = [d.strftime('%Y-%m-%d') for d in group["Date"]]
-                    subscriptions.append({
-                        "Description": description,
-                        "Amount": amount,
-                        "Dates": formatted_dates,
-                        "Estimated_Next": estimated_next_date
-                    })
+        if df.empty:
+            logger.info("Found 0 subscriptions")
+            return []
+        subscriptions = detect_recurrences(
+            merchant_directory.ids_for(df["Description"]),
+            to_minor_array(df["Money Out"]),
+            df["Date"].to_numpy(dtype="datetime64[D]").astype(np.int64) + EPOCH_ORDINAL,
+            df["Description"].to_numpy()
+        )
         logger.info(f"Found {len(subscriptions)} subscriptions")
         return subscriptions
     except Exception as e:
         logger.error(f"Error finding subscriptions: {str(e)}")
         raise
 
-def process_subscriptions(file_path):
-    """Process the subscriptions from the given file path."""
-    df = load_data(file_path)
-    df = preprocess_data(df)
-    return find_subscriptions(df)
+# Statements larger than this (and every CSV) are parsed row by row
+STREAMING_THRESHOLD_BYTES = settings.STREAMING_PARSE_THRESHOLD_BYTES
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    return datetime.strptime(value, "%d/%m/%Y").date()
+
+def _parse_amount(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return 0.0
+    try:
+        return float(str(value).replace('€', '').replace(',', ''))
+    except ValueError:
+        return 0.0
+
+def _iter_raw_rows(file_path):
+    """Yield raw (date, description, money in, money out, balance) cells, skipping the header row."""
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) >= 4:
+                    yield row[0], row[1], row[2], row[3], row[4] if len(row) > 4 else None
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook["Sheet1"]
+        for row in sheet.iter_rows(min_row=2, max_col=5, values_only=True):
+            if len(row) >= 4:
+                yield row[0], row[1], row[2], row[3], row[4] if len(row) > 4 else None
+    finally:
+        workbook.close()
+
+def _as_date(raw_date):
+    if isinstance(raw_date, datetime):
+        return raw_date.date()
+    if isinstance(raw_date, date):
+        return raw_date
+    return _parse_date(str(raw_date).strip())
+
+def _clean_description(raw_description):
+    return DESCRIPTION_SUFFIX.sub('', 'nan' if raw_description is None else str(raw_description))
+
+def iter_statement_rows(file_path):
+    """Stream preprocessed debit rows as (date, description, amount) tuples.
+
+    Applies the same cleaning as preprocess_data without materialising the
+    statement, so memory use does not grow with the file.
+    """
+    for raw_date, raw_description, _, raw_amount, _ in _iter_raw_rows(file_path):
+        amount = _parse_amount(raw_amount)
+        if not amount > 0:
+            continue
+        yield _as_date(raw_date), _clean_description(raw_description), amount
+
+def iter_statement_transactions(file_path):
+    """Stream every row as (date, raw description, description, amount, balance) tuples.
+
+    Unlike iter_statement_rows credits are kept, with a negative amount
+    (money out minus money in), and balance is None when its cell is empty.
+    Rows whose date can't be read, such as totals lines, are skipped.
+    """
+    for raw_date, raw_description, raw_in, raw_out, raw_balance in _iter_raw_rows(file_path):
+        try:
+            posted_on = _as_date(raw_date)
+        except ValueError:
+            continue
+        description = _clean_description(raw_description)
+        raw_description = '' if raw_description is None else str(raw_description).strip()
+        balance = None if raw_balance in (None, '') else _parse_amount(raw_balance)
+        yield posted_on, raw_description, description, _parse_amount(raw_out) - _parse_amount(raw_in), balance
+
+def _fits_cadence(gap):
+    return any(cadence.min_gap <= gap <= cadence.max_gap for cadence in CADENCES)
+
+# How many rows the accumulator takes between sweeps of expired one-off series
+SWEEP_INTERVAL_ROWS = 65536
+
+# One-off series are keyed by merchant id << 40 | amount in minor units + AMOUNT_OFFSET,
+# and hold description index << 32 | date ordinal
+AMOUNT_BITS = 40
+AMOUNT_OFFSET = 1 << (AMOUNT_BITS - 1)
+
+class SubscriptionAccumulator:
+    """Incrementally collect recurring charge candidates from a row stream.
+
+    Each (merchant id, amount) series keeps its charge dates as a compact
+    array of day ordinals, plus the description of its latest charge for
+    display. A series with a single charge, which most card spending is,
+    is kept as a packed int key and value until a second charge arrives:
+    in a dict for charges since the last sweep, and in a sorted array of
+    16 bytes per charge for older ones. While the stream arrives in date
+    order (as bank exports do) a series is dropped once a quarter of its
+    gaps, and at least two, fit no cadence, and only its key is kept;
+    one-off charges are forgotten once the stream has moved past the
+    longest cadence. Memory therefore
+    tracks the number of live candidates rather than the size of the file.
+    `subscriptions` hands the survivors to detect_recurrences, which merges
+    a merchant's amounts into bands as find_subscriptions does.
+
+    Pruning is judged per exact amount, so it can drop a series that
+    find_subscriptions would keep once merged with another price, and
+    forgetting one-offs means a stray charge long before a series starts
+    does not count against it.
+    """
+
+    def __init__(self, prune=True):
+        self.prune = prune
+        self.in_order = True
+        self._direction = 0
+        self._last_ordinal = None
+        self._rows_since_sweep = 0
+        self._series = {}
+        self._descriptions = {}  # Series key -> (ordinal, description) of its latest charge
+        self._singles = {}  # Packed key of a series with one charge -> packed description index and ordinal
+        self._swept_keys = array('q')  # Singles as of the last sweep, sorted by packed key
+        self._swept_values = array('q')  # Parallel to _swept_keys, -1 once taken
+        self._description_ids = {}  # Description -> index into _description_list
+        self._description_list = []
+        self._misfits = {}  # Series key -> gaps fitting no cadence, for keys with any
+        self._dead = set()
+
+    def add(self, charged_on, description, amount):
+        ordinal = charged_on.toordinal()
+        if self._last_ordinal is not None and ordinal != self._last_ordinal:
+            direction = 1 if ordinal > self._last_ordinal else -1
+            if self._direction == 0:
+                self._direction = direction
+            elif direction != self._direction:
+                self.in_order = False
+        self._last_ordinal = ordinal
+
+        merchant_id = merchant_directory.id_for(description)
+        key = (merchant_id, amount)
+        dates = self._series.get(key)
+        if dates is None:
+            if key in self._dead:
+                return  # Series already disqualified
+            packed_key = (merchant_id << AMOUNT_BITS) + round(amount * MINOR_UNITS) + AMOUNT_OFFSET
+            single = self._take_single(packed_key)
+            if single is None:
+                description_id = self._description_ids.get(description)
+                if description_id is None:
+                    description_id = self._description_ids[description] = len(self._description_list)
+                    self._description_list.append(sys.intern(description))
+                self._singles[packed_key] = (description_id << 32) | ordinal
+            else:
+                first = single & 0xFFFFFFFF
+                self._series[key] = array('i', [first, ordinal])
+                if ordinal >= first:
+                    self._descriptions[key] = (ordinal, sys.intern(description))
+                else:
+                    self._descriptions[key] = (first, self._description_list[single >> 32])
+                if self.prune and self.in_order and not _fits_cadence(abs(ordinal - first)):
+                    self._misfits[key] = 1
+        else:
+            if self.prune and self.in_order and not _fits_cadence(abs(ordinal - dates[-1])):
+                misfits = self._misfits[key] = self._misfits.get(key, 0) + 1
+                if misfits >= 2 and misfits * 4 > len(dates):
+                    self._kill(key)
+                    return
+            if ordinal >= self._descriptions[key][0]:
+                self._descriptions[key] = (ordinal, sys.intern(description))
+            dates.append(ordinal)
+
+        self._rows_since_sweep += 1
+        if self._rows_since_sweep >= SWEEP_INTERVAL_ROWS:
+            self._sweep()
+
+    def _take_single(self, packed_key):
+        """Remove and return the packed value of a one-off series, or None."""
+        single = self._singles.pop(packed_key, None)
+        if single is None:
+            i = bisect_left(self._swept_keys, packed_key)
+            if i < len(self._swept_keys) and self._swept_keys[i] == packed_key and self._swept_values[i] >= 0:
+                single = self._swept_values[i]
+                self._swept_values[i] = -1
+        return single
+
+    def _kill(self, key):
+        del self._series[key]
+        del self._descriptions[key]
+        self._misfits.pop(key, None)
+        self._dead.add(key)
+
+    def _sweep(self):
+        """Merge recent one-off charges into the sorted array.
 
-def get_subscriptions_sorted_by_date(file_path):
+        Those too old to be followed by a repeat of any cadence are forgotten.
+        """
+        self._rows_since_sweep = 0
+        keys = np.concatenate([
+            np.frombuffer(self._swept_keys, dtype=np.int64),
+            np.fromiter(self._singles.keys(), dtype=np.int64, count=len(self._singles)),
+        ])
+        values = np.concatenate([
+            np.frombuffer(self._swept_values, dtype=np.int64),
+            np.fromiter(self._singles.values(), dtype=np.int64, count=len(self._singles)),
+        ])
+        live = values >= 0
+        if self.prune and self.in_order and self._last_ordinal is not None:
+            live &= np.abs(self._last_ordinal - (values & 0xFFFFFFFF)) <= MAX_CADENCE_GAP
+        keys, values = keys[live], values[live]
+        order = np.argsort(keys, kind="stable")
+        self._swept_keys = array('q', keys[order].tobytes())
+        self._swept_values = array('q', values[order].tobytes())
+        self._singles = {}
+
+    def subscriptions(self):
+        """Return detected subscriptions in the same shape as find_subscriptions.
+
+        Bands never span merchants, so detection runs over slices of the
+        live charges partitioned by merchant id, about SWEEP_INTERVAL_ROWS
+        one-off charges each, to bound its working memory.
+        """
+        self._sweep()
+        keys = list(self._series)
+        lengths = [len(self._series[key]) for key in keys]
+        series_merchants = np.repeat(np.array([merchant for merchant, _ in keys], dtype=np.int64), lengths)
+        series_amounts = np.repeat(to_minor_array([amount for _, amount in keys]), lengths)
+        series_ordinals = np.concatenate(
+            [np.empty(0, dtype=np.int32)] + [np.frombuffer(self._series[key], dtype=np.int32) for key in keys]
+        ).astype(np.int64)
+        series_descriptions = np.repeat(np.array([self._descriptions[key][1] for key in keys], dtype=object), lengths)
+        singles = np.frombuffer(self._swept_keys, dtype=np.int64)
+        packed = np.frombuffer(self._swept_values, dtype=np.int64)
+        single_merchants = singles >> AMOUNT_BITS
+        single_amounts = (singles & ((1 << AMOUNT_BITS) - 1)) - AMOUNT_OFFSET
+        descriptions = np.array(self._description_list, dtype=object)
+
+        parts = max(1, -(-len(singles) // SWEEP_INTERVAL_ROWS))
+        subscriptions = []
+        for part in range(parts):
+            in_series = series_merchants % parts == part
+            in_singles = single_merchants % parts == part
+            subscriptions += detect_recurrences(
+                np.concatenate([series_merchants[in_series], single_merchants[in_singles]]),
+                np.concatenate([series_amounts[in_series], single_amounts[in_singles]]),
+                np.concatenate([series_ordinals[in_series], packed[in_singles] & 0xFFFFFFFF]),
+                np.concatenate([series_descriptions[in_series], descriptions[packed[in_singles] >> 32]])
+            )
+        subscriptions.sort(key=lambda sub: (sub["Description"], sub["Amount"]))
+        return subscriptions
+
+def stream_subscriptions(file_path):
+    """Detect subscriptions in a single streaming pass over the statement.
+
+    Falls back to a second, unpruned pass if the rows turn out not to be in
+    date order, since early pruning is only exact for ordered input.
+    """
+    logger.info(f"Streaming subscriptions from {file_path}")
+    accumulator = SubscriptionAccumulator()
+    for row in iter_statement_rows(file_path):
+        accumulator.add(*row)
+    if not accumulator.in_order:
+        logger.info(f"Rows in {file_path} are not date ordered, re-reading without pruning")
+        accumulator = SubscriptionAccumulator(prune=False)
+        for row in iter_statement_rows(file_path):
+            accumulator.add(*row)
+    subscriptions = accumulator.subscriptions()
+    logger.info(f"Found {len(subscriptions)} subscriptions")
+    return subscriptions
+
+class ParseCache:
+    """Parse-once cache of detected subscriptions keyed by file ID and content hash.
+
+    Entries live in a size-bounded in-memory LRU and, when a cache directory is
+    configured, in JSON files on disk so they survive restarts. Storing a new
+    hash for a file ID drops every entry for the file's previous content.
+    """
+
+    def __init__(self, max_entries=128, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _disk_path(self, file_id, digest):
+        return os.path.join(self.cache_dir, f"{file_id}-{digest}.json")
+
+    def get(self, file_id, digest):
+        key = (file_id, digest)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(file_id, digest)) as f:
+                subscriptions = json.load(f)
+        except (OSError, ValueError):
+            return None
+        logger.debug(f"Parse cache disk hit for file ID {file_id}")
+        self._remember(key, subscriptions)
+        return subscriptions
+
+    def put(self, file_id, digest, subscriptions):
+        self.invalidate(file_id, keep=digest)
+        self._remember((file_id, digest), subscriptions)
+        if self.cache_dir:
+            tmp_path = self._disk_path(file_id, digest) + ".tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(subscriptions, f)
+                os.replace(tmp_path, self._disk_path(file_id, digest))
+            except OSError as e:
+                logger.warning(f"Could not write parse cache entry for file ID {file_id}: {str(e)}")
+
+    def invalidate(self, file_id, keep=None):
+        """Drop cached entries for a file ID, except the one for digest `keep`."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == file_id and k[1] != keep]:
+                del self._entries[key]
+        if self.cache_dir:
+            for path in glob.glob(os.path.join(glob.escape(self.cache_dir), f"{glob.escape(file_id)}-*.json")):
+                if keep is None or path != self._disk_path(file_id, keep):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, subscriptions):
+        with self._lock:
+            self._entries[key] = subscriptions
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+parse_cache = ParseCache(
+    max_entries=settings.PARSE_CACHE_MAX_ENTRIES,
+    cache_dir=settings.PARSE_CACHE_DIR
+)
+
+# Part of every parse cache key; bump it when detection changes so older results aren't served
+DETECTOR_VERSION = 4
+
+# Content hashes memoised by (path, mtime, size) so cache hits don't re-read the file
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+def file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file, reusing it while the file is unchanged."""
+    stat = os.stat(file_path)
+    memo_key = (file_path, stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digest_memo.get(memo_key)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _digest_lock:
+        for key in [k for k in _digest_memo if k[0] == file_path]:
+            del _digest_memo[key]
+        _digest_memo[memo_key] = digest
+    return digest
+
+def load_statement_frame(file_path):
+    """The preprocessed statement, memory-mapped from the column cache once it has been parsed."""
+    digest = file_sha256(file_path)
+    df = column_cache.load(digest)
+    if df is None:
+        df = preprocess_data(load_data(file_path))
+        column_cache.save(digest, df)
+    return df
+
+def _parse_subscriptions(file_path):
+    if file_path.lower().endswith(".csv") or os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES:
+        return stream_subscriptions(file_path)
+    return find_subscriptions(load_statement_frame(file_path))
+
+def process_subscriptions(file_path, file_id=None):
+    """Process the subscriptions from the given file path.
+
+    When a file ID is given the result is served from the parse cache, so a
+    statement is only parsed again after its content changes.
+    """
+    if file_id is None:
+        return _parse_subscriptions(file_path)
+
+    digest = f"{file_sha256(file_path)}.{DETECTOR_VERSION}"
+    subscriptions = parse_cache.get(file_id, digest)
+    if subscriptions is None:
+        logger.info(f"Parse cache miss for file ID {file_id}")
+        subscriptions = _parse_subscriptions(file_path)
+        parse_cache.put(file_id, digest, subscriptions)
+    # Hand out copies so callers can't mutate the cached entry
+    return [dict(sub, Dates=list(sub["Dates"]), Amounts=list(sub["Amounts"])) for sub in subscriptions]
+
+def get_subscriptions_sorted_by_date(file_path, file_id=None):
     """Get individual subscription transactions sorted by date."""
-    subscriptions = process_subscriptions(file_path)
+    return sort_subscription_dates(process_subscriptions(file_path, file_id=file_id))
+
+def sort_subscription_dates(subscriptions):
+    """One entry per charge of the given subscriptions, sorted by date."""
     individual_transactions = []
 
     for subscription in subscriptions:
-        for date in subscription["Dates"]:
+        for date, amount in zip(subscription["Dates"], subscription["Amounts"]):
             individual_transactions.append({
                 "Description": subscription["Description"],
-                "Amount": subscription["Amount"],
+                "Amount": amount,
                 "Date": date,
                 "Estimated_Next": subscription["Estimated_Next"]
             })
@@ -83,4 +502,4 @@ def get_subscriptions_sorted_by_date(file_path):
     # Sort individual transactions by date
     sorted_transactions = sorted(individual_transactions, key=lambda x: x["Date"])
     logger.debug(f"Sorted {len(sorted_transactions)} transactions by date")
-    return sorted_transactions 
\ No newline at end of file
+    return sorted_transactions
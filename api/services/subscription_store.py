@@ -0,0 +1,67 @@
+import logging
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from api.models import Subscription
+from api.services.money import to_major, to_minor
+
+logger = logging.getLogger(__name__)
+
+def _as_date(value) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _load_existing(db: Session, user_id: int, descriptions) -> dict:
+    return {
+        (sub.description, sub.amount_minor): sub
+        for sub in db.query(Subscription).filter(
+            Subscription.user_id == user_id,
+            Subscription.description.in_(descriptions)
+        )
+    }
+
+def bulk_upsert_subscriptions(db: Session, user_id: int, rows: Iterable[dict]) -> List[Subscription]:
+    """Get or create a subscription for every row with one batched INSERT.
+
+    Rows are dicts with `description`, `amount` (major units), `date`,
+    `estimated_next_date` and `file_id`. Amounts are compared in minor units,
+    so a row whose (description, amount) the user already has
+    resolves to the existing subscription, as get_or_create_subscription does.
+    Existing keys are loaded with one SELECT, new rows go out as a single
+    executemany INSERT and are read back with one more SELECT. Committing is
+    left to the caller so an upload is stored in one transaction.
+
+    Returns:
+        List[Subscription]: One subscription per input row, in input order
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+
+    descriptions = {row["description"] for row in rows}
+    existing = _load_existing(db, user_id, descriptions)
+
+    keys = [(row["description"], to_minor(row["amount"])) for row in rows]
+    new_rows = {}
+    for row, key in zip(rows, keys):
+        if key in existing or key in new_rows:
+            continue
+        new_rows[key] = {
+            "description": row["description"],
+            "amount_minor": key[1],
+            "amount": to_major(key[1]),
+            "date": _as_date(row.get("date")) or datetime.now().date(),
+            "estimated_next_date": _as_date(row.get("estimated_next_date")),
+            "user_id": user_id,
+            "file_id": row["file_id"]
+        }
+
+    if new_rows:
+        db.execute(insert(Subscription), list(new_rows.values()))
+        existing = _load_existing(db, user_id, descriptions)
+    logger.info(f"Upserted {len(rows)} subscriptions for user {user_id} ({len(new_rows)} new)")
+    return [existing[key] for key in keys]
@@ -0,0 +1,67 @@
+import logging
+
+import stripe
+from sqlalchemy.orm import Session
+
+from api.models import Group
+from api.services.card_details_cache import card_details_cache
+from api.services.split_payments import split_payments
+from api.services.split_plans import split_plans
+from api.services.webhook_inbox import WebhookInbox, webhook_inbox
+
+logger = logging.getLogger(__name__)
+
+def split_authorization(db: Session, event: stripe.Event):
+    """Charge each group member their share of an approved card authorization."""
+    authorization = event.data.object
+    logger.info(f"Processing authorization for card: {authorization.card.id}")
+
+    # Members, payment methods and shares come from the card's cached split plan
+    plan = split_plans.get(db, authorization.card.id)
+    if plan is None:
+        raise ValueError(f"No group members with real cards found for stripe card {authorization.card.id}")
+
+    logger.info(f"Splitting authorization {authorization.id} amount {authorization.amount} "
+                f"between {len(plan.user_ids)} members of group {plan.group_id}")
+    legs = plan.legs(authorization.amount)  # Amount in smallest currency unit (cents)
+
+    # Record every leg in the ledger before charging, then charge them
+    # concurrently; legs that fail transiently are retried in the background
+    payment_ids = split_payments.record(db, authorization.id, authorization.currency, plan.group_id, legs)
+    db.commit()
+    outcomes = split_payments.charge(payment_ids, plan.payment_methods())
+    logger.info(f"Split authorization {authorization.id} into {len(outcomes)} payments: "
+                f"{sum(status == 'succeeded' for status in outcomes.values())} succeeded, "
+                f"{sum(status == 'pending' for status in outcomes.values())} pending retry, "
+                f"{sum(status == 'failed' for status in outcomes.values())} failed")
+
+def log_transaction(db: Session, event: stripe.Event):
+    # Transaction event is now just for logging since we process payments at authorization time
+    logger.info(f"Received transaction: {event.data.object.id}")
+
+def update_card(db: Session, event: stripe.Event):
+    """Drop a changed card's cached details and refresh the ones stored on its group."""
+    card = event.data.object
+    logger.info(f"Card {card.id} updated, status {card.status}")
+    card_details_cache.invalidate(card.id)
+
+    # Keep the non-sensitive details served by GET /groups/{id}/card current
+    group = db.query(Group).filter(Group.virtual_card_id == card.id).first()
+    if group:
+        group.virtual_card_last4 = card.last4
+        group.virtual_card_exp_month = card.exp_month
+        group.virtual_card_exp_year = card.exp_year
+        group.virtual_card_status = card.status
+        db.commit()
+
+EVENT_HANDLERS = {
+    "issuing_authorization.created": split_authorization,
+    "issuing_transaction.created": log_transaction,
+    "issuing_card.updated": update_card,
+}
+
+def register_handlers(inbox: WebhookInbox):
+    for event_type, handler in EVENT_HANDLERS.items():
+        inbox.register(event_type, handler)
+
+register_handlers(webhook_inbox)
@@ -0,0 +1,279 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+import stripe
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from api.config import get_settings
+from api.database import SessionLocal
+from api.models import WebhookEvent
+from api.services.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Events in these states are handed to the workers again when the inbox starts
+UNFINISHED_STATUSES = ("pending", "processing")
+
+def ordering_key(event_data: dict) -> str:
+    """The Issuing card an event concerns, or the event's own ID when it has none."""
+    obj = event_data.get("data", {}).get("object", {})
+    if obj.get("object") == "issuing.card":
+        return obj["id"]
+    card = obj.get("card")
+    if isinstance(card, dict):
+        card = card.get("id")
+    return card or event_data["id"]
+
+def _insert(dialect_name: str):
+    if dialect_name == "postgresql":
+        return postgresql.insert(WebhookEvent)
+    return sqlite.insert(WebhookEvent)
+
+class WebhookInbox:
+    """Durable inbox of verified Stripe events, handled by a pool of worker threads.
+
+    The webhook endpoint only `store`s an event, keyed by its Stripe event ID
+    so redeliveries are dropped by the insert itself, and `enqueue`s it after
+    committing. Handlers are registered per event type and called as
+    `handler(db, event)`. Events with the same ordering key (the Issuing card)
+    form a lane that is handled one event at a time in arrival order; a failed
+    event is retried with exponential backoff, up to `max_attempts`, and holds
+    back the events behind it until it succeeds or gives up. Different cards
+    are handled concurrently, and unfinished events are resumed on start-up.
+    """
+
+    def __init__(self, workers=4, max_attempts=8, retry_seconds=1.0, session_factory=SessionLocal):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.session_factory = session_factory
+        self._handlers = {}
+        self._lanes = {}  # ordering key -> deque of event IDs, the head being handled
+        self._pool = None
+        self._timers = set()
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def register(self, event_type: str, handler):
+        self._handlers[event_type] = handler
+
+    def store(self, db: Session, event_data: dict, payload: bytes) -> bool:
+        """Insert a verified event unless it is already stored.
+
+        Committing is left to the caller, which should `enqueue` the event
+        afterwards. Returns whether the event was new.
+        """
+        statement = _insert(db.get_bind().dialect.name).values(
+            id=event_data["id"],
+            type=event_data.get("type", ""),
+            ordering_key=ordering_key(event_data),
+            payload=payload.decode("utf-8"),
+            status="pending",
+            attempts=0,
+            received_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["id"])
+        return db.execute(statement).rowcount == 1
+
+    def enqueue(self, event_id: str, key: str):
+        """Queue a stored event behind any earlier events with the same ordering key."""
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is not None:
+                lane.append(event_id)
+                return
+            self._lanes[key] = deque([event_id])
+        self._submit(key)
+
+    def replay(self, event_ids: Optional[Iterable[str]] = None, event_type: Optional[str] = None,
+               limit: Optional[int] = None, copies: int = 1) -> List[str]:
+        """Store and queue fresh copies of stored events, for load testing.
+
+        Copies are taken of original deliveries only, oldest first, filtered
+        by ID and type. They go through the same handlers, which must already
+        tolerate redelivery, so replaying charges nobody twice. Returns the
+        IDs of the copies.
+        """
+        db = self.session_factory()
+        try:
+            query = db.query(WebhookEvent).filter(WebhookEvent.replay_of.is_(None))
+            if event_ids is not None:
+                query = query.filter(WebhookEvent.id.in_(list(event_ids)))
+            if event_type:
+                query = query.filter(WebhookEvent.type == event_type)
+            originals = query.order_by(WebhookEvent.received_at).limit(limit).all()
+            replays = []
+            for _ in range(copies):
+                for original in originals:
+                    replay = WebhookEvent(
+                        id=f"{original.id}.replay-{uuid.uuid4().hex[:12]}",
+                        type=original.type,
+                        ordering_key=original.ordering_key,
+                        payload=original.payload,
+                        replay_of=original.id
+                    )
+                    db.add(replay)
+                    replays.append((replay.id, replay.ordering_key))
+            db.commit()
+        finally:
+            db.close()
+        for event_id, key in replays:
+            self.enqueue(event_id, key)
+        logger.info(f"Replaying {len(replays)} webhook events")
+        return [event_id for event_id, _ in replays]
+
+    def start(self):
+        """Resume events left unhandled by a previous process."""
+        self._stopped = False
+        db = self.session_factory()
+        try:
+            unfinished = db.query(WebhookEvent.id, WebhookEvent.ordering_key).filter(
+                WebhookEvent.status.in_(UNFINISHED_STATUSES)
+            ).order_by(WebhookEvent.received_at).all()
+        finally:
+            db.close()
+        for event_id, key in unfinished:
+            self.enqueue(event_id, key)
+        if unfinished:
+            logger.info(f"Resumed {len(unfinished)} unhandled webhook events")
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued event, including retries, is handled or given up."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._lanes, timeout)
+
+    def status(self) -> dict:
+        db = self.session_factory()
+        try:
+            counts = dict(db.query(WebhookEvent.status, func.count()).group_by(WebhookEvent.status).all())
+        finally:
+            db.close()
+        with self._lock:
+            lanes = len(self._lanes)
+        return {"events": counts, "active_lanes": lanes}
+
+    def shutdown(self):
+        with self._lock:
+            self._stopped = True
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+        with self._idle:
+            self._lanes.clear()
+            self._idle.notify_all()
+
+    def _submit(self, key: str):
+        with self._lock:
+            if self._stopped:
+                return  # Left unfinished in the table and resumed by the next start
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="webhook")
+            self._pool.submit(self._run_lane, key)
+
+    def _resume(self, key: str):
+        with self._lock:
+            # Runs on the timer's own thread
+            self._timers.discard(threading.current_thread())
+        self._submit(key)
+
+    def _run_lane(self, key: str):
+        with self._lock:
+            lane = self._lanes.get(key)
+            if not lane:
+                return
+            event_id = lane[0]
+        try:
+            retry_in = self._handle(event_id)
+        except Exception as e:
+            logger.error(f"Could not handle webhook event {event_id}: {str(e)}")
+            retry_in = self.retry_seconds
+        if retry_in is not None:
+            # The lane keeps its place, so later events for the card wait for this one
+            timer = threading.Timer(retry_in, self._resume, [key])
+            timer.daemon = True
+            with self._lock:
+                self._timers.add(timer)
+            timer.start()
+            return
+        with self._idle:
+            lane = self._lanes.get(key)
+            if lane is None:
+                return  # Dropped by shutdown
+            lane.popleft()
+            if not lane:
+                del self._lanes[key]
+                if not self._lanes:
+                    self._idle.notify_all()
+                return
+        # Go to the back of the pool's queue so one busy card cannot starve the others
+        self._submit(key)
+
+    def _handle(self, event_id: str) -> Optional[float]:
+        """Run the handler for one event, returning the delay before retrying it, if any."""
+        db = self.session_factory()
+        try:
+            event = db.get(WebhookEvent, event_id)
+            if not event or event.status not in UNFINISHED_STATUSES:
+                return None
+            handler = self._handlers.get(event.type)
+            if handler is None:
+                event.status = "skipped"
+                event.processed_at = datetime.utcnow()
+                db.commit()
+                return None
+            event.status = "processing"
+            event.attempts += 1
+            db.commit()
+            attempts, event_type = event.attempts, event.type
+
+            started = time.perf_counter()
+            try:
+                handler(db, stripe.Event.construct_from(json.loads(event.payload), stripe.api_key))
+            except Exception as e:
+                db.rollback()
+                event = db.get(WebhookEvent, event_id)
+                event.error = str(e)
+                if attempts >= self.max_attempts:
+                    event.status = "failed"
+                    event.next_attempt_at = None
+                    db.commit()
+                    logger.error(f"Giving up on webhook event {event_id} ({event_type}) "
+                                 f"after {attempts} attempts: {str(e)}")
+                    return None
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                event.status = "pending"
+                event.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                db.commit()
+                logger.warning(f"Webhook event {event_id} ({event_type}) attempt {attempts} failed, "
+                               f"retrying in {delay:.1f}s: {str(e)}")
+                return delay
+
+            event.status = "processed"
+            event.error = None
+            event.next_attempt_at = None
+            event.processed_at = datetime.utcnow()
+            db.commit()
+            get_histogram(f"webhook.{event_type}").observe((time.perf_counter() - started) * 1000)
+            return None
+        finally:
+            db.close()
+
+webhook_inbox = WebhookInbox(
+    workers=settings.WEBHOOK_WORKERS,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+    retry_seconds=settings.WEBHOOK_RETRY_SECONDS
+)
@@ -0,0 +1,145 @@
+"""Load test for the issuing_authorization.request fast path.
+
+Sends signed authorization requests to the webhook endpoint at a fixed rate
+(300/s for 3 seconds by default, override with AUTHORIZATION_LOAD_RATE and
+AUTHORIZATION_LOAD_SECONDS) and asserts that the p99 decision time recorded
+by the latency histogram stays under AUTHORIZATION_BUDGET_MS. Run with
+pytest or directly:
+
+    python -m api.tests.authorization_load_test
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from api.config import get_settings
+from api.database import get_async_db
+from api.models.base import Base
+from api.models import CardMember, Group, RealCard, User, VirtualCard
+from api.routes import webhook_routes
+from api.services.authorization import authorization_policies, decision_latency
+
+RATE = int(os.environ.get("AUTHORIZATION_LOAD_RATE", "300"))
+SECONDS = float(os.environ.get("AUTHORIZATION_LOAD_SECONDS", "3"))
+BUDGET_MS = float(os.environ.get("AUTHORIZATION_BUDGET_MS", "50"))
+WEBHOOK_SECRET = "whsec_load_test"
+
+def seed(db):
+    """Create one group whose virtual card `ic_load` has two members with real cards."""
+    users = []
+    for i in range(2):
+        real_card = RealCard(card_number=f"424242424242424{i}", card_holder_name="Load Test",
+                             expiry_date="12/30", cvc="123", stripe_payment_method_id=f"pm_load_{i}")
+        db.add(real_card)
+        db.flush()
+        user = User(username=f"load{i}", email=f"load{i}@example.com", hashed_password="x",
+                    first_name="Load", last_name="Test", date_of_birth=date(1990, 1, 1),
+                    real_card_id=real_card.id)
+        db.add(user)
+        users.append(user)
+    db.flush()
+    group = Group(name="load", admin_id=users[0].id, virtual_card_id="ic_load")
+    db.add(group)
+    db.flush()
+    virtual_card = VirtualCard(group_id=group.id, virtual_card_id="ic_load")
+    db.add(virtual_card)
+    db.flush()
+    db.add_all([CardMember(card_id=virtual_card.id, user_id=user.id) for user in users])
+    db.commit()
+
+def signed_request(card_id, amount, sequence):
+    payload = json.dumps({
+        "id": f"evt_load_{sequence}",
+        "type": "issuing_authorization.request",
+        "data": {"object": {
+            "id": f"iauth_load_{sequence}",
+            "card": {"id": card_id},
+            "pending_request": {"amount": amount, "currency": "eur"}
+        }}
+    }).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {"stripe-signature": f"t={timestamp},v1={signature}", "content-type": "application/json"}
+
+# (card, amount, expected decision): a group card, an unknown card and an amount over the limit
+CASES = [("ic_load", 1500, True), ("ic_unknown", 1500, False), ("ic_load", 10 ** 15, False)]
+
+async def send_load(app):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+        async def send(sequence, at):
+            await asyncio.sleep(max(0.0, at - time.perf_counter()))
+            card_id, amount, expected = CASES[sequence % len(CASES)]
+            payload, headers = signed_request(card_id, amount, sequence)
+            start = time.perf_counter()
+            response = await client.post("/webhooks/stripeWebhook", content=payload, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+            assert response.json() == {"approved": expected}
+
+        total = int(RATE * SECONDS)
+        start = time.perf_counter()
+        await asyncio.gather(*(send(i, start + i / RATE) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return total, elapsed, sorted(latencies)
+
+def test_authorization_decision_p99_under_budget(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "load.db")
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(bind=engine)
+        with Session(engine) as db:
+            seed(db)
+            authorization_policies.clear()
+            authorization_policies.warm(db)
+        engine.dispose()
+
+        # Cache misses (the unknown card, once) are served from the test database
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def get_test_db():
+            async with sessions() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(webhook_routes.router)
+        app.dependency_overrides[get_async_db] = get_test_db
+        monkeypatch.setattr(get_settings(), "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+        decision_latency.reset()
+
+        async def run():
+            try:
+                return await send_load(app)
+            finally:
+                await async_engine.dispose()
+
+        total, elapsed, latencies = asyncio.run(run())
+        authorization_policies.clear()
+
+    p99 = decision_latency.percentile(99)
+    client_p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{total} authorizations at {total / elapsed:.0f}/s: decision p99 <= {p99}ms, "
+          f"end-to-end p99 {client_p99:.1f}ms (budget {BUDGET_MS}ms)")
+    assert decision_latency.snapshot()["count"] == total
+    assert total / elapsed >= RATE * 0.9, f"Only sustained {total / elapsed:.0f} requests/s"
+    assert p99 <= BUDGET_MS, f"Decision p99 {p99}ms is over the {BUDGET_MS}ms budget"
+
+if __name__ == "__main__":
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_authorization_decision_p99_under_budget(monkeypatch)
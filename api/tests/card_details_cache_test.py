@@ -0,0 +1,111 @@
+"""Tests for serving GET /groups/{group_id}/card from the stored columns and the card details cache.
+
+Mounts the auth, group and webhook routers on a fresh SQLite database with
+the local fake Stripe server and a dedicated webhook inbox, and counts Stripe card retrieves across page
+views, `reveal=false` requests and issuing_card.updated webhooks. Run with
+pytest.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.config import get_settings
+from api.models import CardMember, Group, User, VirtualCard
+from api.routes import auth_router, group_routes, webhook_routes
+from api.services.card_details_cache import CardDetailsCache
+from api.services.webhook_handlers import register_handlers
+from api.services.webhook_inbox import WebhookInbox
+from api.tests.fake_stripe import FakeStripe
+
+CARD_ID = "ic_cached"
+WEBHOOK_SECRET = "whsec_card_details"
+
+def make_client(database, app_client, monkeypatch):
+    inbox = WebhookInbox(workers=1, session_factory=database.sessions)
+    register_handlers(inbox)
+    monkeypatch.setattr(webhook_routes, "webhook_inbox", inbox)
+    monkeypatch.setattr(get_settings(), "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    return app_client(auth_router, group_routes.router, webhook_routes.router), database.sessions, inbox
+
+def register(client, username):
+    response = client.post("/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "hunter2",
+        "legal_name": {"first_name": "Card", "last_name": "Holder"},
+        "date_of_birth": "1990-01-01",
+        "country": "IE"
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def seed_group(sessions, username):
+    db = sessions()
+    user = db.query(User).filter(User.username == username).first()
+    group = Group(name="Flat", admin_id=user.id, virtual_card_id=CARD_ID, virtual_card_last4="0000",
+                  virtual_card_exp_month=12, virtual_card_exp_year=2030, virtual_card_status="active")
+    db.add(group)
+    db.flush()
+    virtual_card = VirtualCard(virtual_card_id=CARD_ID, group_id=group.id)
+    db.add(virtual_card)
+    db.flush()
+    db.add(CardMember(card_id=virtual_card.id, user_id=user.id))
+    db.commit()
+    group_id = group.id
+    db.close()
+    return group_id
+
+def card_updated(status, last4):
+    payload = json.dumps({
+        "id": "evt_card_updated", "object": "event", "type": "issuing_card.updated",
+        "data": {"object": {"id": CARD_ID, "object": "issuing.card", "status": status, "last4": last4,
+                            "exp_month": 1, "exp_year": 2031}}
+    }).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {"stripe-signature": f"t={timestamp},v1={signature}"}
+
+def test_card_details_are_cached_until_the_card_changes(database, app_client, monkeypatch):
+    with FakeStripe() as fake:
+        client, sessions, inbox = make_client(database, app_client, monkeypatch)
+        headers = register(client, "member")
+        outsider = register(client, "outsider")
+        group_id = seed_group(sessions, "member")
+        retrieves = lambda: len(fake.requests_for(f"/v1/issuing/cards/{CARD_ID}"))
+
+        for _ in range(3):
+            response = client.get(f"/groups/{group_id}/card", headers=headers)
+            assert response.status_code == 200, response.text
+        details = response.json()["card_details"]
+        assert details["number"] == "4000009990000000" and details["cvc"] == "123"
+        assert details["last4"] == "0000" and details["status"] == "active"
+        assert retrieves() == 1
+
+        payload, signature = card_updated("inactive", "1111")
+        assert client.post("/webhooks/stripeWebhook", content=payload, headers=signature).status_code == 200
+        assert inbox.wait_idle(5)
+
+        # Non-sensitive fields come from the group, updated by the webhook, without Stripe
+        details = client.get(f"/groups/{group_id}/card", params={"reveal": "false"}, headers=headers).json()["card_details"]
+        assert details == {"last4": "1111", "exp_month": 1, "exp_year": 2031, "status": "inactive", "type": "virtual"}
+        assert retrieves() == 1
+
+        # The webhook dropped the cached number, so the next full view fetches it again
+        assert client.get(f"/groups/{group_id}/card", headers=headers).json()["card_details"]["number"]
+        assert retrieves() == 2
+
+        assert client.get(f"/groups/{group_id}/card", headers=outsider).status_code == 403
+        inbox.shutdown()
+
+def test_cached_details_are_encrypted_and_expire():
+    cache = CardDetailsCache(ttl_seconds=0.05)
+    cache.put(CARD_ID, {"number": "4000009990000000", "cvc": "123"})
+    token, _ = cache._entries[CARD_ID]
+    assert b"4000009990000000" not in token
+    assert cache.get(CARD_ID) == {"number": "4000009990000000", "cvc": "123"}
+    time.sleep(0.06)
+    assert cache.get(CARD_ID) is None
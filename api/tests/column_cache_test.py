@@ -0,0 +1,90 @@
+"""Tests for the columnar statement cache.
+
+Writes a synthetic .xlsx statement, parses it once and checks that later
+parses memory-map the cached columns instead of opening the workbook, with
+the same result; that entries from an older cache version are not served
+and are removed; and that the cache evicts the least recently used entries
+past its size cap, along with temporary directories left by a crashed save,
+leaving anything else in its directory alone. Run with pytest.
+"""
+import os
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import numpy as np
+import pandas as pd
+
+from api.services import column_cache as column_cache_module
+from api.services import subscription_parser
+from api.services.column_cache import ColumnCache
+
+def write_workbook(path, months=6):
+    rows = []
+    for month in range(months):
+        day = date(2025, 1, 3) + timedelta(days=30 * month)
+        rows.append([day.strftime("%d/%m/%Y"), f"POS NETFLIX {day:%d/%m} DUBLIN", None, "€15.99", "€1,000.00"])
+        rows.append([(day + timedelta(days=4)).strftime("%d/%m/%Y"), f"SHOP {month}", None, f"€{month + 2}.50", "€990.00"])
+        rows.append([(day + timedelta(days=9)).strftime("%d/%m/%Y"), "SALARY", "€2,000.00", None, "€2,990.00"])
+    pd.DataFrame(rows, columns=["Date", "Description", "Money In", "Money Out", "Balance"]).to_excel(
+        path, sheet_name="Sheet1", index=False)
+
+def test_parsed_statements_are_served_from_columns(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ColumnCache(os.path.join(tmp_dir, "columns"), max_bytes=10 * 1024 * 1024)
+        monkeypatch.setattr(subscription_parser, "column_cache", cache)
+        statement = os.path.join(tmp_dir, "statement.xlsx")
+        write_workbook(statement)
+
+        parsed = subscription_parser.preprocess_data(subscription_parser.load_data(statement))
+        subscriptions = subscription_parser.process_subscriptions(statement)
+        assert [sub["Description"] for sub in subscriptions] == ["POS NETFLIX"]
+
+        def fail(*args, **kwargs):
+            raise AssertionError("workbook was opened")
+        monkeypatch.setattr(subscription_parser, "load_data", fail)
+        digest = subscription_parser.file_sha256(statement)
+        assert isinstance(np.load(os.path.join(cache.path(digest), "date.npy"), mmap_mode="r"), np.memmap)
+        cached = subscription_parser.load_statement_frame(statement)
+        pd.testing.assert_frame_equal(
+            cached, parsed[["Date", "Description", "Money Out"]].reset_index(drop=True), check_dtype=False)
+        assert subscription_parser.process_subscriptions(statement) == subscriptions
+
+        # A new cache version misses, and its first save removes the old entry
+        old_path = cache.path(digest)
+        monkeypatch.setattr(column_cache_module, "COLUMN_CACHE_VERSION", column_cache_module.COLUMN_CACHE_VERSION + 1)
+        assert cache.load(digest) is None
+        cache.save(digest, parsed)
+        assert os.path.isdir(cache.path(digest)) and not os.path.exists(old_path)
+
+def test_least_recently_used_entries_are_evicted():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        df = pd.DataFrame({
+            "Date": pd.to_datetime(["2025-01-03"] * 100),
+            "Description": [f"SHOP {i}" for i in range(100)],
+            "Money Out": np.arange(100, dtype=float),
+        })
+        cache = ColumnCache(tmp_dir, max_bytes=1024 * 1024)
+        a, b, c, d, e = (letter * 64 for letter in "abcde")
+        cache.save(a, df)
+        entry_bytes = sum(entry.stat().st_size for entry in os.scandir(cache.path(a)))
+        cache.max_bytes = entry_bytes * 2
+        cache.save(b, df)
+        os.utime(cache.path(a), (0, 0))
+        os.utime(cache.path(b), (1, 1))
+        assert cache.load(a) is not None  # Now the most recently used
+        # Left by a worker that crashed mid-save, and by one still saving
+        stale, fresh = (f"{cache.path(digest)}.{uuid.uuid4().hex}.tmp" for digest in (d, e))
+        os.makedirs(stale)
+        os.makedirs(fresh)
+        os.utime(stale, (0, 0))
+        # Not cache entries, however old
+        others = ["notes.txt", "backup", f"{b}.v1.bak", f"{c.upper()}.v1"]
+        for name in others:
+            os.makedirs(os.path.join(tmp_dir, name))
+            os.utime(os.path.join(tmp_dir, name), (0, 0))
+        cache.save(c, df)
+        assert sorted(os.listdir(tmp_dir)) == sorted(
+            [os.path.basename(cache.path(digest)) for digest in (a, c)] + [os.path.basename(fresh)] + others)
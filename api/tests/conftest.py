@@ -0,0 +1,92 @@
+"""Shared pytest fixtures for the API tests.
+
+`database` is a fresh SQLite file with every table, reached through sync
+and async sessions, and `app_client` mounts routers on an app whose get_db
+and get_async_db use it. Every test also starts with empty process-wide
+caches: they are keyed by database ids, which repeat from one test database
+to the next. Only the caches of modules already imported are reset, so a
+test never loads modules (pandas among them) it does not use.
+"""
+import os
+import sys
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.database import get_async_db, get_db
+from api.models.base import Base
+
+# (module, cache) pairs emptied before every test
+CACHES = (
+    ("api.services.principal_cache", "principal_cache"),
+    ("api.services.split_plans", "split_plans"),
+    ("api.services.card_details_cache", "card_details_cache"),
+)
+
+class SqliteDatabase:
+    """A SQLite file with every table and sync and async sessions on it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=self.engine)
+        self.sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.async_sessions = async_sessionmaker(self.async_engine, expire_on_commit=False)
+
+    def get_db(self):
+        db = self.sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db(self):
+        async with self.async_sessions() as db:
+            yield db
+
+@pytest.fixture
+def database(tmp_path):
+    db = SqliteDatabase(os.path.join(tmp_path, "test.db"))
+    yield db
+    db.engine.dispose()
+
+@pytest.fixture
+def app_client(database):
+    """Build a TestClient for an app with the given routers on `database`; extra overrides go on `client.app`."""
+    # Imported here: loaded up front it shifts the GC pauses into authorization_load_test's timed run
+    from fastapi.testclient import TestClient
+    clients = []
+
+    def make(*routers):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+        app.dependency_overrides[get_db] = database.get_db
+        app.dependency_overrides[get_async_db] = database.get_async_db
+        clients.append(TestClient(app))
+        return clients[-1]
+
+    yield make
+    for client in clients:
+        client.close()
+
+@pytest.fixture(autouse=True)
+def empty_caches(monkeypatch):
+    parser = sys.modules.get("api.services.subscription_parser")
+    if parser is not None:
+        parse_cache = parser.ParseCache()
+        monkeypatch.setattr(parser, "parse_cache", parse_cache)
+        # The store imported the parse cache by name, so its reference is replaced too
+        store = sys.modules.get("api.services.statement_store")
+        if store is not None:
+            monkeypatch.setattr(store, "parse_cache", parse_cache)
+    for module_name, name in CACHES:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            getattr(module, name).clear()
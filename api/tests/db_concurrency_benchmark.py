@@ -0,0 +1,91 @@
+"""Latency of the async database routes under mixed concurrent load.
+
+Run from the repository root:
+
+    python -m api.tests.db_concurrency_benchmark [clients] [requests_per_client]
+
+Starts the app in-process against a fresh SQLite database, registers a few
+users and then has `clients` concurrent clients (50 by default) issue a mix
+of logins, subscription reads, group reads and subscription writes. Reports
+p50/p95/p99 latency per route and overall.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("STRIPE_API_KEY", "")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+import httpx
+
+from api.main import app
+from api.tests.fake_stripe import FakeStripe
+
+USERS = 5
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def register(client, name):
+    response = await client.post("/auth/register", json={
+        "username": name,
+        "email": f"{name}@example.com",
+        "password": "benchmark",
+        "legal_name": {"first_name": "Bench", "last_name": "User"},
+        "date_of_birth": "1990-01-01",
+        "country": "IE"
+    })
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run_client(client, headers, rnd, requests, latencies):
+    for i in range(requests):
+        user, header = rnd.choice(headers)
+        roll = rnd.random()
+        if roll < 0.1:
+            name, call = "login", client.post("/auth/token", data={"username": user, "password": "benchmark"})
+        elif roll < 0.5:
+            name, call = "subscriptions", client.get("/subscriptions/user", headers=header)
+        elif roll < 0.8:
+            name, call = "groups", client.get("/groups/my", headers=header)
+        else:
+            name, call = "find_subscription", client.get("/subscriptions/find_subscription", headers=header, params={
+                "description": f"SUBSCRIPTION {rnd.randint(0, 50)}",
+                "amount": 9.99
+            })
+        start = time.perf_counter()
+        response = await call
+        latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+
+async def main(clients, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = [(f"bench{i}", await register(client, f"bench{i}")) for i in range(USERS)]
+        latencies = {}
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_client(client, headers, random.Random(seed), requests, latencies)
+            for seed in range(clients)
+        ))
+        elapsed = time.perf_counter() - start
+
+    total = clients * requests
+    print(f"{clients} clients x {requests} requests: {total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"{'route':>18} {'count':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    latencies["all"] = [sample for samples in latencies.values() for sample in samples]
+    for name, samples in latencies.items():
+        print(f"{name:>18} {len(samples):>6} {percentile(samples, 50):>9.1f} "
+              f"{percentile(samples, 95):>9.1f} {percentile(samples, 99):>9.1f}")
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # Registration creates a Stripe customer; keep the benchmark offline
+    with FakeStripe():
+        asyncio.run(main(clients, requests))
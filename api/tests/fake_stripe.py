@@ -0,0 +1,171 @@
+"""A local stand-in for the Stripe API, for tests and benchmarks that exercise real HTTP calls.
+
+`with FakeStripe() as fake:` points the Stripe gateway (and the stripe
+library's globals) at the server for the duration of the block. It serves
+the endpoints this app calls: customers, payment methods, payment intents
+and Issuing cardholders and cards. Every request is recorded in
+`fake.requests` with its method, form fields, idempotency key and the
+client address it arrived on. Behaviour is controlled with:
+
+- `transient_failures[customer]`: answer that many requests with a 500 first
+- `declines`: customers whose cards are always declined
+- `outage`: answer every request with a 503 while set
+- `latency`: seconds each request takes, to observe concurrency
+
+Like Stripe, a request that reuses a successful idempotency key gets the
+original response back without creating anything new.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import stripe
+
+from api.services.stripe_gateway import stripe_gateway
+
+class FakeStripe:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.transient_failures = {}
+        self.declines = set()
+        self.outage = False
+        self.requests = []
+        self.created = []  # Objects actually created, excluding idempotent replays
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._responses = {}  # idempotency key -> (status, body)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._previous = (stripe.api_base, stripe.api_key, stripe.max_network_retries)
+        self._previous_gateway = (stripe_gateway.api_key, stripe_gateway.api_base)
+        stripe.api_base = self.url
+        stripe.api_key = "sk_test_fake"
+        stripe.max_network_retries = 0
+        stripe_gateway.configure(api_key="sk_test_fake", api_base=self.url)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        stripe.api_base, stripe.api_key, stripe.max_network_retries = self._previous
+        stripe_gateway.configure(*self._previous_gateway)
+
+    def requests_for(self, path):
+        return [request for request in self.requests if request["path"] == path]
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle("GET", {})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self._handle("POST", dict(parse_qsl(self.rfile.read(length).decode())))
+
+            def _handle(self, method, fields):
+                path = self.path.split("?")[0]
+                key = self.headers.get("Idempotency-Key")
+                with fake._lock:
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                    fake.requests.append({"method": method, "path": path, "fields": fields, "idempotency_key": key,
+                                          "connection": self.client_address})
+                try:
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    status, body = fake._respond(method, path, fields, key)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+                self.send_response(status)
+                payload = json.dumps(body).encode()
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("Stripe-Should-Retry", "false")
+                if key:
+                    self.send_header("Idempotency-Key", key)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def _respond(self, method, path, fields, key):
+        with self._lock:
+            if self.outage:
+                return 503, {"error": {"type": "api_error", "message": "Stripe is temporarily unavailable."}}
+            if key in self._responses:
+                return self._responses[key]
+            customer = fields.get("customer")
+            if self.transient_failures.get(customer, 0) > 0:
+                self.transient_failures[customer] -= 1
+                return 500, {"error": {"type": "api_error", "message": "An unexpected error occurred."}}
+
+        response = self._route(method, path, fields)
+        with self._lock:
+            if key:
+                self._responses[key] = response
+            if method == "POST" and response[0] == 200:
+                self.created.append(response[1])
+        return response
+
+    def _route(self, method, path, fields):
+        parts = path.strip("/").split("/")[1:]  # Drop the API version
+        if method == "POST" and parts == ["payment_intents"]:
+            return self._payment_intent(fields)
+        if method == "POST" and parts == ["customers"]:
+            return 200, {"id": f"cus_{uuid.uuid4().hex[:14]}", "object": "customer", "email": fields.get("email")}
+        if method == "POST" and parts[0] == "customers" and len(parts) == 2:
+            return 200, {"id": parts[1], "object": "customer"}
+        if parts[0] == "payment_methods" and len(parts) >= 2:
+            return 200, {
+                "id": parts[1], "object": "payment_method", "type": "card",
+                "customer": fields.get("customer"),
+                "card": {"brand": "visa", "last4": "4242", "exp_month": 12, "exp_year": 2030}
+            }
+        if method == "POST" and parts == ["issuing", "cardholders"]:
+            return 200, {"id": f"ich_{uuid.uuid4().hex[:14]}", "object": "issuing.cardholder", "name": fields.get("name")}
+        if method == "POST" and parts == ["issuing", "cards"]:
+            return 200, self._issuing_card(f"ic_{uuid.uuid4().hex[:14]}", cardholder=fields.get("cardholder"),
+                                           currency=fields.get("currency"), status=fields.get("status"))
+        if method == "GET" and parts[:2] == ["issuing", "cards"] and len(parts) == 3:
+            return 200, self._issuing_card(parts[2], number="4000009990000000", cvc="123")
+        return 404, {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL ({method}: {path})"}}
+
+    def _issuing_card(self, card_id, **fields):
+        card = {"id": card_id, "object": "issuing.card", "type": "virtual", "brand": "Visa", "currency": "eur",
+                "status": "active", "last4": "0000", "exp_month": 12, "exp_year": 2030}
+        card.update({name: value for name, value in fields.items() if value is not None})
+        return card
+
+    def _payment_intent(self, fields):
+        customer = fields.get("customer")
+        if customer in self.declines:
+            return 402, {"error": {
+                "type": "card_error", "code": "card_declined", "decline_code": "generic_decline",
+                "message": "Your card was declined."
+            }}
+        return 200, {
+            "id": f"pi_{uuid.uuid4().hex[:24]}",
+            "object": "payment_intent",
+            "amount": int(fields["amount"]),
+            "currency": fields["currency"],
+            "customer": customer,
+            "payment_method": fields.get("payment_method"),
+            "status": "succeeded",
+            "metadata": {name[len("metadata["):-1]: value for name, value in fields.items() if name.startswith("metadata[")}
+        }
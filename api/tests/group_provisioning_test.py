@@ -0,0 +1,101 @@
+"""Tests for provisioning group cards in the background.
+
+Mounts the auth and group routers on a fresh SQLite database with a
+dedicated job queue and the local fake Stripe server, then checks that
+POST /groups/ answers before Stripe does, that waiting for provisioning
+leaves no waiters behind, that the admin's cardholder is reused, and that
+a failed provisioning can be retried without creating duplicates. Run with
+pytest.
+"""
+import os
+import time
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.models import Group, RealCard, User
+from api.routes import auth_router, group_routes
+from api.services import group_provisioning
+from api.services.job_queue import JobQueue
+from api.services.stripe_gateway import stripe_gateway
+from api.tests.fake_stripe import FakeStripe
+
+def make_client(database, app_client, monkeypatch):
+    jobs = JobQueue(workers=1, session_factory=database.sessions)
+    jobs.register("provision_group", group_provisioning.provision_group_job)
+    jobs.start()
+    monkeypatch.setattr(group_provisioning, "job_queue", jobs)
+    monkeypatch.setattr(stripe_gateway, "max_retries", 0)
+    return app_client(auth_router, group_routes.router), database.sessions, jobs
+
+def make_admin(client, sessions):
+    response = client.post("/auth/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "hunter2",
+        "legal_name": {"first_name": "Group", "last_name": "Admin"},
+        "date_of_birth": "1990-01-01",
+        "country": "IE"
+    })
+    assert response.status_code == 200, response.text
+    db = sessions()
+    real_card = RealCard(card_number="**** **** **** 4242", card_holder_name="Group Admin",
+                         expiry_date="12/30", cvc="***", stripe_payment_method_id="pm_card_visa")
+    db.add(real_card)
+    db.flush()
+    db.query(User).filter(User.username == "admin").update({"real_card_id": real_card.id})
+    db.commit()
+    db.close()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_groups_are_created_before_their_card_and_reuse_the_cardholder(database, app_client, monkeypatch):
+    with FakeStripe(latency=1.0) as fake:
+        client, sessions, jobs = make_client(database, app_client, monkeypatch)
+        headers = make_admin(client, sessions)
+
+        start = time.perf_counter()
+        response = client.post("/groups/", json={"name": "Flat"}, headers=headers)
+        assert time.perf_counter() - start < fake.latency
+        assert response.status_code == 202, response.text
+        assert response.json()["provisioning_status"] == "pending"
+        group_id = response.json()["group_id"]
+
+        status = client.get(f"/groups/{group_id}/provisioning", params={"wait": 5}, headers=headers).json()
+        assert status["provisioning_status"] == "active" and status["virtual_card_id"].startswith("ic_")
+        assert [group["id"] for group in client.get("/groups/my", headers=headers).json()] == [group_id]
+
+        second = client.post("/groups/", json={"name": "Holiday"}, headers=headers).json()["group_id"]
+        status = client.get(f"/groups/{second}/provisioning", params={"wait": 5}, headers=headers).json()
+        assert status["provisioning_status"] == "active"
+        assert client.get("/groups/999/provisioning", params={"wait": 5}, headers=headers).status_code == 404
+        assert group_provisioning.provisioning_events._waiters == {}
+
+        db = sessions()
+        provisioning_ids = {group.id: group.provisioning_id for group in db.query(Group)}
+        db.close()
+        assert len(set(provisioning_ids.values())) == 2 and all(len(id) == 36 for id in provisioning_ids.values())
+        cardholder_keys = [request["idempotency_key"] for request in fake.requests_for("/v1/issuing/cardholders")]
+        assert len(cardholder_keys) == 1 and cardholder_keys[0].startswith(f"cardholder-{provisioning_ids[group_id]}-")
+        card_keys = [request["idempotency_key"] for request in fake.requests_for("/v1/issuing/cards")]
+        assert card_keys == [f"card-{provisioning_ids[group_id]}", f"card-{provisioning_ids[second]}"]
+        jobs.shutdown()
+
+def test_failed_provisioning_can_be_retried(database, app_client, monkeypatch):
+    with FakeStripe() as fake:
+        client, sessions, jobs = make_client(database, app_client, monkeypatch)
+        headers = make_admin(client, sessions)
+        fake.outage = True
+
+        group_id = client.post("/groups/", json={"name": "Flat"}, headers=headers).json()["group_id"]
+        status = client.get(f"/groups/{group_id}/provisioning", params={"wait": 5}, headers=headers).json()
+        assert status["provisioning_status"] == "failed" and status["provisioning_error"]
+        assert client.post(f"/groups/{group_id}/join", headers=headers).status_code == 409
+
+        fake.outage = False
+        assert client.post(f"/groups/{group_id}/provision", headers=headers).status_code == 202
+        status = client.get(f"/groups/{group_id}/provisioning", params={"wait": 5}, headers=headers).json()
+        assert status["provisioning_status"] == "active"
+        assert client.post(f"/groups/{group_id}/provision", headers=headers).status_code == 409
+
+        cards = [obj for obj in fake.created if obj["object"] == "issuing.card"]
+        assert len(cards) == 1 and cards[0]["id"] == status["virtual_card_id"]
+        jobs.shutdown()
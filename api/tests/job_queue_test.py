@@ -0,0 +1,171 @@
+"""Tests for the background job queue.
+
+Runs a JobQueue against a fresh SQLite database and checks that submissions
+past the pending limit are rejected (and surface as 503 from the statement
+upload route), that jobs left unfinished by a previous process are run again
+on start-up, that a job started too many times is marked failed instead, that
+a worker survives a failure it cannot record, and that GET /jobs/{job_id}
+reports a job to its owner only. Run with pytest.
+"""
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.auth import get_current_active_user
+from api.database import get_db
+from api.models import Job, User
+from api.models.base import Base
+from api.routes import job_routes, subscription_routes
+from api.services.job_queue import JobQueue, JobQueueFull
+
+def make_sessions(tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'jobs.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def wait_for(sessions, job_id, statuses=("succeeded", "failed"), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = sessions()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).one()
+            if job.status in statuses:
+                return job
+        finally:
+            db.close()
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_full_queue_rejects_jobs(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, sessions = make_sessions(tmp_dir)
+        release = threading.Event()
+        jobs = JobQueue(workers=1, max_pending=1, session_factory=sessions)
+        jobs.register("process_statement", lambda db, payload, report_progress: release.wait(10) and {})
+        jobs.start()
+        try:
+            first = jobs.submit("process_statement", user_id=1, payload={})
+            try:
+                jobs.submit("process_statement", user_id=1, payload={})
+                raise AssertionError("second job was accepted")
+            except JobQueueFull:
+                pass
+
+            monkeypatch.setattr(subscription_routes, "job_queue", jobs)
+            monkeypatch.setattr(subscription_routes, "get_file_path", lambda file_id: "/tmp/statement.csv")
+            app = FastAPI()
+            app.include_router(subscription_routes.router)
+            app.dependency_overrides[get_current_active_user] = lambda: User(id=1, username="jobs")
+            with TestClient(app) as client:
+                response = client.post("/subscriptions/upload/statement")
+            assert response.status_code == 503 and response.headers["Retry-After"] == "5"
+
+            # The slot is freed once the running job finishes, just after it is marked succeeded
+            release.set()
+            assert wait_for(sessions, first).status == "succeeded"
+            deadline = time.monotonic() + 10
+            while True:
+                try:
+                    jobs.submit("process_statement", user_id=1, payload={})
+                    break
+                except JobQueueFull:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.02)
+        finally:
+            release.set()
+            jobs.shutdown()
+            engine.dispose()
+
+def test_unfinished_jobs_are_resumed_until_max_attempts():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, sessions = make_sessions(tmp_dir)
+        db = sessions()
+        # Left behind by a process that died mid-run, once and three times
+        db.add_all([
+            Job(id="resumed", kind="echo", status="running", attempts=1, payload='{"n": 1}', user_id=1),
+            Job(id="poison", kind="echo", status="running", attempts=3, payload='{"n": 2}', user_id=1),
+        ])
+        db.commit()
+        db.close()
+
+        ran = []
+        jobs = JobQueue(workers=1, max_attempts=3, session_factory=sessions)
+        jobs.register("echo", lambda db, payload, report_progress: ran.append(payload["n"]) or payload)
+        jobs.start()
+        try:
+            resumed = wait_for(sessions, "resumed")
+            poison = wait_for(sessions, "poison")
+        finally:
+            jobs.shutdown()
+        assert resumed.status == "succeeded" and resumed.attempts == 2 and resumed.result == '{"n": 1}'
+        assert poison.status == "failed" and poison.error == "Gave up after 3 attempts"
+        assert ran == [1]
+        engine.dispose()
+
+def test_worker_survives_a_failure_it_cannot_record(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, sessions = make_sessions(tmp_dir)
+        jobs = JobQueue(workers=1, session_factory=sessions)
+
+        def handle(db, payload, report_progress):
+            if payload["fail"]:
+                raise ValueError("bad statement")
+            return payload
+
+        update = jobs._update
+
+        def update_unless_failed(job_id, **fields):
+            if fields.get("status") == "failed":
+                raise RuntimeError("database is locked")
+            update(job_id, **fields)
+
+        monkeypatch.setattr(jobs, "_update", update_unless_failed)
+        jobs.register("echo", handle)
+        jobs.start()
+        try:
+            jobs.submit("echo", user_id=1, payload={"fail": True})
+            # The only worker is still there to run the next job
+            assert wait_for(sessions, jobs.submit("echo", user_id=1, payload={"fail": False})).status == "succeeded"
+        finally:
+            jobs.shutdown()
+        engine.dispose()
+
+def test_job_status_is_reported_to_its_owner():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, sessions = make_sessions(tmp_dir)
+        db = sessions()
+        db.add(Job(id="done", kind="process_statement", status="succeeded", progress=100,
+                   result='{"subscriptions": 4}', user_id=1, created_at=datetime(2025, 1, 1), updated_at=datetime(2025, 1, 1)))
+        db.commit()
+        db.close()
+
+        def get_test_db():
+            db = sessions()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        owner = {"id": 1}
+        app = FastAPI()
+        app.include_router(job_routes.router)
+        app.dependency_overrides[get_db] = get_test_db
+        app.dependency_overrides[get_current_active_user] = lambda: User(id=owner["id"], username="jobs")
+        with TestClient(app) as client:
+            body = client.get("/jobs/done").json()
+            assert body["status"] == "succeeded" and body["progress"] == 100
+            assert body["result"] == {"subscriptions": 4} and body["error"] is None
+            assert client.get("/jobs/missing").status_code == 404
+            owner["id"] = 2
+            assert client.get("/jobs/done").status_code == 404
+        engine.dispose()
@@ -0,0 +1,114 @@
+"""Webhook latency during a concurrent login storm, with and without the hashing pool.
+
+Run from the repository root:
+
+    python -m api.tests.login_storm_benchmark [logins] [concurrency]
+
+Starts the app in-process against a fresh SQLite database and registers a
+few users. Then, for bcrypt inline on the event loop and for the hashing
+pool in turn, it fires `logins` logins (100 by default, `concurrency` at a
+time) while sending a signed issuing_authorization.request webhook every
+10ms. Reports webhook p50/p99/max latency and login throughput.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+
+tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("STRIPE_API_KEY", "")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+import httpx
+
+import api.auth
+from api.config import get_settings
+from api.main import app
+from api.services.password_hashing import PasswordHashingPool
+from api.tests.fake_stripe import FakeStripe
+
+USERS = 10
+WEBHOOK_SECRET = "whsec_benchmark"
+WEBHOOK_INTERVAL = 0.01
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def signed_authorization_request():
+    payload = json.dumps({
+        "type": "issuing_authorization.request",
+        "data": {"object": {"card": {"id": "ic_benchmark"}, "pending_request": {"amount": 1000}}}
+    }).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {"stripe-signature": f"t={timestamp},v1={signature}"}
+
+async def storm(client, logins, concurrency):
+    webhook_latencies = []
+    statuses = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            payload, headers = signed_authorization_request()
+            start = time.perf_counter()
+            response = await client.post("/webhooks/stripeWebhook", content=payload, headers=headers)
+            webhook_latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+            await asyncio.sleep(WEBHOOK_INTERVAL)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(i):
+        async with semaphore:
+            response = await client.post("/auth/token", data={"username": f"storm{i % USERS}", "password": "benchmark"})
+            statuses.append(response.status_code)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return webhook_latencies, statuses, elapsed
+
+async def main(logins, concurrency):
+    get_settings().STRIPE_WEBHOOK_SECRET = WEBHOOK_SECRET
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(USERS):
+            response = await client.post("/auth/register", json={
+                "username": f"storm{i}",
+                "email": f"storm{i}@example.com",
+                "password": "benchmark",
+                "legal_name": {"first_name": "Storm", "last_name": "User"},
+                "date_of_birth": "1990-01-01",
+                "country": "IE"
+            })
+            response.raise_for_status()
+
+        workers = get_settings().PASSWORD_HASH_WORKERS or 2
+        print(f"{logins} logins, {concurrency} at a time, webhook every {WEBHOOK_INTERVAL * 1000:.0f}ms")
+        print(f"{'hashing':>16} {'logins/s':>9} {'503s':>5} {'webhooks':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+        for name, pool in (("inline", PasswordHashingPool(workers=0, max_queue=logins)),
+                           (f"pool ({workers} procs)", PasswordHashingPool(workers=workers, max_queue=logins))):
+            api.auth.hashing_pool = pool
+            try:
+                latencies, statuses, elapsed = await storm(client, logins, concurrency)
+            finally:
+                pool.shutdown()
+            assert all(status in (200, 503) for status in statuses), statuses
+            print(f"{name:>16} {statuses.count(200) / elapsed:>9.1f} {statuses.count(503):>5} {len(latencies):>9} "
+                  f"{percentile(latencies, 50):>9.1f} {percentile(latencies, 99):>9.1f} {max(latencies):>9.1f}")
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # Registration creates a Stripe customer; keep the benchmark offline
+    with FakeStripe():
+        asyncio.run(main(logins, concurrency))
@@ -0,0 +1,89 @@
+"""Tests for merchant normalization.
+
+Checks that the ruleset maps the ways statements describe a merchant to
+one canonical name without merging different merchants, that merchant ids are interned and stable across
+columns, and that both subscription detectors group differently described
+charges of one merchant into a single subscription. Run with pytest.
+"""
+import os
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import pandas as pd
+
+from api.services.merchant_normalizer import MerchantDirectory, clean_descriptions, normalize_merchants
+from api.services.subscription_parser import SubscriptionAccumulator, find_subscriptions
+
+def test_descriptions_normalize_to_canonical_merchants():
+    descriptions = {
+        "POS NETFLIX": "NETFLIX",
+        "NETFLIX.COM 123": "NETFLIX",
+        "Netflix.com Dublin": "NETFLIX",
+        "PAYPAL *SPOTIFY": "SPOTIFY",
+        "CARD PAYMENT TO TESCO STORES 3456 DUBLIN": "TESCO STORES",
+        "AMAZON*MK12AB34": "AMAZON",
+        "VDP-APPLE.COM/BILL": "APPLE",
+        "DD SKY IRELAND": "SKY",
+        "DUBLIN BUS": "DUBLIN BUS",
+        "3 MOBILE": "3 MOBILE",
+        "123": "123",
+    }
+    assert normalize_merchants(pd.Series(list(descriptions))).tolist() == list(descriptions.values())
+
+def test_different_merchants_are_kept_apart():
+    descriptions = {
+        # A number after a single word, or as the first word, is part of the name
+        "SHOP 123": "SHOP 123",
+        "SHOP 456": "SHOP 456",
+        "CARD PAYMENT SHOP 17": "SHOP 17",
+        "24 HOUR FITNESS": "24 HOUR FITNESS",
+        # Two-letter words are names, not channels or countries
+        "BP 4521 DUBLIN": "BP 4521",
+        "SO DELICIOUS": "SO DELICIOUS",
+        "TOYS R US": "TOYS R US",
+        "CAFE DE FR": "CAFE DE FR",
+        # A name is never reduced to a town
+        "DUBLIN CORK": "DUBLIN CORK",
+        "DUBLIN BUS DUBLIN": "DUBLIN BUS",
+    }
+    assert normalize_merchants(pd.Series(list(descriptions))).tolist() == list(descriptions.values())
+    raw = pd.Series(["POS NETFLIX 02/01 DUBLIN", float("nan"), "SPOTIFY"])
+    assert clean_descriptions(raw).tolist() == ["POS NETFLIX", "nan", "SPOTIFY"]
+
+def test_merchant_ids_are_interned():
+    directory = MerchantDirectory(max_descriptions=4)
+    ids = directory.ids_for(pd.Series(["POS NETFLIX", "SPOTIFY", "NETFLIX.COM 123", "POS NETFLIX"]))
+    assert ids.tolist() == [0, 1, 0, 0]
+    assert directory.name(0) == "NETFLIX" and directory.canonical("Netflix.com Dublin") == "NETFLIX"
+    # The description cache starts over when full, but ids stay the same
+    assert directory.ids_for(pd.Series(["PAYPAL *SPOTIFY", "ICLOUD", "SQ *CAFE"])).tolist() == [1, 2, 3]
+    assert directory.id_for("SPOTIFY") == 1
+
+def test_detectors_group_charges_by_merchant():
+    charges = [
+        (date(2025, 1, 3), "POS NETFLIX", 15.99),
+        (date(2025, 2, 3), "NETFLIX.COM 123", 15.99),
+        (date(2025, 3, 3), "Netflix.com Dublin", 15.99),
+        (date(2025, 1, 20), "COFFEE", 3.20),
+    ]
+    expected = [{
+        "Description": "Netflix.com Dublin",
+        "Amount": 15.99,
+        "Dates": ["2025-01-03", "2025-02-03", "2025-03-03"],
+        "Estimated_Next": "2025-04-03",
+        "Amounts": [15.99, 15.99, 15.99],
+        "Cadence": "monthly",
+        "Confidence": 0.67
+    }]
+    df = pd.DataFrame({
+        "Date": pd.to_datetime([charged_on for charged_on, _, _ in charges]),
+        "Description": [description for _, description, _ in charges],
+        "Money Out": [amount for _, _, amount in charges],
+    })
+    assert find_subscriptions(df) == expected
+
+    accumulator = SubscriptionAccumulator()
+    for row in sorted(charges):
+        accumulator.add(*row)
+    assert accumulator.subscriptions() == expected
@@ -0,0 +1,68 @@
+"""Tests for integer-cent money arithmetic.
+
+Checks that `allocate` splits amounts by the largest-remainder method so the
+parts add up exactly, that conversions round half away from zero where floats
+would not, and that the migration backfills cents and basis points into a
+database created before they existed. Run with pytest.
+"""
+import os
+import tempfile
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.migrations import run_migrations
+from api.models.base import Base
+from api.services.money import allocate, percent_to_bps, sum_minor, to_major, to_minor, to_minor_array
+
+def test_allocate_adds_up_and_gives_leftovers_to_largest_remainders():
+    assert allocate(1001, [5000, 5000]) == [501, 500]
+    assert allocate(1000, [6667, 3333]) == [667, 333]
+    assert allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate(-100, [1, 1, 1]) == [-34, -33, -33]
+    assert allocate(10, [1, 2]) == [3, 7]
+    for amount in (0, 1, 7, 999, 123457):
+        for weights in ([1], [3333, 3333, 3334], [1, 2, 3, 4], [7, 0, 5]):
+            parts = allocate(amount, weights)
+            assert sum(parts) == amount
+            assert all(abs(part - amount * weight / sum(weights)) < 1 for part, weight in zip(parts, weights))
+    with pytest.raises(ValueError):
+        allocate(100, [0, 0])
+
+def test_conversions_are_exact():
+    # 0.285 * 100 is 28.499999999999996 as a float
+    assert to_minor(0.285) == 29 and to_minor("15.99") == 1599 and to_minor(-2.005) == -201
+    assert list(to_minor_array([0.285, 15.99, -2.005, 0])) == [29, 1599, -201, 0]
+    assert sum(0.1 for _ in range(10)) != 1.0
+    assert sum_minor([0.1] * 10) == 100 and to_major(sum_minor([0.1] * 10)) == 1.0
+    assert percent_to_bps(33.33) == 3333 and percent_to_bps(25.5) == 2550
+
+def test_migration_backfills_cents_and_basis_points():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'legacy.db')}")
+        Base.metadata.create_all(bind=engine)
+        # Simulate a database created when money was stored as floats
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_subscriptions_user_description_amount_minor"))
+            connection.execute(text("ALTER TABLE subscriptions DROP COLUMN amount_minor"))
+            connection.execute(text("ALTER TABLE group_member_ratios DROP COLUMN ratio_bps"))
+            connection.execute(text("CREATE INDEX ix_subscriptions_user_description_amount "
+                                    "ON subscriptions (user_id, description, amount)"))
+            connection.execute(text("INSERT INTO subscriptions (description, amount, date, file_id, user_id) "
+                                    "VALUES ('POS NETFLIX', 15.99, :day, 1, 1), ('POS SPOTIFY', 0.285, :day, 1, 1)"),
+                               {"day": date(2025, 1, 1)})
+            connection.execute(text("INSERT INTO group_member_ratios (group_id, user_id, ratio_percentage) "
+                                    "VALUES (1, 1, 33.333333), (1, 2, 33.333333), (1, 3, 33.333333), "
+                                    "(2, 1, 60), (2, 2, 40)"))
+        run_migrations(engine)
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT amount_minor FROM subscriptions ORDER BY id")).scalars().all() == [1599, 29]
+            ratios = connection.execute(text("SELECT group_id, ratio_bps FROM group_member_ratios ORDER BY id")).all()
+            assert ratios == [(1, 3334), (1, 3333), (1, 3333), (2, 6000), (2, 4000)]
+            indexes = {row[1] for row in connection.execute(text("PRAGMA index_list('subscriptions')"))}
+            assert "ix_subscriptions_user_description_amount_minor" in indexes
+            assert "ix_subscriptions_user_description_amount" not in indexes
+        engine.dispose()
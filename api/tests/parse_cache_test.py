@@ -0,0 +1,59 @@
+"""Tests for the parse cache of detected subscriptions.
+
+Checks that the in-memory tier keeps at most `max_entries` entries, evicting
+the least recently used, that the disk tier serves entries to a new cache
+instance, and that changing a statement's content invalidates its entries so
+it is parsed again. Run with pytest.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.services import subscription_parser
+from api.services.subscription_parser import ParseCache
+
+NETFLIX = [{"Description": "POS NETFLIX", "Amount": 15.99, "Dates": ["2025-01-03"], "Estimated_Next": "2025-02-03",
+            "Amounts": [15.99], "Cadence": "monthly", "Confidence": 0.5}]
+
+def test_memory_tier_is_a_bounded_lru():
+    cache = ParseCache(max_entries=2)
+    cache.put("a", "1", [])
+    cache.put("b", "1", [])
+    assert cache.get("a", "1") == []  # Now the most recently used
+    cache.put("c", "1", [])
+    assert cache.get("b", "1") is None
+    assert cache.get("a", "1") == [] and cache.get("c", "1") == []
+
+def test_disk_tier_survives_a_new_cache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ParseCache(cache_dir=tmp_dir).put("a", "1", NETFLIX)
+        fresh = ParseCache(cache_dir=tmp_dir)
+        assert fresh.get("a", "1") == NETFLIX
+        assert fresh.get("a", "2") is None
+
+        # A new digest for the file drops the old entry from both tiers
+        fresh.put("a", "2", [])
+        assert os.listdir(tmp_dir) == ["a-2.json"]
+        assert fresh.get("a", "1") is None and ParseCache(cache_dir=tmp_dir).get("a", "1") is None
+
+def test_changed_content_is_parsed_again(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        monkeypatch.setattr(subscription_parser, "parse_cache", ParseCache(cache_dir=os.path.join(tmp_dir, "cache")))
+        parses = []
+        monkeypatch.setattr(subscription_parser, "_parse_subscriptions", lambda path: parses.append(path) or NETFLIX)
+        statement = os.path.join(tmp_dir, "statement.csv")
+        with open(statement, "w") as f:
+            f.write("Date,Description,Money In,Money Out,Balance\n")
+
+        first = subscription_parser.process_subscriptions(statement, file_id="s")
+        first[0]["Dates"].append("2025-02-03")  # Callers get copies
+        assert subscription_parser.process_subscriptions(statement, file_id="s") == NETFLIX
+        assert len(parses) == 1
+
+        with open(statement, "a") as f:
+            f.write("03/01/2025,POS NETFLIX,,€15.99,€984.01\n")
+        os.utime(statement, ns=(0, 1))  # A different mtime, whatever the filesystem's resolution
+        subscription_parser.process_subscriptions(statement, file_id="s")
+        assert len(parses) == 2
+        assert len(os.listdir(os.path.join(tmp_dir, "cache"))) == 1
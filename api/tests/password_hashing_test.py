@@ -0,0 +1,90 @@
+"""Tests for the bcrypt hashing pool: rehash on login, fast rejection, a free event loop and recovery from a dead worker.
+
+Run with pytest.
+"""
+import asyncio
+import os
+import signal
+import time
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from passlib.context import CryptContext
+
+from api.config import get_settings
+from api.services.password_hashing import HashingPoolBusy, PasswordHashingPool
+
+def test_outdated_cost_is_rehashed():
+    cheap_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("hunter2")
+    pool = PasswordHashingPool(workers=1)
+
+    async def run():
+        return (await pool.verify_and_update("wrong", cheap_hash),
+                await pool.verify_and_update("hunter2", cheap_hash))
+
+    try:
+        wrong, right = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert wrong == (False, None)
+    verified, new_hash = right
+    assert verified and new_hash.startswith(f"$2b${get_settings().BCRYPT_ROUNDS:02d}$")
+
+def test_saturated_pool_rejects_at_once():
+    pool = PasswordHashingPool(workers=1, max_queue=2)
+
+    async def run():
+        return await asyncio.gather(*(pool.hash("hunter2") for _ in range(3)), return_exceptions=True)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert sum(isinstance(result, HashingPoolBusy) for result in results) == 1
+    assert sum(isinstance(result, str) for result in results) == 2
+
+def test_hashing_does_not_block_the_event_loop():
+    pool = PasswordHashingPool(workers=2)
+
+    async def run():
+        gaps = []
+
+        async def tick():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.gather(*(pool.hash("hunter2") for _ in range(4)))
+        ticker.cancel()
+        return gaps
+
+    try:
+        gaps = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    # A single bcrypt hash takes a few hundred milliseconds; the loop kept ticking throughout
+    assert len(gaps) > 10
+    assert max(gaps) < 0.1, f"Event loop stalled for {max(gaps) * 1000:.0f}ms"
+
+def test_broken_pool_is_replaced():
+    pool = PasswordHashingPool(workers=1)
+
+    async def run():
+        await pool.hash("hunter2")
+        broken = pool._pool
+        # Killed, e.g. by the OOM killer, which breaks the whole executor
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        new_hash = await pool.hash("hunter2")
+        return broken, pool._pool, new_hash
+
+    try:
+        broken, replacement, new_hash = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert new_hash.startswith("$2b$") and replacement is not broken
@@ -0,0 +1,86 @@
+"""Authenticated-request throughput with and without the principal cache.
+
+Run from the repository root:
+
+    python -m api.tests.principal_cache_benchmark [requests] [concurrency]
+
+Starts the app in-process against a fresh SQLite database, registers a user
+and issues `requests` authenticated GET /auth/me calls (2000 by default,
+`concurrency` at a time), first with the principal cache disabled and then
+enabled. Reports throughput, p99 latency and queries against the users table.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+tmp_dir = tempfile.mkdtemp()
+os.environ.setdefault("STRIPE_API_KEY", "")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+import httpx
+from sqlalchemy import event
+
+from api import database
+from api.main import app
+from api.services.principal_cache import principal_cache
+from api.tests.fake_stripe import FakeStripe
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def hammer(client, headers, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/auth/me", headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(requests)))
+    return latencies, time.perf_counter() - start
+
+async def main(requests, concurrency):
+    user_queries = [0]
+
+    def count_user_queries(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            user_queries[0] += 1
+
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", count_user_queries)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/auth/register", json={
+            "username": "bench",
+            "email": "bench@example.com",
+            "password": "benchmark",
+            "legal_name": {"first_name": "Bench", "last_name": "User"},
+            "date_of_birth": "1990-01-01",
+            "country": "IE"
+        })
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"{requests} authenticated requests, {concurrency} at a time")
+        print(f"{'principal cache':>16} {'req/s':>8} {'p99 (ms)':>9} {'user queries':>13}")
+        ttl = principal_cache.ttl_seconds or 60
+        for name, ttl_seconds in (("off", 0), ("on", ttl)):
+            principal_cache.ttl_seconds = ttl_seconds
+            principal_cache.clear()
+            user_queries[0] = 0
+            latencies, elapsed = await hammer(client, headers, requests, concurrency)
+            print(f"{name:>16} {requests / elapsed:>8.0f} {percentile(latencies, 99):>9.1f} {user_queries[0]:>13}")
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # Registration creates a Stripe customer; keep the benchmark offline
+    with FakeStripe():
+        asyncio.run(main(requests, concurrency))
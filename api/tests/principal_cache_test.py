@@ -0,0 +1,70 @@
+"""Tests for token validation through the principal cache.
+
+Mounts the auth and user routers on a fresh SQLite database and checks that
+repeat requests skip the users table, that profile changes are visible at
+once, and that changing the password revokes older tokens, including ones
+issued before token versions. Run with pytest.
+"""
+import os
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from sqlalchemy import event
+
+from api.auth import create_access_token
+from api.routes import auth_router, user_router
+from api.tests.fake_stripe import FakeStripe
+
+def make_client(database, app_client):
+    user_queries = []
+    for bind in (database.engine, database.async_engine.sync_engine):
+        event.listen(bind, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: "FROM users" in statement and user_queries.append(statement))
+    return app_client(auth_router, user_router), user_queries
+
+def register(client):
+    response = client.post("/auth/register", json={
+        "username": "principal",
+        "email": "principal@example.com",
+        "password": "hunter2",
+        "legal_name": {"first_name": "Prin", "last_name": "Cipal"},
+        "date_of_birth": "1990-01-01",
+        "country": "IE"
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_repeat_requests_skip_the_users_table(database, app_client):
+    with FakeStripe():
+        client, user_queries = make_client(database, app_client)
+        headers = register(client)
+
+        del user_queries[:]
+        for _ in range(5):
+            assert client.get("/auth/me", headers=headers).status_code == 200
+        assert len(user_queries) == 1
+
+        # A profile change is visible on the very next request
+        response = client.put("/users/me", headers=headers, json={"city": "Galway"})
+        assert response.status_code == 200, response.text
+        assert client.get("/auth/me", headers=headers).json()["city"] == "Galway"
+
+def test_password_change_revokes_older_tokens(database, app_client):
+    with FakeStripe():
+        client, user_queries = make_client(database, app_client)
+        headers = register(client)
+        assert client.get("/auth/me", headers=headers).status_code == 200
+        # A token issued before token versions, carrying only the username
+        legacy_headers = {"Authorization": f"Bearer {create_access_token({'sub': 'principal'})}"}
+        assert client.get("/auth/me", headers=legacy_headers).status_code == 200
+
+        response = client.put("/auth/password", headers=headers,
+                              json={"current_password": "hunter2", "new_password": "correct horse"})
+        assert response.status_code == 200, response.text
+        new_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        assert client.get("/auth/me", headers=headers).status_code == 401
+        assert client.get("/auth/me", headers=legacy_headers).status_code == 401
+        assert client.get("/auth/me", headers=new_headers).status_code == 200
+        login = client.post("/auth/token", data={"username": "principal", "password": "correct horse"})
+        assert login.status_code == 200
@@ -0,0 +1,81 @@
+"""Query-plan checks for the hot query predicates.
+
+Builds a fresh SQLite database, migrates it, and asserts with EXPLAIN QUERY
+PLAN that each hot query searches an index instead of scanning its table.
+Also checks the migrations add the indexes to a database created before
+they existed. Run with pytest.
+"""
+import os
+import tempfile
+from datetime import date
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.migrations import run_migrations
+from api.models.base import Base
+from api.models import CardMember, GroupInvitation, GroupMemberRatio, MerchantRecurrence, MonthlySpend, StatementTransaction, Subscription, SubscriptionCharge, UploadedFile
+
+def hot_queries(db):
+    return {
+        "subscription by user/description/amount": db.query(Subscription).filter(
+            Subscription.user_id == 1, Subscription.description == "POS NETFLIX", Subscription.amount_minor == 1599),
+        "subscriptions by group": db.query(Subscription).filter(Subscription.group_id == 1),
+        "pending invitation": db.query(GroupInvitation).filter(
+            GroupInvitation.group_id == 1, GroupInvitation.invitee_id == 2, GroupInvitation.accepted == False),
+        "card membership": db.query(CardMember).filter(CardMember.card_id == 1, CardMember.user_id == 2),
+        "memberships by user": db.query(CardMember).filter(CardMember.user_id == 2),
+        "ratios by group": db.query(GroupMemberRatio).filter(GroupMemberRatio.group_id == 1),
+        "spend by month": db.query(MonthlySpend).filter(MonthlySpend.user_id == 1, MonthlySpend.month >= date(2025, 1, 1)),
+        "charges in window": db.query(SubscriptionCharge).filter(
+            SubscriptionCharge.user_id == 1, SubscriptionCharge.charged_on >= date(2025, 1, 1)),
+        "charges of a merchant": db.query(SubscriptionCharge).filter(
+            SubscriptionCharge.user_id == 1, SubscriptionCharge.merchant == "NETFLIX",
+            SubscriptionCharge.charged_on >= date(2025, 1, 1)),
+        "ledger in date order": db.query(StatementTransaction).filter(
+            StatementTransaction.user_id == 1, StatementTransaction.amount_minor > 0).order_by(StatementTransaction.posted_on),
+        "rows since detection": db.query(StatementTransaction).filter(
+            StatementTransaction.user_id == 1, StatementTransaction.id > 100, StatementTransaction.amount_minor > 0),
+        "debits of merchants": db.query(StatementTransaction).filter(
+            StatementTransaction.user_id == 1, StatementTransaction.merchant.in_(["NETFLIX", "SPOTIFY"]),
+            StatementTransaction.amount_minor > 0).order_by(StatementTransaction.merchant, StatementTransaction.posted_on),
+        "recurrence state": db.query(MerchantRecurrence).filter(MerchantRecurrence.user_id == 1),
+        "latest upload": db.query(UploadedFile).filter(UploadedFile.user_id == 1).order_by(UploadedFile.created_at.desc()).limit(1),
+    }
+
+def query_plan(connection, query):
+    sql = str(query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+def assert_indexed(engine):
+    with Session(engine) as db:
+        for name, query in hot_queries(db).items():
+            plan = query_plan(db.connection(), query)
+            assert plan, f"No plan for {name}"
+            for step in plan:
+                assert step.startswith("SEARCH") and "INDEX" in step, f"{name} does not use an index: {plan}"
+                assert "TEMP B-TREE" not in step, f"{name} sorts without an index: {plan}"
+
+def test_hot_queries_use_indexes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'plan.db')}")
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        assert_indexed(engine)
+        engine.dispose()
+
+def test_migrations_add_indexes_to_existing_database():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'legacy.db')}")
+        Base.metadata.create_all(bind=engine)
+        # Simulate a database created before the indexes were declared
+        with engine.begin() as connection:
+            for model in (Subscription, GroupInvitation, CardMember, UploadedFile):
+                for index in model.__table__.indexes:
+                    connection.execute(text(f"DROP INDEX {index.name}"))
+        run_migrations(engine)
+        assert_indexed(engine)
+        engine.dispose()
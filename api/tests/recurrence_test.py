@@ -0,0 +1,90 @@
+"""Tests for multi-cadence recurrence detection.
+
+Builds synthetic charge histories for each cadence and checks that weekly,
+monthly, quarterly and annual series are told apart, that a price change
+keeps one subscription while concurrent plans at one merchant stay two,
+that irregular spending is rejected, and that the pandas and streaming
+detectors agree. Run with pytest.
+"""
+import os
+from datetime import date, timedelta
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import pandas as pd
+
+from api.services.recurrence import add_months, detect_recurrences
+from api.services.subscription_parser import SubscriptionAccumulator, find_subscriptions
+
+def series(description, amount, first, count, days=None, months=None):
+    """`count` charges from `first`, every `days` days or every `months` months."""
+    return [
+        (first + timedelta(days=days * i) if days else add_months(first, months * i), description, amount)
+        for i in range(count)
+    ]
+
+def detect(charges):
+    df = pd.DataFrame({
+        "Date": pd.to_datetime([charged_on for charged_on, _, _ in charges]),
+        "Description": [description for _, description, _ in charges],
+        "Money Out": [amount for _, _, amount in charges],
+    })
+    subscriptions = find_subscriptions(df)
+    accumulator = SubscriptionAccumulator()
+    for row in sorted(charges):
+        accumulator.add(*row)
+    assert accumulator.subscriptions() == subscriptions
+    return {sub["Description"]: sub for sub in subscriptions}
+
+def test_cadences_are_classified():
+    found = detect(
+        series("GYM CLASS", 8.00, date(2025, 1, 6), 10, days=7)
+        + series("NETFLIX", 15.99, date(2025, 1, 3), 6, months=1)
+        + series("SKY SPORTS QUARTERLY", 60.00, date(2024, 3, 31), 4, months=3)
+        + series("AMAZON PRIME", 95.00, date(2023, 2, 14), 3, months=12)
+    )
+    assert {name: sub["Cadence"] for name, sub in found.items()} == {
+        "GYM CLASS": "weekly", "NETFLIX": "monthly", "SKY SPORTS QUARTERLY": "quarterly", "AMAZON PRIME": "annual"
+    }
+    assert found["GYM CLASS"]["Estimated_Next"] == "2025-03-17"
+    assert found["SKY SPORTS QUARTERLY"]["Estimated_Next"] == "2025-03-31"
+    assert found["AMAZON PRIME"]["Estimated_Next"] == "2026-02-14"
+    assert found["NETFLIX"]["Confidence"] == 0.83
+
+def test_price_change_stays_one_subscription():
+    charges = series("SPOTIFY", 10.99, date(2024, 1, 10), 6, months=1) + series("SPOTIFY", 11.99, date(2024, 7, 10), 4, months=1)
+    found = detect(charges)
+    assert list(found) == ["SPOTIFY"]
+    spotify = found["SPOTIFY"]
+    assert spotify["Amount"] == 11.99 and len(spotify["Dates"]) == 10
+    assert spotify["Amounts"] == [10.99] * 6 + [11.99] * 4
+    assert spotify["Cadence"] == "monthly" and spotify["Confidence"] == 0.8
+
+def test_concurrent_plans_stay_apart():
+    # Two plans with prices within a band of each other, charged in the same months
+    charges = series("APPLE.COM/BILL", 9.99, date(2025, 1, 3), 6, months=1) + series("APPLE.COM/BILL", 10.99, date(2025, 1, 17), 6, months=1)
+    found = detect_recurrences(
+        [0] * len(charges),
+        [round(amount * 100) for _, _, amount in charges],
+        [charged_on.toordinal() for charged_on, _, _ in charges],
+        [description for _, description, _ in charges]
+    )
+    assert [(sub["Amount"], sub["Cadence"], len(sub["Dates"])) for sub in found] == [(9.99, "monthly", 6), (10.99, "monthly", 6)]
+    assert found[0]["Dates"][0] == "2025-01-03" and found[1]["Dates"][0] == "2025-01-17"
+
+def test_irregular_spending_is_rejected():
+    groceries = [(date(2025, 1, 1) + timedelta(days=day), "TESCO STORES", 42.10) for day in (0, 3, 4, 11, 30, 33, 47, 48)]
+    assert detect(groceries) == {}
+    # Too few weekly charges to call it a subscription
+    assert detect(series("CAR WASH", 12.00, date(2025, 1, 4), 3, days=7)) == {}
+    # Monthly timing, but the price changes every month
+    assert detect([(add_months(date(2025, 1, 15), i), "ELECTRIC IRELAND", 50 + i) for i in range(6)]) == {}
+
+def test_confidence_grows_with_history():
+    confidences = [detect(series("ICLOUD", 2.99, date(2024, 1, 1), n, months=1))["ICLOUD"]["Confidence"] for n in (2, 4, 12)]
+    assert confidences == sorted(confidences) and confidences[0] == 0.5
+    # A skipped month lowers confidence without losing the subscription
+    regular = series("ICLOUD", 2.99, date(2024, 1, 1), 9, months=1)
+    skipped = regular[:4] + regular[5:]
+    assert detect(skipped)["ICLOUD"]["Confidence"] < detect(regular[:8])["ICLOUD"]["Confidence"]
+    assert detect_recurrences([], [], [], []) == []
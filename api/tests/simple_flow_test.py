@@ -77,7 +77,13 @@ def create_group(token, group_name):
     group_data = {"name": group_name}
     response = requests.post(f"{BASE_URL}/groups/", json=group_data, headers=headers)
     print(f"Create group {group_name}: {response.status_code}")
-    return response.json() if response.status_code == 201 else None
+    if response.status_code != 202:
+        return None
+    # The group's card is provisioned in the background; wait for it before joining
+    group = response.json()
+    status = requests.get(f"{BASE_URL}/groups/{group['group_id']}/provisioning", params={"wait": 30}, headers=headers)
+    print(f"Provision group {group_name}: {status.json()['provisioning_status']}")
+    return group
 
 def join_group(token, group_id):
     """Join an existing group"""
@@ -0,0 +1,132 @@
+"""Tests for the subscription charge rows and the monthly spend rollup.
+
+Processes synthetic CSV statements through the statement job on a fresh
+SQLite database, then checks that total_spent and specific_spent give a
+statement the same figures before and after it is processed, that
+reprocessing a statement or uploading an overlapping one counts no charge
+twice, that charges an overlapping statement shows aren't a subscription
+are removed, and that the user's total and the per-month and per-merchant
+breakdowns match the charges. Run with pytest.
+"""
+import os
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.auth import get_current_active_user
+from api.models import MonthlySpend, SubscriptionCharge, User
+from api.routes import subscription_routes
+from api.routes.subscription_routes import spend_window_start
+from api.services.blob_store import BlobStore
+from api.services.spend_rollup import months_back
+
+SUBSCRIPTIONS = [("POS NETFLIX", "15.99", 3), ("SPOTIFY", "10.99", 10), ("ICLOUD STORAGE", "0.285", 20)]
+
+def write_statement(path, months, subscriptions=SUBSCRIPTIONS):
+    """Write a CSV export with monthly charges for the last `months` months and some one-off spending."""
+    today = date.today()
+    lines = ["Date,Description,Money In,Money Out,Balance"]
+    for back in range(months, 0, -1):
+        month = months_back(today, back)
+        lines.append(f"{month.replace(day=15):%d/%m/%Y},CARD PAYMENT SHOP {back},,€{back + 0.5:.2f},€1000.00")
+        for description, price, day in subscriptions:
+            charged_on = month.replace(day=day)
+            if charged_on <= today:
+                lines.append(f"{charged_on:%d/%m/%Y},{description},,€{price},€1000.00")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def make_client(tmp_dir, database, app_client, monkeypatch):
+    db = database.sessions()
+    user = User(username="spender", email="spender@example.com", hashed_password="x",
+                first_name="Spend", last_name="Test", date_of_birth=date(1990, 1, 1))
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    statements = {}
+    monkeypatch.setattr(subscription_routes, "get_file_path", statements.get)
+    monkeypatch.setattr(subscription_routes, "blob_store", BlobStore(os.path.join(tmp_dir, "blobs")))
+    client = app_client(subscription_routes.router)
+    client.app.dependency_overrides[get_current_active_user] = lambda: User(id=user_id, username="spender")
+    return client, database.sessions, statements, user_id
+
+def process(sessions, file_id, user_id):
+    db = sessions()
+    try:
+        return subscription_routes.process_statement_job(db, {"file_id": file_id, "user_id": user_id}, lambda percent: None)
+    finally:
+        db.close()
+
+def spent(client, file_id):
+    total = client.get(f"/subscriptions/total_spent/{file_id}").json()["total_spent"]
+    netflix = client.get(f"/subscriptions/specific_spent/{file_id}",
+                         params={"description": "pos netflix", "price": 15.99}).json()["specific_spent"]
+    return total, netflix
+
+def test_spend_is_aggregated_from_persisted_charges(tmp_path, database, app_client, monkeypatch):
+    client, sessions, statements, user_id = make_client(tmp_path, database, app_client, monkeypatch)
+    statements["first"] = os.path.join(tmp_path, "first.csv")
+    write_statement(statements["first"], 15)
+
+    # Parsed from the statement until it has been processed
+    parsed = spent(client, "first")
+    result = process(sessions, "first", user_id)
+    assert result["subscriptions"] == 3 and result["charges"] > 36
+    assert spent(client, "first") == parsed
+
+    # Reprocessing the statement and uploading an overlapping one leave the totals alone
+    process(sessions, "first", user_id)
+    statements["second"] = os.path.join(tmp_path, "second.csv")
+    write_statement(statements["second"], 6, SUBSCRIPTIONS[:2])
+    second_parsed = spent(client, "second")
+    process(sessions, "second", user_id)
+    assert spent(client, "first") == parsed
+    # Every row of the second statement was stored with the first, so it is still parsed
+    assert spent(client, "second") == second_parsed
+
+    db = sessions()
+    charges = db.query(SubscriptionCharge).all()
+    rollup = db.query(MonthlySpend).all()
+    assert len({(c.merchant, c.charged_on, c.amount_minor) for c in charges}) == len(charges) == result["charges"]
+    assert sum(row.total_minor for row in rollup) == sum(c.amount_minor for c in charges)
+    assert {c.amount_minor for c in charges if c.merchant == "ICLOUD STORAGE"} == {29}
+    db.close()
+
+    since = spend_window_start()
+    total = client.get("/subscriptions/spend/total").json()
+    assert total["total_minor"] == sum(c.amount_minor for c in charges if c.charged_on >= since)
+    netflix = client.get("/subscriptions/spend/total", params={"description": "pos netflix", "price": 15.99}).json()
+    assert netflix["total_minor"] == sum(c.amount_minor for c in charges
+                                         if c.merchant == "NETFLIX" and c.charged_on >= since)
+
+    since_month = months_back(date.today(), 12)
+    in_window = [c for c in charges if c.month >= since_month]
+    monthly = client.get("/subscriptions/spend/monthly").json()
+    assert len(monthly) == 12
+    assert sum(row["total_minor"] for row in monthly) == sum(c.amount_minor for c in in_window)
+    assert monthly[-1]["month"] == date.today().strftime("%Y-%m")
+    merchants = client.get("/subscriptions/spend/merchants", params={"months": 12}).json()
+    assert [row["merchant"] for row in merchants] == ["NETFLIX", "SPOTIFY", "ICLOUD STORAGE"]
+    assert merchants[0]["total_minor"] == sum(c.amount_minor for c in in_window if c.merchant == "NETFLIX")
+    assert merchants[0]["description"] == "POS NETFLIX"
+
+def test_charges_no_longer_detected_are_removed(tmp_path, database, app_client, monkeypatch):
+    client, sessions, statements, user_id = make_client(tmp_path, database, app_client, monkeypatch)
+    header = "Date,Description,Money In,Money Out,Balance\n"
+    statements["monthly"] = os.path.join(tmp_path, "monthly.csv")
+    with open(statements["monthly"], "w") as f:
+        f.write(header + "".join(f"05/{month:02d}/2025,GYM,,€20.00,€1000.00\n" for month in range(1, 5)))
+    assert process(sessions, "monthly", user_id)["charges"] == 4
+
+    # Drop-in visits in a second statement show the gym isn't a monthly subscription after all
+    statements["visits"] = os.path.join(tmp_path, "visits.csv")
+    with open(statements["visits"], "w") as f:
+        f.write(header + "".join(f"{day}/2025,GYM,,€20.00,€1000.00\n"
+                                 for day in ("09/01", "13/01", "22/01", "02/02", "11/02", "27/02", "06/03")))
+    assert process(sessions, "visits", user_id)["charges"] == 0
+
+    db = sessions()
+    assert db.query(SubscriptionCharge).count() == 0 and db.query(MonthlySpend).count() == 0
+    db.close()
@@ -0,0 +1,146 @@
+"""Tests for the split-payment executor against the local fake Stripe server.
+
+Each test seeds a fresh SQLite database with a ten-member group and charges
+an authorization through SplitPaymentExecutor, checking concurrency,
+idempotency keys, the payments ledger, background retries and that legs
+given their payment methods are charged without looking members up. Run
+with pytest.
+"""
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from api.models.base import Base
+from api.models import Payment, RealCard, User
+from api.services.split_payments import SplitPaymentExecutor
+from api.tests.fake_stripe import FakeStripe
+
+MEMBERS = 10
+AUTHORIZATION_ID = "iauth_split_test"
+
+def make_database(tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'split.db')}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = sessions()
+    user_ids = []
+    for i in range(MEMBERS):
+        real_card = RealCard(card_number=f"42424242424242{i:02d}", card_holder_name="Split Test",
+                             expiry_date="12/30", cvc="123", stripe_payment_method_id=f"pm_split_{i}")
+        db.add(real_card)
+        db.flush()
+        user = User(username=f"split{i}", email=f"split{i}@example.com", hashed_password="x",
+                    first_name="Split", last_name="Test", date_of_birth=date(1990, 1, 1),
+                    stripe_customer_id=f"cus_split_{i}", real_card_id=real_card.id)
+        db.add(user)
+        db.flush()
+        user_ids.append(user.id)
+    db.commit()
+    db.close()
+    return engine, sessions, user_ids
+
+def charge(executor, sessions, user_ids, amount=1000, payment_methods=None):
+    db = sessions()
+    try:
+        payment_ids = executor.record(db, AUTHORIZATION_ID, "eur", None, [(user_id, amount) for user_id in user_ids])
+        db.commit()
+    finally:
+        db.close()
+    return asyncio.run(executor.dispatch(payment_ids, payment_methods))
+
+def ledger(sessions):
+    db = sessions()
+    try:
+        return {payment.user_id: payment for payment in db.query(Payment)}
+    finally:
+        db.close()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for retries"
+        time.sleep(0.02)
+
+def test_legs_are_charged_concurrently_with_idempotency_keys():
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeStripe(latency=0.1) as fake:
+        engine, sessions, user_ids = make_database(tmp_dir)
+        executor = SplitPaymentExecutor(workers=4, session_factory=sessions)
+
+        start = time.perf_counter()
+        outcomes = charge(executor, sessions, user_ids)
+        elapsed = time.perf_counter() - start
+        executor.shutdown()
+
+        assert set(outcomes.values()) == {"succeeded"}
+        # Ten 100ms charges through four workers take three rounds, not ten
+        assert fake.max_in_flight == 4
+        assert elapsed < MEMBERS * fake.latency * 0.8
+        keys = {request["idempotency_key"] for request in fake.requests}
+        assert keys == {f"split-{AUTHORIZATION_ID}-{user_id}" for user_id in user_ids}
+        payments = ledger(sessions)
+        assert all(payment.status == "succeeded" and payment.attempts == 1 and payment.payment_intent_id
+                   for payment in payments.values())
+        engine.dispose()
+
+def test_transient_failures_are_retried_in_the_background():
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeStripe() as fake:
+        engine, sessions, user_ids = make_database(tmp_dir)
+        flaky, declined = user_ids[0], user_ids[1]
+        fake.transient_failures["cus_split_0"] = 2
+        fake.declines.add("cus_split_1")
+        executor = SplitPaymentExecutor(workers=4, max_attempts=3, retry_seconds=0.05, session_factory=sessions)
+
+        outcomes = charge(executor, sessions, user_ids)
+        # The webhook gets its answer without waiting for the flaky leg
+        assert outcomes[next(p.id for p in ledger(sessions).values() if p.user_id == flaky)] == "pending"
+        assert sum(status == "succeeded" for status in outcomes.values()) == MEMBERS - 2
+
+        wait_for(lambda: ledger(sessions)[flaky].status != "pending")
+        executor.shutdown()
+
+        payments = ledger(sessions)
+        assert payments[flaky].status == "succeeded" and payments[flaky].attempts == 3
+        flaky_requests = [r for r in fake.requests if r["fields"]["customer"] == "cus_split_0"]
+        assert {r["idempotency_key"] for r in flaky_requests} == {f"split-{AUTHORIZATION_ID}-{flaky}"}
+        # A declined card would be declined again, so it is not retried
+        assert payments[declined].status == "failed" and payments[declined].attempts == 1
+        assert "declined" in payments[declined].error
+        engine.dispose()
+
+def test_redelivered_authorization_charges_nobody_twice():
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeStripe() as fake:
+        engine, sessions, user_ids = make_database(tmp_dir)
+        executor = SplitPaymentExecutor(workers=4, session_factory=sessions)
+
+        first = charge(executor, sessions, user_ids)
+        second = charge(executor, sessions, user_ids)
+        executor.shutdown()
+
+        assert first == second
+        assert len(fake.created) == MEMBERS
+        assert len(ledger(sessions)) == MEMBERS
+        engine.dispose()
+
+def test_plan_payment_methods_are_charged_without_member_queries():
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeStripe() as fake:
+        engine, sessions, user_ids = make_database(tmp_dir)
+        executor = SplitPaymentExecutor(workers=4, session_factory=sessions)
+        payment_methods = {user_id: (f"cus_plan_{i}", f"pm_plan_{i}") for i, user_id in enumerate(user_ids)}
+        statements = []
+        event.listen(engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        outcomes = charge(executor, sessions, user_ids, payment_methods=payment_methods)
+        executor.shutdown()
+
+        assert set(outcomes.values()) == {"succeeded"}
+        assert {(r["fields"]["customer"], r["fields"]["payment_method"]) for r in fake.requests} == set(payment_methods.values())
+        assert not [statement for statement in statements if "users" in statement or "real_cards" in statement]
+        engine.dispose()
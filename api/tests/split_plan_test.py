@@ -0,0 +1,103 @@
+"""Tests for the cached per-card split plans.
+
+Mounts the auth, group and group ratio routers on a fresh SQLite database,
+then checks that a card's plan is built with one query, served from memory
+afterwards, and rebuilt when members accept invitations or the admin sets
+new ratios. Run with pytest.
+"""
+import os
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from sqlalchemy import event
+
+from api.models import CardMember, Group, RealCard, User, VirtualCard
+from api.routes import auth_router, group_routes
+from api.routes.group_ratio_routes import router as group_ratio_router
+from api.services.principal_cache import principal_cache
+from api.services.split_plans import split_plans
+from api.tests.fake_stripe import FakeStripe
+
+CARD_ID = "ic_plan"
+
+def register_with_card(client, sessions, username, last4):
+    response = client.post("/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "hunter2",
+        "legal_name": {"first_name": "Plan", "last_name": "Member"},
+        "date_of_birth": "1990-01-01",
+        "country": "IE"
+    })
+    assert response.status_code == 200, response.text
+    db = sessions()
+    real_card = RealCard(card_number=f"**** **** **** {last4}", card_holder_name="Plan Member",
+                         expiry_date="12/30", cvc="***", stripe_payment_method_id=f"pm_{username}")
+    db.add(real_card)
+    db.flush()
+    db.query(User).filter(User.username == username).update({"real_card_id": real_card.id})
+    db.commit()
+    db.close()
+    principal_cache.clear()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def seed_group(sessions, username):
+    db = sessions()
+    admin = db.query(User).filter(User.username == username).first()
+    group = Group(name="Plan", admin_id=admin.id, virtual_card_id=CARD_ID)
+    db.add(group)
+    db.flush()
+    virtual_card = VirtualCard(virtual_card_id=CARD_ID, group_id=group.id)
+    db.add(virtual_card)
+    db.flush()
+    db.add(CardMember(card_id=virtual_card.id, user_id=admin.id))
+    db.commit()
+    ids = group.id, admin.id
+    db.close()
+    return ids
+
+def plan_with_query_count(engine, sessions):
+    statements = []
+    count = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", count)
+    db = sessions()
+    try:
+        return split_plans.get(db, CARD_ID), len(statements)
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", count)
+
+def test_plans_are_cached_and_rebuilt_when_the_group_changes(database, app_client):
+    with FakeStripe():
+        client = app_client(auth_router, group_routes.router, group_ratio_router)
+        sessions, engine = database.sessions, database.engine
+        admin_headers = register_with_card(client, sessions, "admin", "4242")
+        member_headers = register_with_card(client, sessions, "member", "4444")
+        group_id, admin_id = seed_group(sessions, "admin")
+
+        plan, queries = plan_with_query_count(engine, sessions)
+        assert queries == 1
+        assert plan.user_ids == (admin_id,) and plan.basis_points == (10000,)
+        assert plan.payment_method_ids == ("pm_admin",)
+        assert plan_with_query_count(engine, sessions) == (plan, 0)
+
+        response = client.post(f"/groups/{group_id}/invite", json={"username": "member"}, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        invitation_id = client.get("/groups/invitations/pending", headers=member_headers).json()[0]["id"]
+        assert client.post(f"/groups/invitations/{invitation_id}/accept", headers=member_headers).status_code == 200
+
+        plan, queries = plan_with_query_count(engine, sessions)
+        assert queries == 1
+        member_id = plan.user_ids[1]
+        assert plan.user_ids == (admin_id, member_id) and plan.basis_points == (5000, 5000)
+        assert plan.legs(1001) == [(admin_id, 501), (member_id, 500)]
+
+        response = client.post(f"/groups/{group_id}/ratios", json={"ratios": [
+            {"user_id": admin_id, "ratio_percentage": 66.67},
+            {"user_id": member_id, "ratio_percentage": 33.33}
+        ]}, headers=admin_headers)
+        assert response.status_code == 200, response.text
+
+        plan, queries = plan_with_query_count(engine, sessions)
+        assert queries == 1 and plan.basis_points == (6667, 3333)
+        assert plan.legs(1000) == [(admin_id, 667), (member_id, 333)]
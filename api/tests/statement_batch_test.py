@@ -0,0 +1,150 @@
+"""Tests for batch statement uploads.
+
+Uploads monthly CSV exports, loose and in a zip archive, through the batch
+upload endpoint, then processes them with the batch job parsing across a
+process pool on a fresh SQLite database. Checks that each file gets its own
+status, that rows shared by overlapping exports are stored once, and that
+subscriptions are detected across the whole batch. Also checks that zip
+members and archives over the size limits are rejected, leaving nothing of
+a rejected archive behind, and that a worker process dying fails only its
+batch. Run with pytest.
+"""
+import io
+import os
+import tempfile
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.models import StatementTransaction, SubscriptionCharge, User
+from api.models.base import Base
+from api.routes import file_routes, subscription_routes
+from api.services import statement_store
+from api.services.blob_store import BlobStore
+from api.services.statement_pool import StatementParsePool
+
+def export(month):
+    """A month's CSV export, which repeats the last row of the month before as bank exports often do."""
+    lines = ["Date,Description,Money In,Money Out,Balance"]
+    if month > 1:
+        lines.append(f"28/{month - 1:02d}/2025,COFFEE,,€3.20,€900.00")
+    lines.append(f"03/{month:02d}/2025,POS NETFLIX {month:02d}/{month:02d} DUBLIN,,€15.99,€984.01")
+    lines.append(f"28/{month:02d}/2025,COFFEE,,€3.20,€900.00")
+    return ("\n".join(lines) + "\n").encode()
+
+def exit_worker(file_path):
+    """Stands in for a parse that kills its worker process, e.g. the OOM killer."""
+    if file_path == "crash":
+        os._exit(1)
+    return file_path
+
+def test_broken_pool_is_replaced(monkeypatch):
+    pool = StatementParsePool(workers=2)
+    try:
+        results = pool.map(exit_worker, ["crash", "a", "b"])
+        assert len(results) == 3 and isinstance(results[0], BrokenProcessPool)
+        assert pool.map(exit_worker, ["a", "b"]) == ["a", "b"]
+    finally:
+        pool.shutdown()
+
+def test_batch_is_parsed_in_parallel_and_detected_once(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'batch.db')}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        sessions = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = sessions()
+        user = User(username="batch", email="batch@example.com", hashed_password="x",
+                    first_name="Batch", last_name="Test", date_of_birth=date(1990, 1, 1))
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+
+        monkeypatch.setattr(file_routes, "UPLOAD_DIR", tmp_dir)
+        monkeypatch.setattr(subscription_routes, "blob_store", BlobStore(os.path.join(tmp_dir, "blobs")))
+        pool = StatementParsePool(workers=2)
+        monkeypatch.setattr(statement_store, "statement_parse_pool", pool)
+        app = FastAPI()
+        app.include_router(file_routes.router)
+        client = TestClient(app)
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("exports/march.csv", export(3))
+            zf.writestr("exports/readme.txt", b"not a statement")
+        response = client.post("/files/upload/batch", files=[
+            ("files", ("january.csv", export(1), "text/csv")),
+            ("files", ("february.csv", export(2), "text/csv")),
+            ("files", ("exports.zip", archive.getvalue(), "application/zip")),
+            ("files", ("broken.xlsx", b"not a workbook", "application/octet-stream")),
+        ])
+        assert response.status_code == 200
+        uploaded = response.json()["files"]
+        assert [(entry["filename"], "file_id" in entry) for entry in uploaded] == [
+            ("january.csv", True), ("february.csv", True), ("exports/march.csv", True),
+            ("exports/readme.txt", False), ("broken.xlsx", True),
+        ]
+        assert not [name for name in os.listdir(tmp_dir) if name.endswith(".zip")]
+
+        file_ids = [entry["file_id"] for entry in uploaded if "file_id" in entry] + ["missing"]
+        db = sessions()
+        try:
+            result = subscription_routes.process_statement_batch_job(
+                db, {"file_ids": file_ids, "user_id": user_id}, lambda percent: None)
+            assert [entry["status"] for entry in result["files"]] == ["processed"] * 3 + ["failed", "not_found"]
+            assert [entry["rows"] for entry in result["files"][:3]] == [2, 3, 3]
+            # The repeated row of each export is stored with the file it first appeared in
+            assert [entry["stored_rows"] for entry in result["files"][:3]] == [2, 2, 2]
+            assert db.query(StatementTransaction).count() == 6
+            assert result["subscriptions"] == 2 and result["charges"] == 6
+            assert {charge.merchant for charge in db.query(SubscriptionCharge)} == {"NETFLIX", "COFFEE"}
+
+            # Processing the batch again stores nothing new
+            again = subscription_routes.process_statement_batch_job(
+                db, {"file_ids": file_ids, "user_id": user_id}, lambda percent: None)
+            assert again["redetected_merchants"] == 0 and db.query(StatementTransaction).count() == 6
+        finally:
+            db.close()
+            pool.shutdown()
+            client.close()
+            engine.dispose()
+
+def test_oversized_archives_are_rejected_and_removed(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        monkeypatch.setattr(file_routes, "UPLOAD_DIR", tmp_dir)
+        # Room for two monthly exports per archive, and no member over 1 kB
+        monkeypatch.setattr(file_routes.settings, "BATCH_UPLOAD_MAX_MEMBER_BYTES", 1024)
+        monkeypatch.setattr(file_routes.settings, "BATCH_UPLOAD_MAX_ARCHIVE_BYTES", len(export(2)) + len(export(3)))
+        app = FastAPI()
+        app.include_router(file_routes.router)
+        client = TestClient(app)
+
+        def archive(months, extra=None):
+            data = io.BytesIO()
+            with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as zf:
+                if extra:
+                    zf.writestr(*extra)
+                for month in months:
+                    zf.writestr(f"{month:02d}.csv", export(month))
+            return data.getvalue()
+
+        response = client.post("/files/upload/batch", files=[
+            ("files", ("fits.zip", archive([2, 3], ("blank.csv", b"," * 1024 * 1024)), "application/zip")),
+            ("files", ("too_big.zip", archive([2, 3, 4]), "application/zip")),
+        ])
+        assert response.status_code == 200
+        uploaded = response.json()["files"]
+        assert [(entry["filename"], entry.get("error")) for entry in uploaded] == [
+            ("blank.csv", "Statement too large"), ("02.csv", None), ("03.csv", None),
+            ("too_big.zip", f"Archive expands past {len(export(2)) + len(export(3))} bytes"),
+        ]
+        # Only the statements of the archive that fit are kept
+        assert sorted(os.listdir(tmp_dir)) == sorted(f"{entry['file_id']}.csv" for entry in uploaded[1:3])
+        client.close()
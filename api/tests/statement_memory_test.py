@@ -0,0 +1,79 @@
+"""Memory-ceiling test for streaming statement ingestion.
+
+Writes a synthetic CSV statement of STATEMENT_MEMORY_TEST_MB megabytes and
+parses it with stream_subscriptions in a child process, asserting that peak
+RSS grows by less than MEMORY_CEILING_MB over the interpreter's baseline.
+Under pytest it is skipped unless STATEMENT_MEMORY_TEST_MB is set, since
+writing the statement is slow; run directly it defaults to 500MB:
+
+    STATEMENT_MEMORY_TEST_MB=500 python -m pytest api/tests/statement_memory_test.py
+    python -m api.tests.statement_memory_test
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+STATEMENT_SIZE_MB = int(os.environ.get("STATEMENT_MEMORY_TEST_MB", "500"))
+MEMORY_CEILING_MB = int(os.environ.get("STATEMENT_MEMORY_CEILING_MB", "64"))
+SUBSCRIPTIONS = [("POS NETFLIX", "15.99"), ("SPOTIFY", "10.99"), ("ICLOUD STORAGE", "2.99")]
+
+PARSE_SCRIPT = """
+import json, resource, sys
+from api.services.subscription_parser import stream_subscriptions
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+subscriptions = stream_subscriptions(sys.argv[1])
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"baseline_kb": baseline, "peak_kb": peak, "descriptions": [s["Description"] for s in subscriptions]}))
+"""
+
+def write_statement(path, size_mb, seed=0):
+    """Write a date-ordered CSV export with three monthly subscriptions among card spending."""
+    rnd = random.Random(seed)
+    shops = [f"CARD PAYMENT SHOP {i}" for i in range(2000)]
+    target = size_mb * 1024 * 1024
+    day = date(2000, 1, 1)
+    written = 0
+    with open(path, "w") as f:
+        f.write("Date,Description,Money In,Money Out,Balance\n")
+        while written < target:
+            stamp = day.strftime("%d/%m/%Y")
+            lines = [
+                f'{stamp},{rnd.choice(shops)} {day:%d/%m} DUBLIN,,"€{rnd.randint(100, 99999) / 100:,.2f}",€1000.00\n'
+                for _ in range(1000)
+            ]
+            if day.day == 3:
+                lines += [f"{stamp},{name},,€{price},€1000.00\n" for name, price in SUBSCRIPTIONS]
+            chunk = "".join(lines)
+            f.write(chunk)
+            written += len(chunk)
+            day += timedelta(days=1)
+
+@pytest.mark.skipif("STATEMENT_MEMORY_TEST_MB" not in os.environ, reason="set STATEMENT_MEMORY_TEST_MB to run")
+def test_streaming_parse_memory_ceiling():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "statement.csv")
+        write_statement(path, STATEMENT_SIZE_MB)
+        file_mb = os.path.getsize(path) / 1024 / 1024
+
+        env = dict(os.environ, STRIPE_API_KEY=os.environ.get("STRIPE_API_KEY", ""))
+        repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run(
+            [sys.executable, "-c", PARSE_SCRIPT, path],
+            cwd=repo_root, env=env, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+
+    growth_mb = (result["peak_kb"] - result["baseline_kb"]) / 1024
+    print(f"Parsed {file_mb:.0f}MB statement: peak RSS grew {growth_mb:.1f}MB, {len(result['descriptions'])} subscriptions")
+    # Random card spending can repeat by chance, but the real subscriptions must all be found
+    assert {name for name, _ in SUBSCRIPTIONS} <= set(result["descriptions"])
+    assert growth_mb < MEMORY_CEILING_MB, f"Peak RSS grew {growth_mb:.1f}MB (ceiling {MEMORY_CEILING_MB}MB)"
+
+if __name__ == "__main__":
+    test_streaming_parse_memory_ceiling()
@@ -0,0 +1,192 @@
+"""Tests for stored statement transactions and the blob store.
+
+Processes synthetic CSV statements through the statement job on a fresh
+SQLite database, then checks that rows are stored once however often they
+are uploaded, that repeated identical rows on a day are all kept, that the
+statement's content goes to the blob store instead of the database, and
+that the subscription views parse an unprocessed statement off the event
+loop and answer from the statement's own stored rows once it is processed.
+Checks that a new statement re-detects only the merchants it added rows
+for, that rows committed out of id order are still detected, that reading
+subscriptions stores no detection state, and that older rows get their
+merchant named. Also checks the migration moving older uploads out of the
+database. Run with pytest.
+"""
+import asyncio
+import json
+import os
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from sqlalchemy import text, update
+
+from api.migrations import run_migrations, versions
+from api.models import MerchantRecurrence, StatementTransaction, UploadedFile, User
+from api.routes import subscription_routes
+from api.services.blob_store import BlobStore
+from api.services import statement_store
+from api.services.statement_store import detect_subscriptions, update_recurrences
+from api.services.subscription_parser import ParseCache, process_subscriptions
+
+FIRST_STATEMENT = """Date,Description,Money In,Money Out,Balance
+03/01/2025,POS NETFLIX 02/01 DUBLIN,,€15.99,€984.01
+05/01/2025,COFFEE,,€3.20,€980.81
+05/01/2025,COFFEE,,€3.20,€977.61
+10/01/2025,SALARY,"€2,000.00",,"€2,977.61"
+03/02/2025,POS NETFLIX 02/02 DUBLIN,,€15.99,"€2,961.62"
+03/03/2025,POS NETFLIX 02/03 DUBLIN,,€15.99,"€2,945.63"
+"""
+
+# Overlaps the first statement by its last row and adds a month
+SECOND_STATEMENT = """Date,Description,Money In,Money Out,Balance
+03/03/2025,POS NETFLIX 02/03 DUBLIN,,€15.99,"€2,945.63"
+04/03/2025,SPOTIFY,,€10.99,"€2,934.64"
+03/04/2025,POS NETFLIX 02/04 DUBLIN,,€15.99,"€2,918.65"
+"""
+
+def make_client(tmp_dir, database, app_client, monkeypatch):
+    sessions = database.sessions
+    db = sessions()
+    user = User(username="ledger", email="ledger@example.com", hashed_password="x",
+                first_name="Ledger", last_name="Test", date_of_birth=date(1990, 1, 1))
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    statements = {}
+    for name, content in (("first", FIRST_STATEMENT), ("second", SECOND_STATEMENT)):
+        statements[name] = os.path.join(tmp_dir, f"{name}.csv")
+        with open(statements[name], "w") as f:
+            f.write(content)
+    blobs = BlobStore(os.path.join(tmp_dir, "blobs"))
+    monkeypatch.setattr(subscription_routes, "get_file_path", statements.get)
+    monkeypatch.setattr(subscription_routes, "blob_store", blobs)
+    return app_client(subscription_routes.router), sessions, statements, blobs, user_id
+
+def process(sessions, file_id, user_id):
+    db = sessions()
+    try:
+        return subscription_routes.process_statement_job(db, {"file_id": file_id, "user_id": user_id}, lambda percent: None)
+    finally:
+        db.close()
+
+def test_statement_rows_are_stored_once_and_serve_the_views(tmp_path, database, app_client, monkeypatch):
+    client, sessions, statements, blobs, user_id = make_client(tmp_path, database, app_client, monkeypatch)
+    parsed = process_subscriptions(statements["first"])
+
+    # Until the statement is processed the views parse it, on a worker thread
+    def parse_off_loop(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return process_subscriptions(*args, **kwargs)
+        raise AssertionError("statement was parsed on the event loop")
+    monkeypatch.setattr(subscription_routes, "process_subscriptions", parse_off_loop)
+    assert client.get("/subscriptions/subscriptions/first").json() == parsed
+
+    first = process(sessions, "first", user_id)
+    assert first["rows"] == first["stored_rows"] == 6
+    # Re-running the job stores nothing new, and an overlapping statement only its new rows
+    assert process(sessions, "first", user_id)["stored_rows"] == 6
+    second = process(sessions, "second", user_id)
+    assert second["rows"] == 3 and second["stored_rows"] == 2
+
+    db = sessions()
+    rows = db.query(StatementTransaction).order_by(StatementTransaction.posted_on, StatementTransaction.id).all()
+    assert len(rows) == 8
+    assert [row.amount_minor for row in rows if row.description == "COFFEE"] == [320, 320]
+    salary = next(row for row in rows if row.description == "SALARY")
+    assert salary.amount_minor == -200000 and salary.balance_minor == 297761
+    assert {row.description for row in rows} == {"POS NETFLIX", "COFFEE", "SALARY", "SPOTIFY"}
+
+    uploaded_file = db.query(UploadedFile).filter(UploadedFile.file_path == statements["first"]).one()
+    assert uploaded_file.file_content == b""
+    with open(statements["first"], "rb") as f:
+        assert blobs.read(uploaded_file.content_sha256) == f.read()
+    assert os.stat(blobs.path(uploaded_file.content_sha256)).st_ino == os.stat(statements["first"]).st_ino
+    db.close()
+
+    # The views read each statement's own stored rows, never the user's other statements
+    def fail(*args, **kwargs):
+        raise AssertionError("statement was parsed")
+    monkeypatch.setattr(subscription_routes, "process_subscriptions", fail)
+    subscriptions = client.get("/subscriptions/subscriptions/first").json()
+    assert subscriptions == parsed and [sub["Description"] for sub in parsed] == ["POS NETFLIX"]
+    assert client.get("/subscriptions/filter/first", params={"price": 15.99}).json() == subscriptions
+    # The second statement's March charge was stored with the first, leaving it one NETFLIX charge
+    assert client.get("/subscriptions/subscriptions/sorted/second").json() == []
+
+def test_only_merchants_with_new_rows_are_redetected(tmp_path, database, app_client, monkeypatch):
+    client, sessions, statements, blobs, user_id = make_client(tmp_path, database, app_client, monkeypatch)
+    # NETFLIX and COFFEE, then nothing new, then NETFLIX and SPOTIFY
+    assert process(sessions, "first", user_id)["redetected_merchants"] == 2
+    assert process(sessions, "first", user_id)["redetected_merchants"] == 0
+    assert process(sessions, "second", user_id)["redetected_merchants"] == 2
+
+    db = sessions()
+    states = {state.merchant: json.loads(state.subscriptions) for state in db.query(MerchantRecurrence)}
+    assert states["COFFEE"] == states["SPOTIFY"] == []
+    assert states["NETFLIX"][0]["Dates"] == ["2025-01-03", "2025-02-03", "2025-03-03", "2025-04-03"]
+
+    # Reading state from an older detector re-detects in memory and stores nothing
+    db.execute(update(MerchantRecurrence).values(detector_version=0))
+    monkeypatch.setattr(statement_store, "parse_cache", ParseCache())
+    assert [sub["Dates"] for sub in detect_subscriptions(db, user_id)] == [states["NETFLIX"][0]["Dates"]]
+    assert {state.detector_version for state in db.query(MerchantRecurrence)} == {0}
+
+    # Rows stored before merchants were named or named by older rules, with state from an older
+    # detector, are renamed and re-detected from scratch
+    db.execute(update(StatementTransaction).values(merchant=None))
+    db.execute(update(StatementTransaction).where(StatementTransaction.description == "POS NETFLIX")
+               .values(merchant="POS NETFLIX"))
+    assert update_recurrences(db, user_id) == 3
+    assert db.query(StatementTransaction).filter(StatementTransaction.merchant.is_(None)).count() == 0
+    assert {state.merchant: json.loads(state.subscriptions) for state in db.query(MerchantRecurrence)} == states
+    assert update_recurrences(db, user_id) == 0
+    db.close()
+
+def test_rows_committed_out_of_id_order_are_detected(tmp_path, database, app_client, monkeypatch):
+    client, sessions, statements, blobs, user_id = make_client(tmp_path, database, app_client, monkeypatch)
+    process(sessions, "first", user_id)
+    db = sessions()
+    file_id = db.query(UploadedFile.id).scalar()
+
+    def netflix(id, day):
+        return StatementTransaction(id=id, fingerprint=f"netflix-{day}", posted_on=day, description="POS NETFLIX",
+                                    merchant="NETFLIX", amount_minor=1599, user_id=user_id, file_id=file_id)
+
+    # Another job's row takes the higher id but commits first, and is detected
+    db.add(netflix(100, date(2025, 5, 3)))
+    db.commit()
+    assert update_recurrences(db, user_id) == 1
+    db.commit()
+    # The row with the lower id commits afterwards and is still seen
+    db.add(netflix(50, date(2025, 4, 3)))
+    db.commit()
+    assert update_recurrences(db, user_id) == 1
+    db.commit()
+    netflix_state = db.query(MerchantRecurrence).filter(MerchantRecurrence.merchant == "NETFLIX").one()
+    assert json.loads(netflix_state.subscriptions)[0]["Dates"][-2:] == ["2025-04-03", "2025-05-03"]
+    assert db.query(StatementTransaction).filter(StatementTransaction.detected.is_(False)).count() == 0
+    db.close()
+
+def test_migration_moves_upload_contents_to_the_blob_store(tmp_path, database, monkeypatch):
+    engine = database.engine
+    # Simulate a database that kept statement contents in uploaded_files
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE uploaded_files DROP COLUMN content_sha256"))
+        connection.execute(
+            text("INSERT INTO uploaded_files (file_name, file_content, file_path, created_at, user_id) "
+                 "VALUES ('a.csv', :content, '/tmp/a.csv', '2025-01-01', 1), ('b.csv', :empty, '/tmp/b.csv', '2025-01-01', 1)"),
+            {"content": FIRST_STATEMENT.encode(), "empty": b""}
+        )
+    blobs = BlobStore(os.path.join(tmp_path, "blobs"))
+    monkeypatch.setattr(versions, "blob_store", blobs)
+    run_migrations(engine)
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT file_content, content_sha256 FROM uploaded_files ORDER BY id")).all()
+    assert rows[0][0] == b"" and blobs.read(rows[0][1]) == FIRST_STATEMENT.encode()
+    assert rows[1] == (b"", None)
@@ -0,0 +1,90 @@
+"""Tests for the Stripe gateway against the local fake Stripe server.
+
+Covers retries with a stable idempotency key, per-endpoint timeouts, the
+circuit breaker, and async calls sharing a bounded pool of keep-alive
+connections. Run with pytest.
+"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+import pytest
+import stripe
+
+from api.services.metrics import get_histogram
+from api.services.stripe_gateway import StripeGateway, StripeUnavailable
+from api.tests.fake_stripe import FakeStripe
+
+def make_gateway(fake, **kwargs):
+    kwargs.setdefault("retry_base_seconds", 0.01)
+    return StripeGateway(api_key="sk_test_fake", api_base=fake.url, **kwargs)
+
+def payment_intent_params(customer):
+    return {"amount": 1000, "currency": "eur", "customer": customer, "payment_method": "pm_card_visa", "confirm": True}
+
+def test_transient_failures_are_retried_with_one_idempotency_key():
+    with FakeStripe() as fake:
+        gateway = make_gateway(fake, max_retries=2)
+        fake.transient_failures["cus_flaky"] = 2
+        histogram = get_histogram("stripe.payment_intents.create")
+        calls_before = histogram.snapshot()["count"]
+
+        payment_intent = gateway.call("payment_intents.create", params=payment_intent_params("cus_flaky"))
+
+        assert payment_intent.status == "succeeded"
+        keys = [request["idempotency_key"] for request in fake.requests]
+        assert len(keys) == 3 and len(set(keys)) == 1 and keys[0]
+        assert histogram.snapshot()["count"] == calls_before + 1
+
+        # Declines are final; retrying would only be declined again
+        fake.declines.add("cus_declined")
+        with pytest.raises(stripe.error.CardError):
+            gateway.call("payment_intents.create", params=payment_intent_params("cus_declined"))
+        assert len(fake.requests_for("/v1/payment_intents")) == 4
+
+def test_endpoint_timeout_applies():
+    with FakeStripe(latency=0.3) as fake:
+        gateway = make_gateway(fake, max_retries=0, timeouts={"customers.create": 0.05})
+        with pytest.raises(stripe.error.APIConnectionError):
+            gateway.call("customers.create", params={"email": "slow@example.com"})
+        # Endpoints without their own timeout use the default
+        assert gateway.call("payment_methods.retrieve", "pm_card_visa").card.last4 == "4242"
+
+def test_circuit_breaker_fails_fast_until_stripe_recovers():
+    with FakeStripe() as fake:
+        gateway = make_gateway(fake, max_retries=0, breaker_threshold=3, breaker_reset_seconds=0.2)
+        fake.outage = True
+        for _ in range(3):
+            with pytest.raises(stripe.error.APIError):
+                gateway.call("customers.create", params={"email": "down@example.com"})
+        assert gateway.breaker.state == "open"
+
+        with pytest.raises(StripeUnavailable):
+            gateway.call("customers.create", params={"email": "down@example.com"})
+        assert len(fake.requests) == 3
+
+        fake.outage = False
+        time.sleep(0.25)
+        assert gateway.breaker.state == "half_open"
+        assert gateway.call("customers.create", params={"email": "up@example.com"}).id.startswith("cus_")
+        assert gateway.breaker.state == "closed"
+
+def test_async_calls_share_a_bounded_connection_pool():
+    with FakeStripe(latency=0.05) as fake:
+        gateway = make_gateway(fake, max_connections=4)
+
+        async def run():
+            results = await asyncio.gather(*(
+                gateway.call_async("issuing.cards.retrieve", f"ic_{i}", params={"expand": ["number", "cvc"]})
+                for i in range(20)
+            ))
+            await gateway.close()
+            return results
+
+        cards = asyncio.run(run())
+        assert [card.id for card in cards] == [f"ic_{i}" for i in range(20)]
+        assert fake.max_in_flight <= 4
+        # Twenty calls over at most four kept-alive connections
+        assert len({request["connection"] for request in fake.requests}) <= 4
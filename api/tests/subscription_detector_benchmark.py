@@ -0,0 +1,90 @@
+"""Benchmark the vectorized find_subscriptions against the old per-group loop.
+
+Run from the repository root:
+
+    python -m api.tests.subscription_detector_benchmark [rows ...]
+
+Defaults to synthetic statements of 1k, 100k and 1M rows. Every planted
+subscription the old detector finds is checked to be among the monthly
+subscriptions of the new one, in the old result shape, before timings are
+reported. Noise merchants can differ: the new detector merges a merchant's
+nearby amounts into one series, so two stray charges a month apart at one
+price are no longer a subscription on their own.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.services.subscription_parser import find_subscriptions
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+LEGACY_KEYS = ("Description", "Amount", "Dates", "Estimated_Next")
+
+def legacy_find_subscriptions(df):
+    """The original detector: one sort and one Python-level check per group."""
+    subscriptions = []
+    for (description, amount), group in df.groupby(["Description", "Money Out"]):
+        group = group.sort_values(by="Date")
+        if len(group) > 1:
+            date_diffs = group["Date"].diff().dropna()
+            is_monthly = all(timedelta(days=25) <= diff <= timedelta(days=35) for diff in date_diffs)
+            if is_monthly:
+                last_date = group["Date"].iloc[-1]
+                estimated_next_date = (last_date + pd.DateOffset(months=1)).strftime('%Y-%m-%d')
+                formatted_dates = [d.strftime('%Y-%m-%d') for d in group["Date"]]
+                subscriptions.append({
+                    "Description": description,
+                    "Amount": float(amount),
+                    "Dates": formatted_dates,
+                    "Estimated_Next": estimated_next_date
+                })
+    return subscriptions
+
+def synthetic_statement(rows, seed=0):
+    """Build a preprocessed statement frame: ~5% monthly subscriptions, the rest noise."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2020-01-01")
+
+    n_subs = max(1, rows // 20 // 24)
+    sub_rows = n_subs * 24
+    months = np.tile(np.arange(24), n_subs)
+    sub_dates = start + (months * 30 + np.repeat(rng.integers(0, 28, n_subs), 24) + rng.integers(-2, 3, sub_rows)).astype("timedelta64[D]")
+    sub_desc = np.repeat([f"SUBSCRIPTION {i}" for i in range(n_subs)], 24)
+    sub_amount = np.repeat(rng.integers(199, 4999, n_subs) / 100, 24)
+
+    noise_rows = max(0, rows - sub_rows)
+    noise_dates = start + rng.integers(0, 730, noise_rows).astype("timedelta64[D]")
+    noise_desc = np.char.add("SHOP ", rng.integers(0, max(1, rows // 10), noise_rows).astype(str))
+    noise_amount = rng.integers(100, 20000, noise_rows) / 100
+
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(np.concatenate([sub_dates, noise_dates])),
+        "Description": np.concatenate([sub_desc, noise_desc]),
+        "Money Out": np.concatenate([sub_amount, noise_amount]),
+    })
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return result, time.perf_counter() - start
+
+def main(sizes):
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9} {'subscriptions':>14}")
+    for rows in sizes:
+        df = synthetic_statement(rows)
+        new_result, new_time = timed(find_subscriptions, df)
+        old_result, old_time = timed(legacy_find_subscriptions, df)
+        monthly = [{key: sub[key] for key in LEGACY_KEYS} for sub in new_result if sub["Cadence"] == "monthly"]
+        planted = [sub for sub in old_result if sub["Description"].startswith("SUBSCRIPTION ")]
+        assert all(sub in monthly for sub in planted), f"Detectors disagree on {rows} rows"
+        print(f"{rows:>10} {old_time:>12.3f} {new_time:>15.3f} {old_time / new_time:>8.1f}x {len(new_result):>14}")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
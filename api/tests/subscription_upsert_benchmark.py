@@ -0,0 +1,76 @@
+"""Compare per-row get_or_create_subscription against bulk_upsert_subscriptions.
+
+Run from the repository root:
+
+    python -m api.tests.subscription_upsert_benchmark [subscriptions]
+
+Stores one upload's worth of subscriptions (200 by default) into a fresh
+SQLite file with each approach and reports commits, SQL statements and
+wall time per upload.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.models.base import Base
+from api.models import User, UploadedFile
+from api.routes.subscription_routes import get_or_create_subscription
+from api.services.subscription_store import bulk_upsert_subscriptions
+
+def make_session(db_path):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    counters = {"commits": 0, "statements": 0}
+    event.listen(engine, "commit", lambda conn: counters.__setitem__("commits", counters["commits"] + 1))
+    event.listen(engine, "before_cursor_execute", lambda *args: counters.__setitem__("statements", counters["statements"] + 1))
+
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    user = User(username="bench", email="bench@example.com", hashed_password="x",
+                first_name="Bench", last_name="User", date_of_birth=date(1990, 1, 1))
+    db.add(user)
+    db.flush()
+    uploaded_file = UploadedFile(file_name="bench.xlsx", file_content=b"", file_path="/tmp/bench.xlsx", user_id=user.id)
+    db.add(uploaded_file)
+    db.commit()
+    counters.update(commits=0, statements=0)
+    return db, counters, user.id, uploaded_file.id
+
+def rows_for(count, file_id):
+    return [{
+        "description": f"SUBSCRIPTION {i}",
+        "amount": 4.99 + i,
+        "date": "2025-01-03",
+        "estimated_next_date": "2025-02-03",
+        "file_id": file_id
+    } for i in range(count)]
+
+def per_row(db, user_id, rows):
+    for row in rows:
+        get_or_create_subscription(db=db, user_id=user_id, **row)
+    db.commit()
+
+def bulk(db, user_id, rows):
+    bulk_upsert_subscriptions(db, user_id, rows)
+    db.commit()
+
+def main(count):
+    print(f"Storing {count} detected subscriptions per upload")
+    print(f"{'path':>10} {'commits':>8} {'statements':>11} {'time (ms)':>10}")
+    for name, store in (("per-row", per_row), ("bulk", bulk)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db, counters, user_id, file_id = make_session(os.path.join(tmp_dir, "bench.db"))
+            start = time.perf_counter()
+            store(db, user_id, rows_for(count, file_id))
+            elapsed = (time.perf_counter() - start) * 1000
+            db.close()
+        print(f"{name:>10} {counters['commits']:>8} {counters['statements']:>11} {elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
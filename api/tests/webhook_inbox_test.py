@@ -0,0 +1,143 @@
+"""Tests for the webhook inbox.
+
+Mounts the webhook router on a fresh SQLite database with a dedicated inbox,
+split-payment executor and the local fake Stripe server, then checks that
+events are acknowledged before they are handled, that redeliveries and
+replays charge nobody twice, and that events for one card are handled in
+order while a failing one is retried. Run with pytest.
+"""
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import date
+
+os.environ.setdefault("STRIPE_API_KEY", "")
+
+from api.config import get_settings
+from api.models import CardMember, Group, Payment, RealCard, User, VirtualCard, WebhookEvent
+from api.routes import webhook_routes
+from api.services import webhook_handlers
+from api.services.split_payments import SplitPaymentExecutor
+from api.services.webhook_inbox import WebhookInbox
+from api.tests.fake_stripe import FakeStripe
+
+CARD_ID = "ic_inbox"
+WEBHOOK_SECRET = "whsec_inbox"
+
+def make_client(database, app_client, monkeypatch):
+    inbox = WebhookInbox(workers=2, session_factory=database.sessions)
+    webhook_handlers.register_handlers(inbox)
+    monkeypatch.setattr(webhook_routes, "webhook_inbox", inbox)
+    executor = SplitPaymentExecutor(workers=2, session_factory=database.sessions)
+    monkeypatch.setattr(webhook_handlers, "split_payments", executor)
+    monkeypatch.setattr(get_settings(), "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    return app_client(webhook_routes.router), database.sessions, inbox, executor
+
+def seed_group(sessions, members=2):
+    db = sessions()
+    users = []
+    for i in range(members):
+        real_card = RealCard(card_number=f"424242424242424{i}", card_holder_name="Inbox Test",
+                             expiry_date="12/30", cvc="123", stripe_payment_method_id=f"pm_inbox_{i}")
+        db.add(real_card)
+        db.flush()
+        user = User(username=f"inbox{i}", email=f"inbox{i}@example.com", hashed_password="x",
+                    first_name="Inbox", last_name="Test", date_of_birth=date(1990, 1, 1),
+                    stripe_customer_id=f"cus_inbox_{i}", real_card_id=real_card.id)
+        db.add(user)
+        users.append(user)
+    db.flush()
+    group = Group(name="Inbox", admin_id=users[0].id, virtual_card_id=CARD_ID)
+    db.add(group)
+    db.flush()
+    virtual_card = VirtualCard(group_id=group.id, virtual_card_id=CARD_ID)
+    db.add(virtual_card)
+    db.flush()
+    for user in users:
+        db.add(CardMember(card_id=virtual_card.id, user_id=user.id))
+    db.commit()
+    db.close()
+
+def authorization_created(event_id, authorization_id, amount=1000):
+    return {
+        "id": event_id, "object": "event", "type": "issuing_authorization.created",
+        "data": {"object": {"id": authorization_id, "object": "issuing.authorization", "amount": amount,
+                            "currency": "eur", "card": {"id": CARD_ID, "object": "issuing.card"}}}
+    }
+
+def signed(event):
+    payload = json.dumps(event).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {"stripe-signature": f"t={timestamp},v1={signature}"}
+
+def test_redelivered_and_replayed_events_charge_once(database, app_client, monkeypatch):
+    with FakeStripe(latency=1.0) as fake:
+        client, sessions, inbox, executor = make_client(database, app_client, monkeypatch)
+        seed_group(sessions)
+        payload, headers = signed(authorization_created("evt_auth_1", "iauth_inbox_1"))
+
+        responses = []
+        for _ in range(3):
+            start = time.perf_counter()
+            responses.append(client.post("/webhooks/stripeWebhook", content=payload, headers=headers))
+            # Acknowledged without waiting for the charges
+            assert time.perf_counter() - start < fake.latency
+        assert [response.json()["duplicate"] for response in responses] == [False, True, True]
+        assert inbox.wait_idle(5)
+
+        replays = inbox.replay(copies=3)
+        assert len(replays) == 3
+        assert inbox.wait_idle(5)
+        inbox.shutdown()
+        executor.shutdown()
+
+        db = sessions()
+        events = {event.id: event for event in db.query(WebhookEvent)}
+        assert set(events) == {"evt_auth_1", *replays}
+        assert all(event.status == "processed" and event.attempts == 1 for event in events.values())
+        assert {event.replay_of for event in events.values()} == {None, "evt_auth_1"}
+        assert [payment.status for payment in db.query(Payment)] == ["succeeded", "succeeded"]
+        db.close()
+        assert len(fake.created) == 2
+
+def test_events_for_a_card_are_handled_in_order_and_retried(database):
+    sessions = database.sessions
+    inbox = WebhookInbox(workers=2, max_attempts=3, retry_seconds=0.05, session_factory=sessions)
+    handled = []
+    failures = {"evt_a1": 1, "evt_c1": 99}
+    lock = threading.Lock()
+
+    def handler(db, event):
+        with lock:
+            if failures.get(event.id, 0) > 0:
+                failures[event.id] -= 1
+                raise RuntimeError(f"{event.id} failed")
+            handled.append(event.id)
+
+    inbox.register("test.event", handler)
+    events = [("evt_a1", "ic_a"), ("evt_a2", "ic_a"), ("evt_b1", "ic_b"), ("evt_c1", "ic_c"), ("evt_a3", "ic_a")]
+    db = sessions()
+    for event_id, card_id in events:
+        event = {"id": event_id, "object": "event", "type": "test.event",
+                 "data": {"object": {"object": "issuing.authorization", "card": card_id}}}
+        assert inbox.store(db, event, json.dumps(event).encode())
+    db.commit()
+    db.close()
+    for event_id, card_id in events:
+        inbox.enqueue(event_id, card_id)
+    assert inbox.wait_idle(5)
+    inbox.shutdown()
+
+    # Card B did not wait for card A's retry, and card A kept its order
+    assert handled.index("evt_b1") < handled.index("evt_a1")
+    assert [event_id for event_id in handled if event_id.startswith("evt_a")] == ["evt_a1", "evt_a2", "evt_a3"]
+    db = sessions()
+    events = {event.id: event for event in db.query(WebhookEvent)}
+    assert events["evt_a1"].status == "processed" and events["evt_a1"].attempts == 2
+    assert events["evt_c1"].status == "failed" and events["evt_c1"].attempts == 3
+    assert events["evt_c1"].error == "evt_c1 failed"
+    db.close()